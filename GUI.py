@@ -5,6 +5,7 @@ from pathlib import Path
 import tomlkit
 from flask import (
     Flask,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -13,6 +14,7 @@ from flask import (
 )
 
 import utils.gui_utils as gui
+from utils.videos import done_videos
 
 # Set the hostname
 HOST = "localhost"
@@ -85,10 +87,10 @@ def settings():
     return render_template("settings.html", file="config.toml", data=config, checks=checks)
 
 
-# Make videos.json accessible
+# Serve the history of done videos in the format of the old videos.json
 @app.route("/videos.json")
 def videos_json():
-    return send_from_directory("video_creation/data", "videos.json")
+    return jsonify(done_videos())
 
 
 # Make backgrounds.json accessible
@@ -1,16 +1,17 @@
 import random
 
-from gtts import gTTS
-
 from utils import settings
 
 
 class GTTS:
     def __init__(self):
         self.max_chars = 5000
+        self.max_concurrency = 4
         self.voices = []
 
-    def run(self, text, filepath):
+    def run(self, text, filepath, random_voice: bool = False):
+        from gtts import gTTS
+
         tts = gTTS(
             text=text,
             lang=settings.config["reddit"]["thread"]["post_lang"] or "en",
@@ -1,12 +1,9 @@
 # documentation for tiktok api: https://github.com/oscie57/tiktok-voice/wiki
 import base64
 import random
-import time
 from typing import Final, Optional
 
-import requests
-
-from utils import settings
+from utils import settings, transport
 
 __all__ = ["TikTok", "TikTokTTSException"]
 
@@ -88,10 +85,10 @@ class TikTok:
 
         self.URI_BASE = "https://api16-normal-c-useast1a.tiktokv.com/media/api/text/speech/invoke/"
         self.max_chars = 200
+        self.max_concurrency = 4
 
-        self._session = requests.Session()
-        # set the headers to the session, so we don't have to do it for every request
-        self._session.headers = headers
+        # sent with every request, the session is shared with the other providers
+        self.headers = headers
 
     def run(self, text: str, filepath: str, random_voice: bool = False):
         if random_voice:
@@ -133,12 +130,8 @@ class TikTok:
         if voice is not None:
             params["text_speaker"] = voice
 
-        # send request
-        try:
-            response = self._session.post(self.URI_BASE, params=params)
-        except ConnectionError:
-            time.sleep(random.randrange(1, 7))
-            response = self._session.post(self.URI_BASE, params=params)
+        # send request, connection errors are retried by the transport
+        response = transport.request("POST", self.URI_BASE, params=params, headers=self.headers)
 
         return response.json()
 
@@ -1,10 +1,8 @@
 import random
-import sys
-
-from boto3 import Session
-from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
+import threading
 
 from utils import settings
+from utils.audio_metadata import save_stream
 
 voices = [
     "Brian",
@@ -25,15 +23,40 @@ voices = [
 ]
 
 
+# boto3 clients are thread safe and keep their connections alive, so one is shared by every clip
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(max_connections: int):
+    global _client
+    with _client_lock:
+        if _client is None:
+            from boto3 import Session
+            from botocore.config import Config
+
+            _client = Session(profile_name="polly").client(
+                "polly",
+                config=Config(
+                    max_pool_connections=max_connections,
+                    retries={"max_attempts": 4, "mode": "standard"},  # jittered backoff
+                ),
+            )
+        return _client
+
+
 class AWSPolly:
     def __init__(self):
         self.max_chars = 3000
+        self.max_concurrency = 8
         self.voices = voices
 
     def run(self, text, filepath, random_voice: bool = False):
+        # boto3 takes a while to import, so only do it when Polly is used
+        from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
+
         try:
-            session = Session(profile_name="polly")
-            polly = session.client("polly")
+            polly = get_client(self.max_concurrency)
             if random_voice:
                 voice = self.randomvoice()
             else:
@@ -48,21 +71,17 @@ class AWSPolly:
                     Text=text, OutputFormat="mp3", VoiceId=voice, Engine="neural"
                 )
             except (BotoCoreError, ClientError) as error:
-                # The service returned an error, exit gracefully
+                # The service returned an error, a fallback provider can take over
                 print(error)
-                sys.exit(-1)
+                raise
 
-            # Access the audio stream from the response
+            # Write the audio stream to the file as it arrives
             if "AudioStream" in response:
-                file = open(filepath, "wb")
-                file.write(response["AudioStream"].read())
-                file.close()
-                # print_substep(f"Saved Text {idx} to MP3 files successfully.", style="bold green")
+                return save_stream(response["AudioStream"].iter_chunks(64 * 1024), filepath)
 
             else:
-                # The response didn't contain audio data, exit gracefully
-                print("Could not stream audio")
-                sys.exit(-1)
+                # The response didn't contain audio data
+                raise RuntimeError("AWS Polly could not stream audio")
         except ProfileNotFound:
             print("You need to install the AWS CLI and configure your profile")
             print(
@@ -71,7 +90,7 @@ class AWSPolly:
             Windows: https://docs.aws.amazon.com/polly/latest/dg/install-voice-plugin2.html
             """
             )
-            sys.exit(-1)
+            raise
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils import settings
+
+
+class TTSCache:
+    """Stores synthesized audio on disk so the same text is never sent to a provider twice.
+
+    Entries are keyed by the provider, the voice settings, the language and the normalized text.
+    Every entry is an mp3 with a json sidecar holding its duration. When the cache grows past its
+    quota, the least recently used entries are deleted; using an entry updates its mtime.
+
+    Args:
+        provider      : Name of the TTS provider, part of the key.
+        directory     : Where the entries are stored.
+        quota_mb      : Disk space the cache may use, 0 disables the cache.
+    """
+
+    def __init__(self, provider: str, directory: str, quota_mb: float):
+        self.provider = provider
+        self.directory = Path(directory)
+        self.quota = int(quota_mb * 1024 * 1024)
+        self.size = None  # bytes used, counted on the first store
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, provider: str) -> Optional["TTSCache"]:
+        """Returns the cache configured in settings.tts, None if it's disabled."""
+        tts_settings = settings.config["settings"]["tts"]
+        quota_mb = tts_settings.get("cache_size_mb", 0)
+        if not quota_mb or not tts_settings.get("cache_dir"):
+            return None
+        return cls(provider, tts_settings["cache_dir"], quota_mb)
+
+    def key(self, text: str) -> str:
+        tts_settings = settings.config["settings"]["tts"]
+        voice = {name: value for name, value in tts_settings.items() if "voice" in name}
+        dumped = json.dumps(
+            {
+                "provider": self.provider,
+                "voice": voice,
+                "language": settings.config["reddit"]["thread"]["post_lang"],
+                "text": " ".join(text.split()),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+    def entry(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, text: str, filepath: str) -> Optional[float]:
+        """Copies the cached audio of the text to filepath.
+
+        Returns:
+            Optional[float]: The duration of the audio, None if the text isn't cached
+        """
+        entry = self.entry(self.key(text))
+        try:
+            with open(f"{entry}.json", "r", encoding="utf-8") as f:
+                duration = json.load(f)["duration"]
+            shutil.copyfile(f"{entry}.mp3", filepath)
+            os.utime(f"{entry}.mp3")  # marks the entry as recently used
+        except (OSError, ValueError, KeyError):
+            return None
+        return duration
+
+    def put(self, text: str, filepath: str, duration: float) -> None:
+        """Stores the audio of the text, then evicts the least recently used entries if the cache is over quota."""
+        entry = self.entry(self.key(text))
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # the audio is in place before the sidecar, an entry is only used once both exist
+        # unique to the process and thread, so writers of the same entry don't share a file
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}"
+        shutil.copyfile(filepath, f"{tmp}.mp3.tmp")
+        os.replace(f"{tmp}.mp3.tmp", f"{entry}.mp3")
+        with open(f"{tmp}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"duration": duration, "provider": self.provider, "time": time.time()}, f)
+        os.replace(f"{tmp}.json.tmp", f"{entry}.json")
+
+        with self._lock:
+            if self.size is None:
+                self.size = sum(path.stat().st_size for path in self.directory.glob("*/*.mp3"))
+            else:
+                self.size += os.path.getsize(f"{entry}.mp3")
+            if self.size > self.quota:
+                self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache uses 90% of its quota."""
+        entries = []
+        for path in self.directory.glob("*/*.mp3"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.size <= self.quota * 0.9:
+                break
+            for file in (path.with_suffix(".json"), path):
+                try:
+                    file.unlink()
+                except FileNotFoundError:
+                    pass
+            self.size -= size
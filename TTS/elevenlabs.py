@@ -1,28 +1,38 @@
 import random
-
-from elevenlabs import save
-from elevenlabs.client import ElevenLabs
+import threading
 
 from utils import settings
+from utils.audio_metadata import save_stream
 
 
 class elevenlabs:
     def __init__(self):
         self.max_chars = 2500
-        self.client: ElevenLabs = None
+        self.max_concurrency = 3
+        self.client = None
+        self._client_lock = threading.Lock()  # clips are synthesized on several threads
 
     def run(self, text, filepath, random_voice: bool = False):
-        if self.client is None:
-            self.initialize()
+        self.initialize()
         if random_voice:
             voice = self.randomvoice()
         else:
             voice = str(settings.config["settings"]["tts"]["elevenlabs_voice_name"]).capitalize()
 
-        audio = self.client.generate(text=text, voice=voice, model="eleven_multilingual_v1")
-        save(audio=audio, filename=filepath)
+        audio = self.client.generate(
+            text=text, voice=voice, model="eleven_multilingual_v1", stream=True
+        )
+        return save_stream(audio, filepath)  # written as the chunks arrive
 
     def initialize(self):
+        # one client per provider, it keeps its connections alive between clips
+        with self._client_lock:
+            if self.client is None:
+                self.client = self.create_client()
+
+    def create_client(self):
+        from elevenlabs.client import ElevenLabs
+
         if settings.config["settings"]["tts"]["elevenlabs_api_key"]:
             api_key = settings.config["settings"]["tts"]["elevenlabs_api_key"]
         else:
@@ -30,9 +40,8 @@ class elevenlabs:
                 "You didn't set an Elevenlabs API key! Please set the config variable ELEVENLABS_API_KEY to a valid API key."
             )
 
-        self.client = ElevenLabs(api_key=api_key)
+        return ElevenLabs(api_key=api_key)
 
     def randomvoice(self):
-        if self.client is None:
-            self.initialize()
+        self.initialize()
         return random.choice(self.client.voices.get_all().voices).voice_name
@@ -1,17 +1,20 @@
+import contextvars
 import os
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
-from typing import Tuple
-
-import numpy as np
-import translators
-from moviepy.audio.AudioClip import AudioClip
-from moviepy.audio.fx.volumex import volumex
-from moviepy.editor import AudioFileClip
-from rich.progress import track
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from TTS.cache import TTSCache
+from TTS.planner import record_synthesis
+from TTS.router import ProviderRouter
 from utils import settings
-from utils.console import print_step, print_substep
+from utils.audio_metadata import get_duration, join_mp3
+from utils.console import print_step, print_substep, track
+from utils.tracing import span
 from utils.voice import sanitize_text
 
 DEFAULT_MAX_LENGTH: int = (
@@ -27,9 +30,12 @@ class TTSEngine:
         reddit_object         : The reddit object that contains the posts to read.
         path (Optional)       : The unix style path to save the mp3 files to. This must not have leading or trailing slashes.
         max_length (Optional) : The maximum length of the mp3 files in total.
+        fallbacks (Optional)  : TTS modules used, in order, when tts_module fails or is slow.
 
     Notes:
         tts_module must take the arguments text and filepath.
+        tts_module may set max_concurrency, the number of calls it can handle at the same time.
+        tts_module.run may return the duration of the audio it saved, e.g. counted while streaming it.
     """
 
     def __init__(
@@ -39,8 +45,13 @@ class TTSEngine:
         path: str = "assets/temp/",
         max_length: int = DEFAULT_MAX_LENGTH,
         last_clip_length: int = 0,
+        fallbacks: Sequence = (),
     ):
         self.tts_module = tts_module()
+        self.router = ProviderRouter(
+            [self.tts_module] + [fallback() for fallback in fallbacks],
+            settings.config["settings"]["tts"].get("hedge_percentile", 0),
+        )
         self.reddit_object = reddit_object
 
         self.redditid = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
@@ -48,23 +59,28 @@ class TTSEngine:
         self.max_length = max_length
         self.length = 0
         self.last_clip_length = last_clip_length
+        self.concurrency = max(
+            1,
+            min(
+                settings.config["settings"]["tts"].get("tts_concurrency", 1),
+                getattr(self.tts_module, "max_concurrency", 1),
+            ),
+        )
+        self.cache = TTSCache.from_config(type(self.tts_module).__name__)
+        self._silence_lock = threading.Lock()
+        # characters sent to the provider and seconds of audio it returned, to learn its speaking rate
+        self.synthesized_chars = 0
+        self.synthesized_seconds = 0.0
+        self._synthesized_lock = threading.Lock()
+        self._silence_created = False
+        # seconds of the clips that are done, in any order, to stop submitting comments in time
+        self.finished_length = 0.0
 
     def add_periods(
         self,
     ):  # adds periods to the end of paragraphs (where people often forget to put them) so tts doesn't blend sentences
         for comment in self.reddit_object["comments"]:
-            # remove links
-            regex_urls = r"((http|https)\:\/\/)?[a-zA-Z0-9\.\/\?\:@\-_=#]+\.([a-zA-Z]){2,6}([a-zA-Z0-9\.\&\/\?\:@\-_=#])*"
-            comment["comment_body"] = re.sub(regex_urls, " ", comment["comment_body"])
-            comment["comment_body"] = comment["comment_body"].replace("\n", ". ")
-            comment["comment_body"] = re.sub(r"\bAI\b", "A.I", comment["comment_body"])
-            comment["comment_body"] = re.sub(r"\bAGI\b", "A.G.I", comment["comment_body"])
-            if comment["comment_body"][-1] != ".":
-                comment["comment_body"] += "."
-            comment["comment_body"] = comment["comment_body"].replace(". . .", ".")
-            comment["comment_body"] = comment["comment_body"].replace(".. . ", ".")
-            comment["comment_body"] = comment["comment_body"].replace(". . ", ".")
-            comment["comment_body"] = re.sub(r'\."\.', '".', comment["comment_body"])
+            comment["comment_body"] = punctuate(comment["comment_body"])
 
     def run(self) -> Tuple[int, int]:
         Path(self.path).mkdir(parents=True, exist_ok=True)
@@ -78,60 +94,153 @@ class TTSEngine:
         if settings.config["settings"]["storymode"]:
             if settings.config["settings"]["storymodemethod"] == 0:
                 if len(self.reddit_object["thread_post"]) > self.tts_module.max_chars:
-                    self.split_post(self.reddit_object["thread_post"], "postaudio")
+                    self.add_clip(self.split_post(self.reddit_object["thread_post"], "postaudio"))
                 else:
                     self.call_tts("postaudio", process_text(self.reddit_object["thread_post"]))
             elif settings.config["settings"]["storymodemethod"] == 1:
-                for idx, text in track(enumerate(self.reddit_object["thread_post"])):
-                    self.call_tts(f"postaudio-{idx}", process_text(text))
+                paragraphs = self.reddit_object["thread_post"]
+                for idx, future in track(
+                    self.synthesize_ahead(self.synthesize_paragraph, paragraphs),
+                    total=len(paragraphs),
+                ):
+                    self.add_clip(future.result())
 
         else:
-            for idx, comment in track(enumerate(self.reddit_object["comments"]), "Saving..."):
-                # ! Stop creating mp3 files if the length is greater than max length.
-                if self.length > self.max_length and idx > 1:
-                    self.length -= self.last_clip_length
-                    idx -= 1
-                    break
-                if (
-                    len(comment["comment_body"]) > self.tts_module.max_chars
-                ):  # Split the comment if it is too long
-                    self.split_post(comment["comment_body"], idx)  # Split the comment
-                else:  # If the comment is not too long, just call the tts engine
-                    self.call_tts(f"{idx}", process_text(comment["comment_body"]))
+            comments = self.reddit_object["comments"]
+            idx = len(comments)
+            with closing(self.synthesize_comments(comments)) as clips:
+                for clip_idx, duration in track(clips, "Saving...", total=len(comments)):
+                    self.add_clip(duration)
+                    # ! Stop creating mp3 files if the length is greater than max length.
+                    # the clip that went past it is dropped too, even the last one
+                    if self.length > self.max_length and clip_idx > 0:
+                        self.length -= self.last_clip_length
+                        idx = clip_idx
+                        break
 
+        record_synthesis(
+            type(self.tts_module).__name__, self.synthesized_chars, self.synthesized_seconds
+        )
         print_substep("Saved Text to MP3 files successfully.", style="bold green")
         return self.length, idx
 
-    def split_post(self, text: str, idx):
-        split_files = []
-        split_text = [
-            x.group().strip()
-            for x in re.finditer(
-                r" *(((.|\n){0," + str(self.tts_module.max_chars) + "})(\.|.$))", text
+    def synthesize_comments(self, comments: List[dict]) -> Iterator[Tuple[int, Optional[float]]]:
+        """Yields (idx, duration) of every comment in order, `concurrency` of them synthesized at once.
+
+        No more comments are started once the finished ones fill max_length, they would be cut off.
+        """
+        if self.concurrency == 1:
+            for idx, comment in enumerate(comments):
+                yield idx, self.synthesize_comment(idx, comment)
+            return
+        self.finished_length = self.length
+        with closing(
+            self.synthesize_ahead(
+                self.synthesize_counted,
+                comments,
+                stop=lambda: self.finished_length > self.max_length,
             )
-        ]
-        self.create_silence_mp3()
+        ) as futures:
+            for idx, future in futures:
+                yield idx, future.result()
 
-        idy = None
-        for idy, text_cut in enumerate(split_text):
-            newtext = process_text(text_cut)
-            # print(f"{idx}-{idy}: {newtext}\n")
+    def synthesize_counted(self, idx: int, comment: dict) -> Optional[float]:
+        """synthesize_comment that adds the length to finished_length, in the order the clips finish."""
+        duration = self.synthesize_comment(idx, comment)
+        with self._synthesized_lock:
+            self.finished_length += duration or 0
+        return duration
+
+    def synthesize_ahead(
+        self, synthesize: Callable, items: Iterable, stop: Optional[Callable[[], bool]] = None
+    ):
+        """Synthesizes the items on a thread pool, yielding (idx, future) in order.
+
+        At most `concurrency` items are synthesized ahead of the one being consumed,
+        the ones that haven't started are cancelled when the consumer stops early.
+        No more items are submitted once `stop` returns True.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="tts") as executor:
+            pending = deque()
+            try:
+                for idx, item in enumerate(items):
+                    if stop is not None and stop():
+                        break
+                    # run in a copy of the current context, so the calls record to the active trace
+                    pending.append(
+                        (
+                            idx,
+                            executor.submit(contextvars.copy_context().run, synthesize, idx, item),
+                        )
+                    )
+                    if len(pending) >= self.concurrency:
+                        yield pending.popleft()
+                while pending:
+                    yield pending.popleft()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def synthesize_comment(self, idx: int, comment: dict) -> Optional[float]:
+        if len(comment["comment_body"]) > self.tts_module.max_chars:
+            return self.split_post(
+                comment["comment_body"], idx
+            )  # Split the comment if it is too long
+        # If the comment is not too long, just call the tts engine
+        return self.synthesize(f"{idx}", process_text(comment["comment_body"]))
+
+    def synthesize_paragraph(self, idx: int, text: str) -> Optional[float]:
+        return self.synthesize(f"postaudio-{idx}", process_text(text))
+
+    def split_post(self, text: str, idx) -> Optional[float]:
+        """Synthesizes a text that is too long for the provider in parts, and joins them to {idx}.mp3
 
+        Returns:
+            Optional[float]: The length of all the parts, None if one of them couldn't be read
+        """
+        texts = []
+        for text_cut in chunk_text(text, self.tts_module.max_chars):
+            newtext = process_text(text_cut)
             if not newtext or newtext.isspace():
                 print("newtext was blank because sanitized split text resulted in none")
                 continue
-            else:
-                self.call_tts(f"{idx}-{idy}.part", newtext)
-                with open(f"{self.path}/list.txt", "w") as f:
-                    for idz in range(0, len(split_text)):
-                        f.write("file " + f"'{idx}-{idz}.part.mp3'" + "\n")
-                    split_files.append(str(f"{self.path}/{idx}-{idy}.part.mp3"))
-                    f.write("file " + f"'silence.mp3'" + "\n")
+            texts.append(newtext)
+
+        # the parts are synthesized at the same time, within the limit of the provider
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="tts-part"
+        ) as executor:
+            durations = list(
+                executor.map(
+                    lambda part: contextvars.copy_context().run(
+                        self.synthesize, f"{idx}-{part[0]}.part", part[1]
+                    ),
+                    enumerate(texts),
+                )
+            )
+        split_files = [f"{self.path}/{idx}-{idy}.part.mp3" for idy in range(len(texts))]
+        length = None if None in durations else sum(durations)
 
+        # all parts are joined once, followed by silent frames in the format of the parts
+        try:
+            with span("join mp3", "tts", file=f"{idx}.mp3", parts=len(split_files)):
+                join_mp3(
+                    split_files,
+                    f"{self.path}/{idx}.mp3",
+                    silence=settings.config["settings"]["tts"]["silence_duration"],
+                )
+        except (OSError, ValueError):  # not MP3s of the same format, leave it to ffmpeg
+            self.create_silence_mp3()
+            # one list per comment, comments can be split at the same time
+            with open(f"{self.path}/list-{idx}.txt", "w") as f:
+                for split_file in split_files:
+                    f.write("file " + f"'{os.path.basename(split_file)}'" + "\n")
+                f.write("file " + f"'silence.mp3'" + "\n")
+            with span("ffmpeg concat", "subprocess", file=f"{idx}.mp3"):
                 os.system(
                     "ffmpeg -f concat -y -hide_banner -loglevel panic -safe 0 "
                     + "-i "
-                    + f"{self.path}/list.txt "
+                    + f"{self.path}/list-{idx}.txt "
                     + "-c copy "
                     + f"{self.path}/{idx}.mp3"
                 )
@@ -142,34 +251,149 @@ class TTSEngine:
             print("File not found: " + e.filename)
         except OSError:
             print("OSError")
+        return length
 
     def call_tts(self, filename: str, text: str):
-        self.tts_module.run(
-            text,
-            filepath=f"{self.path}/{filename}.mp3",
-            random_voice=settings.config["settings"]["tts"]["random_voice"],
-        )
-        # try:
-        #     self.length += MP3(f"{self.path}/{filename}.mp3").info.length
-        # except (MutagenError, HeaderNotFoundError):
-        #     self.length += sox.file_info.duration(f"{self.path}/{filename}.mp3")
+        self.add_clip(self.synthesize(filename, text))
+
+    def synthesize(self, filename: str, text: str) -> Optional[float]:
+        """Saves the text to {filename}.mp3, safe to call from several threads.
+
+        Texts that were synthesized before are copied from the TTS cache instead.
+
+        Returns:
+            Optional[float]: The length of the saved audio, None if it couldn't be read
+        """
+        if self.cache:
+            with span("tts cache", "tts", file=f"{filename}.mp3"):
+                duration = self.cache.get(text, f"{self.path}/{filename}.mp3")
+            if duration is not None:
+                return duration
+        with span("call_tts", "tts", file=f"{filename}.mp3", characters=len(text)):
+            duration, provider = self.router.run(
+                text,
+                filepath=f"{self.path}/{filename}.mp3",
+                random_voice=settings.config["settings"]["tts"]["random_voice"],
+            )
+        if not isinstance(duration, float):  # the provider didn't time the audio while saving it
+            try:
+                duration = get_duration(f"{self.path}/{filename}.mp3")
+            except ValueError:  # not an MP3 or WAV, e.g. the AIFF pyttsx writes on macOS
+                duration = self.read_duration_with_ffmpeg(filename)
+            except OSError:
+                return None
+        if duration is None:
+            return None
+        if provider is not self.tts_module:  # a fallback, with a voice of its own
+            return duration
+        with self._synthesized_lock:
+            self.synthesized_chars += len(text)
+            self.synthesized_seconds += duration
+        if self.cache:
+            self.cache.put(text, f"{self.path}/{filename}.mp3", duration)
+        return duration
+
+    def read_duration_with_ffmpeg(self, filename: str) -> Optional[float]:
+        from moviepy.editor import AudioFileClip
+
         try:
-            clip = AudioFileClip(f"{self.path}/{filename}.mp3")
-            self.last_clip_length = clip.duration
-            self.length += clip.duration
+            with span("AudioFileClip", "subprocess", file=f"{filename}.mp3"):
+                clip = AudioFileClip(f"{self.path}/{filename}.mp3")
+            duration = clip.duration
             clip.close()
+            return duration
         except:
+            return None
+
+    def add_clip(self, duration: Optional[float]) -> None:
+        """Adds the length of a synthesized clip to the total, in the order the clips are played."""
+        if duration is None:
             self.length = 0
+            return
+        self.last_clip_length = duration
+        self.length += duration
 
     def create_silence_mp3(self):
+        with self._silence_lock:  # written once, even when several comments are split at once
+            if self._silence_created:
+                return
+            self.write_silence_mp3()
+            self._silence_created = True
+
+    def write_silence_mp3(self):
         silence_duration = settings.config["settings"]["tts"]["silence_duration"]
-        silence = AudioClip(
-            make_frame=lambda t: np.sin(440 * 2 * np.pi * t),
-            duration=silence_duration,
-            fps=44100,
-        )
-        silence = volumex(silence, 0)
-        silence.write_audiofile(f"{self.path}/silence.mp3", fps=44100, verbose=False, logger=None)
+        with span("write silence.mp3", "subprocess"):
+            os.system(
+                "ffmpeg -f lavfi -y -hide_banner -loglevel panic "
+                + "-i anullsrc=r=44100:cl=stereo "
+                + f"-t {silence_duration} "
+                + f"{self.path}/silence.mp3"
+            )
+
+
+def punctuate(text: str) -> str:
+    """Returns the text of a comment the way it's read: without links, with periods after paragraphs.
+
+    Args:
+        text (str): The body of a comment
+
+    Returns:
+        str: The text that is synthesized
+    """
+    # remove links
+    regex_urls = r"((http|https)\:\/\/)?[a-zA-Z0-9\.\/\?\:@\-_=#]+\.([a-zA-Z]){2,6}([a-zA-Z0-9\.\&\/\?\:@\-_=#])*"
+    text = re.sub(regex_urls, " ", text)
+    text = text.replace("\n", ". ")
+    text = re.sub(r"\bAI\b", "A.I", text)
+    text = re.sub(r"\bAGI\b", "A.G.I", text)
+    if text[-1] != ".":
+        text += "."
+    text = text.replace(". . .", ".")
+    text = text.replace(".. . ", ".")
+    text = text.replace(". . ", ".")
+    text = re.sub(r'\."\.', '".', text)
+    return text
+
+
+# a sentence ends at . ! or ? followed by a space, or at a line break; "3.5" and "e.g.x" stay whole
+SENTENCE = re.compile(r"(?:[^.!?\n]|[.!?]+(?=[^\s.!?]))*(?:[.!?]+[\"')\]]*|\n|$)")
+CLAUSE = re.compile(r"[^,;:]*(?:[,;:]|$)")
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Splits a text into as few parts of at most max_chars characters as possible.
+
+    Whole sentences are packed into a part while they fit. Longer sentences are split after
+    commas, semicolons and colons, then between words, and words that are still too long are cut.
+    Runs in linear time.
+    """
+    pieces = []
+    for sentence in SENTENCE.findall(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in CLAUSE.findall(sentence):
+            clause = clause.strip()
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+                continue
+            for word in clause.split():
+                pieces.extend(word[i : i + max_chars] for i in range(0, len(word), max_chars))
+
+    parts = []
+    current = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        if current and len(current) + 1 + len(piece) > max_chars:
+            parts.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        parts.append(current)
+    return parts
 
 
 def process_text(text: str, clean: bool = True):
@@ -177,6 +401,8 @@ def process_text(text: str, clean: bool = True):
     new_text = sanitize_text(text) if clean else text
     if lang:
         print_substep("Translating Text...")
+        import translators  # slow to import, only needed when translating
+
         translated_text = translators.translate_text(text, translator="google", to_language=lang)
         new_text = sanitize_text(translated_text)
     return new_text
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from typing import Callable, List
+
+from utils import settings
+
+RATES_FILE = "./video_creation/data/tts_rates.json"
+DEFAULT_CHARS_PER_SECOND = 14.0  # about 150 words per minute
+# past this many characters, older samples count for half, so the rate follows changes of the voice
+MAX_SAMPLE_CHARS = 100_000
+
+_rates_lock = threading.Lock()
+
+
+def rate_key(provider: str) -> str:
+    return f"{provider}/{settings.config['reddit']['thread']['post_lang'] or 'en'}"
+
+
+def load_rates() -> dict:
+    try:
+        with open(RATES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def chars_per_second(provider: str) -> float:
+    """Returns how many characters per second the provider speaks, learned from earlier videos."""
+    rate = load_rates().get(rate_key(provider))
+    if not rate or not rate["seconds"]:
+        return DEFAULT_CHARS_PER_SECOND
+    return rate["chars"] / rate["seconds"]
+
+
+def record_synthesis(provider: str, chars: int, seconds: float) -> None:
+    """Adds the characters synthesized by a provider, and the seconds of audio they made, to the learned rates."""
+    if not chars or not seconds:
+        return
+    with _rates_lock:
+        rates = load_rates()
+        rate = rates.setdefault(rate_key(provider), {"chars": 0, "seconds": 0.0})
+        rate["chars"] += chars
+        rate["seconds"] += seconds
+        if rate["chars"] > MAX_SAMPLE_CHARS:
+            rate["chars"] //= 2
+            rate["seconds"] /= 2
+        with open(f"{RATES_FILE}.tmp", "w", encoding="utf-8") as f:
+            json.dump(rates, f, indent=4)
+        os.replace(f"{RATES_FILE}.tmp", RATES_FILE)
+
+
+def plan_comments(
+    comments: List[dict], budget: float, estimate: Callable[[str], float]
+) -> List[int]:
+    """Picks the comments that fill a video of `budget` seconds the best.
+
+    Comments are taken in the order Reddit ranked them. A comment that would not fit the
+    remaining time is skipped, so a later, shorter one can still fill it. The first comment is
+    always taken, so a video is never empty.
+
+    Args:
+        comments (List[dict]): The comments of the thread
+        budget (float): Seconds of speech the comments may fill
+        estimate (Callable[[str], float]): Returns the estimated seconds of speech of a text
+
+    Returns:
+        List[int]: Indexes of the picked comments, in order
+    """
+    picked = []
+    remaining = budget
+    for idx, comment in enumerate(comments):
+        duration = estimate(comment["comment_body"])
+        if duration <= remaining or not picked:
+            picked.append(idx)
+            remaining -= duration
+        if remaining <= 0:
+            break
+    return picked
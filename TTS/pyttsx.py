@@ -1,13 +1,25 @@
+import atexit
+import json
+import os
 import random
-
-import pyttsx3
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from queue import Empty, Queue
+from typing import List, Tuple
 
 from utils import settings
 
+# seconds the speech engine gets per clip of a batch before it's considered hung and restarted
+CLIP_TIMEOUT = 30
+
 
 class pyttsx:
     def __init__(self):
         self.max_chars = 5000
+        # clips synthesized at the same time are saved in one batch by the speech worker
+        self.max_concurrency = 8
         self.voices = []
 
     def run(
@@ -25,18 +37,139 @@ class pyttsx:
         else:
             voice_id = int(voice_id)
             voice_num = int(voice_num)
-        for i in range(voice_num):
-            self.voices.append(i)
-            i = +1
+        self.voices = list(range(voice_num))
         if random_voice:
             voice_id = self.randomvoice()
-        engine = pyttsx3.init()
-        voices = engine.getProperty("voices")
-        engine.setProperty(
-            "voice", voices[voice_id].id
-        )  # changing index changes voices but ony 0 and 1 are working here
-        engine.save_to_file(text, f"{filepath}")
-        engine.runAndWait()
+        get_worker().synthesize(text, filepath, voice_id)
 
     def randomvoice(self):
         return random.choice(self.voices)
+
+
+class SpeechWorker:
+    """A process that keeps one pyttsx3 engine running and saves batches of clips with it.
+
+    Starting the engine and listing the voices happens once instead of once per clip. Clips
+    requested from several threads while a batch is running are saved together in the next one.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.replies = None
+        self._process_lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flushing = False
+
+    def start(self) -> None:
+        # a module run instead of multiprocessing, which would import main.py again in the child
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "TTS.pyttsx"],
+            cwd=Path(__file__).resolve().parent.parent,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+        # read on a thread of its own, so a hung engine can be waited for with a timeout
+        self.replies = Queue()
+        threading.Thread(
+            target=read_lines, args=(self.process.stdout, self.replies), daemon=True
+        ).start()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+    def run_batch(self, jobs: List[Tuple[str, str, int]]) -> None:
+        with self._process_lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            jobs = [(text, os.path.abspath(filepath), voice_id) for text, filepath, voice_id in jobs]
+            self.process.stdin.write(json.dumps(jobs) + "\n")
+            self.process.stdin.flush()
+            try:
+                reply = self.replies.get(timeout=CLIP_TIMEOUT * len(jobs))
+            except Empty:
+                self.kill()  # the next batch starts a new one
+                raise RuntimeError(f"pyttsx3 didn't save {len(jobs)} clips in time")
+        if not reply:
+            raise RuntimeError("The pyttsx3 worker stopped, check the python_voice setting")
+        error = json.loads(reply)["error"]
+        if error:
+            raise RuntimeError(f"pyttsx3 failed: {error}")
+
+    def synthesize(self, text: str, filepath: str, voice_id: int) -> None:
+        """Saves one clip, batched with the clips other threads are waiting for."""
+        job = {"job": (text, filepath, voice_id), "done": threading.Event(), "error": None}
+        with self._pending_lock:
+            self._pending.append(job)
+            lead = not self._flushing
+            self._flushing = True
+        if lead:  # this thread saves batches until nothing is waiting any more
+            while True:
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                    if not batch:
+                        self._flushing = False
+                        break
+                try:
+                    self.run_batch([pending["job"] for pending in batch])
+                except Exception as error:
+                    for pending in batch:
+                        pending["error"] = error
+                for pending in batch:
+                    pending["done"].set()
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+
+    def close(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+def read_lines(stream, lines: Queue) -> None:
+    """Puts every line of the stream in the queue, and an empty one once it ends."""
+    for line in stream:
+        lines.put(line)
+    lines.put("")
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> SpeechWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = SpeechWorker()
+            atexit.register(_worker.close)
+        return _worker
+
+
+def serve() -> None:
+    """Runs in the worker process: reads batches of clips from stdin, answers on stdout when they are saved."""
+    import pyttsx3
+
+    replies = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)  # whatever the speech engine prints goes to stderr, not into the replies
+    engine = pyttsx3.init()
+    voices = engine.getProperty("voices")
+    for line in sys.stdin:
+        try:
+            for text, filepath, voice_id in json.loads(line):
+                # changing index changes voices but ony 0 and 1 are working here
+                engine.setProperty("voice", voices[voice_id].id)
+                engine.save_to_file(text, filepath)
+            engine.runAndWait()
+            error = None
+        except Exception as e:
+            error = repr(e)
+        print(json.dumps({"error": error}), file=replies, flush=True)
+
+
+if __name__ == "__main__":
+    serve()
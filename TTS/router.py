@@ -0,0 +1,238 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional, Tuple
+
+from utils.console import print_substep
+from utils.tracing import span
+
+# calls in the last FAILURE_WINDOW seconds decide whether a provider is failing,
+# so one that was failing gets another chance later on
+FAILURE_WINDOW = 300
+FAILURES_TO_FAIL_OVER = 3
+# responses a provider needs to have given before its slow ones are hedged
+MIN_LATENCY_SAMPLES = 20
+LATENCY_SAMPLES = 200
+
+# the calls of every router, a hedged call needs a thread of its own next to the slow one
+_calls = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tts-call")
+
+# limits the calls made to each TTS provider at once, shared by every TTSEngine of the process
+_provider_slots = {}
+_provider_slots_lock = threading.Lock()
+
+
+def provider_slots(tts_module) -> threading.BoundedSemaphore:
+    """Returns the semaphore limiting the concurrent calls to the provider of tts_module.
+
+    The limit is the max_concurrency attribute of the provider, 1 if it doesn't have one.
+    """
+    with _provider_slots_lock:
+        if type(tts_module) not in _provider_slots:
+            _provider_slots[type(tts_module)] = threading.BoundedSemaphore(
+                getattr(tts_module, "max_concurrency", 1)
+            )
+        return _provider_slots[type(tts_module)]
+
+
+class ProviderStats:
+    """The recent response times and failures of a TTS provider."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = deque()
+        self._lock = threading.Lock()
+
+    def succeeded(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def failed(self) -> None:
+        with self._lock:
+            self.failures.append(time.monotonic())
+
+    def failing(self) -> bool:
+        """Whether the provider failed too often lately to start new videos with it."""
+        with self._lock:
+            while self.failures and self.failures[0] < time.monotonic() - FAILURE_WINDOW:
+                self.failures.popleft()
+            return len(self.failures) >= FAILURES_TO_FAIL_OVER
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Returns the response time `percentile` percent of the calls were faster than, None without enough samples."""
+        with self._lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+
+# shared by every router of the process, like the provider semaphores
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def provider_stats(tts_module) -> ProviderStats:
+    with _stats_lock:
+        return _stats.setdefault(type(tts_module), ProviderStats())
+
+
+class ProviderRouter:
+    """Sends the clips of one video to its TTS provider, and to the fallbacks when it's failing or slow.
+
+    A video sticks to one provider as long as it can, so it's read in the same voice: it starts
+    with the first provider that isn't failing, and moves on to the next one for the rest of the
+    video once that one fails repeatedly. A clip that fails is retried with the next provider
+    right away. A clip that takes longer than `hedge_percentile` of the recent calls of its
+    provider, counted from when it got a slot of the provider, is also sent to the next one,
+    the first of them to answer is used.
+
+    Args:
+        providers (List): Instances of the TTS providers, the chosen one first, then the fallbacks
+        hedge_percentile (float): Percentile of the response times after which a clip is hedged, 0 to never hedge
+    """
+
+    def __init__(self, providers: List, hedge_percentile: float = 0):
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.active = next(
+            (
+                idx
+                for idx, provider in enumerate(providers)
+                if not provider_stats(provider).failing()
+            ),
+            0,
+        )
+        self._active_lock = threading.Lock()
+        if self.active:
+            self.announce(providers[0])
+
+    def announce(self, failing) -> None:
+        print_substep(
+            f"{type(failing).__name__} is failing, the rest of the video is read by "
+            f"{type(self.providers[self.active]).__name__}.",
+            style="bold yellow",
+        )
+
+    def candidates(self, text: str) -> List:
+        """Returns the providers that can say the text, in the order they are tried."""
+        fitting = [
+            provider
+            for provider in self.providers
+            if len(text) <= getattr(provider, "max_chars", len(text))
+        ]
+        active = self.providers[self.active :]
+        # a text split for the chosen provider can be too long for the fallbacks
+        return [provider for provider in fitting if provider in active] or fitting or active[:1]
+
+    def call(
+        self,
+        provider,
+        text: str,
+        filepath: str,
+        random_voice: bool,
+        started: Optional[threading.Event] = None,
+    ) -> Optional[float]:
+        """Calls one provider within its limit of concurrent calls and records how it went.
+
+        `started` is set once the call got a slot of its provider, after waiting for one.
+        """
+        stats = provider_stats(provider)
+        with provider_slots(provider):
+            if started is not None:
+                started.set()
+            begin = time.monotonic()
+            try:
+                with span(type(provider).__name__, "tts", file=os.path.basename(filepath)):
+                    duration = provider.run(text, filepath=filepath, random_voice=random_voice)
+                if not os.path.exists(filepath):
+                    raise RuntimeError(f"{type(provider).__name__} didn't save any audio")
+            except Exception:
+                stats.failed()
+                raise
+        stats.succeeded(time.monotonic() - begin)
+        return duration
+
+    def fail_over(self, provider) -> None:
+        """Moves the rest of the video to the next provider when `provider` keeps failing."""
+        with self._active_lock:
+            idx = self.providers.index(provider)
+            if (
+                idx == self.active
+                and idx + 1 < len(self.providers)
+                and provider_stats(provider).failing()
+            ):
+                self.active += 1
+                self.announce(provider)
+
+    def run(
+        self, text: str, filepath: str, random_voice: bool = False
+    ) -> Tuple[Optional[float], object]:
+        """Saves the text to filepath with the first provider that manages to.
+
+        Returns:
+            Tuple[Optional[float], object]: The duration the provider returned, and the provider that saved the audio
+
+        Raises:
+            Exception: What the last provider raised, when none of them could save the audio
+        """
+        candidates = self.candidates(text)
+        if len(candidates) == 1:  # nothing to hedge or fail over to
+            return self.call(candidates[0], text, filepath, random_voice), candidates[0]
+
+        # every call saves to a file of its own, the one that's used is moved to filepath
+        def start(provider):
+            partial = f"{filepath[:-4]}.{type(provider).__name__}{filepath[-4:]}"
+            started = threading.Event()
+            future = _calls.submit(
+                contextvars.copy_context().run,
+                self.call,
+                provider,
+                text,
+                partial,
+                random_voice,
+                started,
+            )
+            running[future] = (provider, partial, started)
+
+        running = {}
+        waiting = list(candidates)
+        error = None
+        start(waiting.pop(0))
+        while running:
+            timeout = None
+            if waiting and self.hedge_percentile and len(running) == 1:
+                provider, _, started = next(iter(running.values()))
+                # a call waiting for a slot of its provider isn't slow, it's timed from the slot on
+                started.wait()
+                timeout = provider_stats(provider).latency_percentile(self.hedge_percentile)
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:  # slower than usual, ask the next provider as well
+                with span("hedge", "tts", file=os.path.basename(filepath)):
+                    start(waiting.pop(0))
+                continue
+            for future in done:
+                provider, partial, _ = running.pop(future)
+                try:
+                    duration = future.result()
+                except Exception as e:
+                    error = e
+                    self.fail_over(provider)
+                    if not running and waiting:
+                        start(waiting.pop(0))
+                    continue
+                os.replace(partial, filepath)
+                for loser, (_, loser_partial, _) in running.items():
+                    loser.add_done_callback(lambda _, path=loser_partial: remove(path))
+                return duration, provider
+        raise error
+
+
+def remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
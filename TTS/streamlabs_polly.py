@@ -1,10 +1,9 @@
 import random
 
-import requests
 from requests.exceptions import JSONDecodeError
 
-from utils import settings
-from utils.voice import check_ratelimit
+from utils import settings, transport
+from utils.audio_metadata import save_stream
 
 voices = [
     "Brian",
@@ -32,6 +31,7 @@ class StreamlabsPolly:
     def __init__(self):
         self.url = "https://streamlabs.com/polly/speak"
         self.max_chars = 550
+        self.max_concurrency = 2
         self.voices = voices
 
     def run(self, text, filepath, random_voice: bool = False):
@@ -46,22 +46,26 @@ class StreamlabsPolly:
 
         body = {"voice": voice, "text": text, "service": "polly"}
         headers = {"Referer": "https://streamlabs.com/"}
-        response = requests.post(self.url, headers=headers, data=body)
-
-        if not check_ratelimit(response):
-            self.run(text, filepath, random_voice)
-
-        else:
+        # rate limits are waited out by the transport
+        response = transport.request("POST", self.url, headers=headers, data=body)
+        try:
+            speak_url = response.json()["speak_url"]
+        except (KeyError, JSONDecodeError):
             try:
-                voice_data = requests.get(response.json()["speak_url"])
-                with open(filepath, "wb") as f:
-                    f.write(voice_data.content)
+                error = response.json()["error"]
             except (KeyError, JSONDecodeError):
-                try:
-                    if response.json()["error"] == "No text specified!":
-                        raise ValueError("Please specify a text to convert to speech.")
-                except (KeyError, JSONDecodeError):
-                    print("Error occurred calling Streamlabs Polly")
+                error = f"HTTP {response.status_code}"
+            if error == "No text specified!":
+                raise ValueError("Please specify a text to convert to speech.")
+            raise RuntimeError(f"Streamlabs Polly failed: {error}")
+
+        # closed on errors too, a streamed response holds its connection until then
+        with transport.request("GET", speak_url, stream=True) as voice_data:
+            if voice_data.status_code != 200:
+                raise RuntimeError(
+                    f"Streamlabs Polly didn't send the audio: HTTP {voice_data.status_code}"
+                )
+            return save_stream(voice_data.iter_content(64 * 1024), filepath)
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""Measures how long it takes to start main.py and GUI.py, and which imports that time goes to.
+
+Every measurement runs in a fresh interpreter with the network disabled. The version check and
+the ffmpeg install check are replaced by no-ops, so the numbers only depend on this machine.
+
+    python benchmarks/startup.py                   # compare against benchmarks/startup_baseline.json
+    python benchmarks/startup.py --save-baseline   # store the current numbers as the baseline
+
+Cold runs use an empty bytecode cache, warm runs one that was filled by an earlier run.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_FILE = ROOT / "benchmarks" / "startup_baseline.json"
+ENTRY_POINTS = ["main", "GUI"]
+
+# Runs in the child interpreter before the entry point is imported
+BOOTSTRAP = """
+import importlib, socket, sys
+
+def no_network(*args, **kwargs):
+    raise OSError("the network is disabled while benchmarking startup")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+
+import utils.ffmpeg_install, utils.version
+utils.version.checkversion = lambda *args, **kwargs: None
+utils.ffmpeg_install.ffmpeg_install = lambda *args, **kwargs: None
+
+importlib.import_module(sys.argv[1])
+"""
+
+console = Console()
+
+
+def start(entry_point: str, pycache: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache, PYTHONPATH=str(ROOT))
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", BOOTSTRAP, entry_point]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        console.print(result.stderr.strip().splitlines()[-1], style="bold red")
+        sys.exit(f"Importing {entry_point} failed, install the requirements first.")
+    return result
+
+
+def time_starts(entry_point: str, runs: int, cold: bool) -> float:
+    """Returns the median wall time, in seconds, of starting the entry point."""
+    timings = []
+    with tempfile.TemporaryDirectory() as warm_cache:
+        if not cold:
+            start(entry_point, warm_cache)  # fills the bytecode cache
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory() as cold_cache:
+                begin = time.perf_counter()
+                start(entry_point, cold_cache if cold else warm_cache)
+                timings.append(time.perf_counter() - begin)
+    return statistics.median(timings)
+
+
+def import_times(entry_point: str, runs: int) -> dict:
+    """Returns the median time, in seconds, spent importing every top level package.
+
+    Aggregates the per module self times printed by `python -X importtime`.
+    """
+    samples = {}
+    with tempfile.TemporaryDirectory() as warm_cache:
+        start(entry_point, warm_cache)
+        for _ in range(runs):
+            totals = {}
+            for line in start(entry_point, warm_cache, importtime=True).stderr.splitlines():
+                # import time: self [us] | cumulative | imported package
+                if not line.startswith("import time:") or "self [us]" in line:
+                    continue
+                self_us, _, module = line[len("import time:") :].split("|")
+                package = module.strip().split(".")[0]
+                totals[package] = totals.get(package, 0) + int(self_us) / 1e6
+            for package, seconds in totals.items():
+                samples.setdefault(package, []).append(seconds)
+    return {package: statistics.median(values) for package, values in samples.items()}
+
+
+def diff(value: float, baseline) -> str:
+    if baseline is None:
+        return "new"
+    change = value - baseline
+    style = "red" if change > 0.01 else "green" if change < -0.01 else "white"
+    return f"[{style}]{change:+.3f}[/{style}]"
+
+
+def print_results(results: dict, baseline: dict, top: int) -> None:
+    table = Table(title="Startup time (s)")
+    for column in ["Entry point", "Cold", "Δ", "Warm", "Δ"]:
+        table.add_column(column, justify="left" if column == "Entry point" else "right")
+    for entry_point, result in results.items():
+        old = baseline.get(entry_point, {})
+        table.add_row(
+            entry_point,
+            f"{result['cold']:.3f}",
+            diff(result["cold"], old.get("cold")),
+            f"{result['warm']:.3f}",
+            diff(result["warm"], old.get("warm")),
+        )
+    console.print(table)
+
+    for entry_point, result in results.items():
+        old = baseline.get(entry_point, {}).get("imports", {})
+        table = Table(title=f"Slowest imports of {entry_point} (s, warm)")
+        table.add_column("Package")
+        table.add_column("Time", justify="right")
+        table.add_column("Δ", justify="right")
+        imports = sorted(result["imports"].items(), key=lambda item: item[1], reverse=True)
+        for package, seconds in imports[:top]:
+            table.add_row(package, f"{seconds:.3f}", diff(seconds, old.get(package)))
+        gone = [package for package in old if package not in result["imports"]]
+        if gone:
+            table.caption = f"No longer imported: {', '.join(sorted(gone))}"
+        console.print(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Starts per measurement")
+    parser.add_argument("--top", type=int, default=15, help="Packages shown per entry point")
+    parser.add_argument(
+        "--entry-point", choices=ENTRY_POINTS, action="append", help="Defaults to all of them"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help=f"Write the results to {BASELINE_FILE.name}"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point in args.entry_point or ENTRY_POINTS:
+        console.print(f"Measuring {entry_point}...")
+        results[entry_point] = {
+            "cold": time_starts(entry_point, args.runs, cold=True),
+            "warm": time_starts(entry_point, args.runs, cold=False),
+            "imports": import_times(entry_point, args.runs),
+        }
+
+    baseline = {}
+    if BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+    print_results(results, baseline, args.top)
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(results, indent=4), encoding="utf-8")
+        console.print(f"Saved the baseline to {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+"""Measures the throughput of the TTS providers against local stand-ins for their APIs.
+
+Every provider is pointed at an HTTP server on 127.0.0.1 that answers like the real service
+after a configurable latency, and fails a configurable share of the requests with a 5xx or a
+429 asking to retry later. Connections to anything but this machine are refused, so the numbers
+only depend on the settings below and on the code making the requests.
+
+    python benchmarks/tts_providers.py                          # every provider, raw and through TTSEngine
+    python benchmarks/tts_providers.py --provider TikTok --concurrency 1 2 4 8
+    python benchmarks/tts_providers.py --error-rate 0.05 --throttle-rate 0.1 --max-inflight 4
+    python benchmarks/tts_providers.py --save-baseline          # store the clips/s as the baseline
+
+"raw" calls provider.run from as many threads as the concurrency, which shows the limit worth
+setting as max_concurrency. "engine" runs a whole TTSEngine with tts_concurrency set to it, which
+catches regressions in the engine itself. Providers whose package isn't installed are skipped.
+
+"Rejected" counts the requests the mock server failed on purpose, for every provider. "Retried"
+counts the retries of the shared transport, so it's n/a for the providers with a client of their
+own (AWSPolly, ElevenLabs and GTTS); a rejected request that wasn't retried shows up in "Errors".
+"""
+import argparse
+import base64
+import json
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from rich.console import Console
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from TTS import planner  # noqa: E402
+from TTS.engine_wrapper import TTSEngine  # noqa: E402
+from utils import settings, transport  # noqa: E402
+from utils.audio_metadata import silent_mp3_frames  # noqa: E402
+
+BASELINE_FILE = ROOT / "benchmarks" / "tts_providers_baseline.json"
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, joint stereo
+FRAME_HEADER = b"\xff\xfb\x90\x64"
+CHARS_PER_SECOND = 14.0
+
+console = Console()
+
+
+class MockServer(ThreadingHTTPServer):
+    """Answers the requests of every provider like its API would, slowly and unreliably on purpose.
+
+    Args:
+        latency (float): Seconds every request takes before it's answered
+        jitter (float): Up to this many seconds are added to the latency at random
+        error_rate (float): Share of the requests answered with a 503
+        throttle_rate (float): Share of the requests answered with a 429
+        max_inflight (int): Requests past this many at once are answered with a 429, 0 for no limit
+        retry_after (float): Seconds a 429 asks the client to wait
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float,
+        jitter: float,
+        error_rate: float,
+        throttle_rate: float,
+        max_inflight: int,
+        retry_after: float,
+    ):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.inflight = 0
+        self.rejected = 0  # requests answered with a 429 or 503, whichever client sent them
+        self.random = random.Random(1)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(
+            sys.exc_info()[1], ConnectionError
+        ):  # a client closed a kept alive connection
+            super().handle_error(request, client_address)
+
+    def failure(self):
+        """Picks the status to fail a request with, None to answer it."""
+        with self.lock:
+            self.inflight += 1
+            if self.max_inflight and self.inflight > self.max_inflight:
+                status = 429
+            else:
+                roll = self.random.random()
+                status = (
+                    503
+                    if roll < self.error_rate
+                    else 429 if roll < self.error_rate + self.throttle_rate else None
+                )
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            if status is not None:
+                self.rejected += 1
+        time.sleep(delay)
+        return status
+
+    def done(self) -> None:
+        with self.lock:
+            self.inflight -= 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(b"")
+
+    def do_POST(self):
+        self.handle_request(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    def handle_request(self, body: bytes) -> None:
+        status = self.server.failure()
+        try:
+            if status == 429:
+                self.reply(status, b"{}", headers={"Retry-After": str(self.server.retry_after)})
+            elif status is not None:
+                self.reply(status, b"{}")
+            else:
+                self.reply(200, *self.answer(body))
+        finally:
+            self.server.done()
+
+    def answer(self, body: bytes):
+        """Returns the body and the content type the real API would answer with."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/media/api/text/speech/invoke/":  # TikTok
+            audio = base64.b64encode(speech(query["req_text"][0])).decode()
+            return json.dumps({"status_code": 0, "data": {"v_str": audio}}).encode(), None
+        if url.path == "/polly/speak":  # Streamlabs, the audio is downloaded from speak_url
+            text = parse_qs(body.decode())["text"][0]
+            speak_url = f"{self.server.url}/audio.mp3?chars={len(text)}"
+            return json.dumps({"success": True, "speak_url": speak_url}).encode(), None
+        if url.path == "/audio.mp3":
+            return speech("x" * int(query["chars"][0])), "audio/mpeg"
+        if url.path == "/v1/speech":  # AWS Polly
+            return speech(json.loads(body)["Text"]), "audio/mpeg"
+        if url.path == "/v1/voices":  # ElevenLabs looks the voice up by name first
+            voices = [
+                {"voice_id": name.lower(), "name": name} for name in ("Bella", "Adam", "Rachel")
+            ]
+            return json.dumps({"voices": voices}).encode(), None
+        if url.path.startswith("/v1/text-to-speech/"):  # ElevenLabs
+            return speech(json.loads(body)["text"]), "audio/mpeg"
+        if url.path.endswith("/batchexecute"):  # Google Translate, used by gTTS
+            audio = base64.b64encode(speech(parse_qs(body.decode())["f.req"][0])).decode()
+            rpc = [["wrb.fr", "jQ1olc", json.dumps([audio]), None, None, None, "generic"]]
+            return f")]}}'\n\n{json.dumps(rpc)}\n".encode(), None
+        return b"{}", None
+
+    def reply(self, status: int, body: bytes, content_type=None, headers=None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def speech(text: str) -> bytes:
+    """Returns silent MP3 audio as long as the text would take to say."""
+    return silent_mp3_frames(FRAME_HEADER, round(max(len(text), 1) / CHARS_PER_SECOND, 1))
+
+
+def refuse_remote_connections() -> None:
+    """Makes sure a provider that isn't pointed at the mock server fails instead of going online."""
+    connect = socket.socket.connect
+
+    def local_only(sock, address):
+        if sock.family in (socket.AF_INET, socket.AF_INET6) and address[0] not in (
+            "127.0.0.1",
+            "::1",
+            "localhost",
+        ):
+            raise OSError(f"connecting to {address[0]} is disabled while benchmarking")
+        return connect(sock, address)
+
+    socket.socket.connect = local_only
+
+
+def mount_like(real_url: str, url: str) -> None:
+    """Gives the mock server the connection pool the shared session keeps for the real host."""
+    from requests.adapters import HTTPAdapter
+
+    connections = transport.CONNECTIONS_PER_HOST.get(
+        urlsplit(real_url).hostname, transport.DEFAULT_CONNECTIONS_PER_HOST
+    )
+    transport.get_session().mount(
+        f"{url}/", HTTPAdapter(pool_connections=1, pool_maxsize=connections, pool_block=True)
+    )
+
+
+def point_tiktok(provider, url: str) -> None:
+    mount_like(provider.URI_BASE, url)
+    provider.URI_BASE = f"{url}/media/api/text/speech/invoke/"
+
+
+def point_streamlabs(provider, url: str) -> None:
+    mount_like(provider.url, url)
+    provider.url = f"{url}/polly/speak"
+
+
+def point_aws(provider, url: str) -> None:
+    import boto3
+    from botocore.config import Config
+
+    from TTS import aws_polly
+
+    aws_polly._client = boto3.client(
+        "polly",
+        endpoint_url=url,
+        region_name="us-east-1",
+        aws_access_key_id="benchmark",
+        aws_secret_access_key="benchmark",
+        config=Config(
+            max_pool_connections=provider.max_concurrency,
+            retries={"max_attempts": 4, "mode": "standard"},
+        ),
+    )
+
+
+def point_elevenlabs(provider, url: str) -> None:
+    from elevenlabs.client import ElevenLabs
+
+    provider.client = ElevenLabs(api_key="benchmark", base_url=url)
+
+
+def point_gtts(provider, url: str) -> None:
+    import gtts.tts
+
+    gtts.tts._translate_url = lambda tld="com", path="": f"{url}/{path}"
+
+
+# module, class and the function pointing an instance at the mock server
+PROVIDERS = {
+    "TikTok": ("TTS.TikTok", "TikTok", point_tiktok),
+    "StreamlabsPolly": ("TTS.streamlabs_polly", "StreamlabsPolly", point_streamlabs),
+    "AWSPolly": ("TTS.aws_polly", "AWSPolly", point_aws),
+    "elevenlabs": ("TTS.elevenlabs", "elevenlabs", point_elevenlabs),
+    "GTTS": ("TTS.GTTS", "GTTS", point_gtts),
+}
+# the others send their requests with a client of their own, which retries without counting
+SHARED_TRANSPORT = {"TikTok", "StreamlabsPolly"}
+
+
+def provider_class(name: str, url: str):
+    """Returns a subclass of the provider whose instances use the mock server at url."""
+    module, class_name, point = PROVIDERS[name]
+    cls = getattr(__import__(module, fromlist=[class_name]), class_name)
+
+    def __init__(self):
+        cls.__init__(self)
+        point(self, url)
+
+    # a new class every time, so TTSEngine gives it a semaphore of its own
+    return type(cls.__name__, (cls,), {"__init__": __init__})
+
+
+def configure(concurrency: int, cache_dir: str) -> None:
+    settings.config = {
+        "reddit": {"thread": {"post_lang": ""}},
+        "settings": {
+            "storymode": False,
+            "tts": {
+                "random_voice": False,
+                "tiktok_voice": "en_us_001",
+                "tiktok_sessionid": "benchmark",
+                "streamlabs_polly_voice": "Matthew",
+                "aws_polly_voice": "Matthew",
+                "elevenlabs_voice_name": "Bella",
+                "elevenlabs_api_key": "benchmark",
+                "silence_duration": 0.3,
+                "no_emojis": False,
+                "tts_concurrency": concurrency,
+                "cache_dir": cache_dir,
+                "cache_size_mb": 0,  # every clip goes to the provider
+            },
+        },
+    }
+
+
+def texts(count: int, seed: int = 0) -> list:
+    """Returns comments of the lengths Reddit comments usually have."""
+    rng = random.Random(seed)
+    words = "the a video reddit comment people really think would never because what time".split()
+    return [
+        " ".join(rng.choice(words) for _ in range(int(rng.lognormvariate(3.2, 0.8)) + 3)) + "."
+        for _ in range(count)
+    ]
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def run_raw(cls, concurrency: int, clips: list, directory: str) -> dict:
+    """Calls provider.run from `concurrency` threads, timing every clip."""
+    provider = cls()
+    latencies = []
+    errors = 0
+
+    def call(idx: int, text: str):
+        begin = time.perf_counter()
+        provider.run(text, f"{directory}/{idx}.mp3", random_voice=False)
+        return time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(call, idx, text) for idx, text in enumerate(clips)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - begin
+    return {
+        "clips/s": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5) if latencies else None,
+        "p99": percentile(latencies, 0.99) if latencies else None,
+        "errors": errors,
+    }
+
+
+def run_engine(cls, clips: list, directory: str) -> dict:
+    """Runs a whole TTSEngine over a thread with the clips as its comments."""
+    reddit_object = {
+        "thread_id": "benchmark",
+        "thread_title": "What is the best thing you have ever heard?",
+        "thread_post": "",
+        "comments": [
+            {"comment_body": text, "comment_id": str(idx)} for idx, text in enumerate(clips)
+        ],
+    }
+    engine = TTSEngine(cls, reddit_object, path=f"{directory}/", max_length=float("inf"))
+    begin = time.perf_counter()
+    try:
+        engine.run()
+        errors = 0
+    except Exception as e:
+        console.print(f"TTSEngine failed: {e!r}", style="red")
+        errors = 1
+    elapsed = time.perf_counter() - begin
+    return {
+        "clips/s": 0.0 if errors else (len(clips) + 1) / elapsed,
+        "p50": None,
+        "p99": None,
+        "errors": errors,
+    }
+
+
+def benchmark(name: str, args) -> dict:
+    """Returns the results of the provider, keyed by mode and concurrency."""
+    results = {}
+    for mode in args.mode:
+        for concurrency in args.concurrency:
+            with MockServer(
+                args.latency,
+                args.jitter,
+                args.error_rate,
+                args.throttle_rate,
+                args.max_inflight,
+                args.retry_after,
+            ) as server, tempfile.TemporaryDirectory() as directory:
+                configure(concurrency, f"{directory}/cache")
+                transport.retry_counts.clear()
+                cls = provider_class(name, server.url)
+                clips = texts(args.clips)
+                if mode == "raw":
+                    result = run_raw(cls, concurrency, clips, directory)
+                else:
+                    result = run_engine(cls, clips, directory)
+                result["rejected"] = server.rejected
+                result["retried"] = (
+                    sum(transport.retry_counts.values()) if name in SHARED_TRANSPORT else None
+                )
+            results[f"{mode}/{concurrency}"] = result
+    return results
+
+
+def diff(value: float, baseline) -> str:
+    if baseline is None:
+        return "new"
+    change = (value - baseline) / baseline if baseline else 0.0
+    style = "red" if change < -0.1 else "green" if change > 0.1 else "white"
+    return f"[{style}]{change:+.0%}[/{style}]"
+
+
+def seconds(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def print_results(results: dict, baseline: dict) -> None:
+    for name, provider_results in results.items():
+        table = Table(title=name)
+        for column in [
+            "Mode",
+            "Threads",
+            "Clips/s",
+            "Δ",
+            "p50 (ms)",
+            "p99 (ms)",
+            "Rejected",
+            "Retried",
+            "Errors",
+        ]:
+            table.add_column(column, justify="left" if column == "Mode" else "right")
+        old = baseline.get(name, {})
+        for key, result in provider_results.items():
+            mode, concurrency = key.split("/")
+            table.add_row(
+                mode,
+                concurrency,
+                f"{result['clips/s']:.2f}",
+                diff(result["clips/s"], old.get(key, {}).get("clips/s")),
+                seconds(result["p50"]),
+                seconds(result["p99"]),
+                str(result.get("rejected", "-")),
+                "n/a" if result["retried"] is None else str(result["retried"]),
+                f"[red]{result['errors']}[/red]" if result["errors"] else "0",
+            )
+        console.print(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--provider", choices=PROVIDERS, action="append", help="Defaults to all of them"
+    )
+    parser.add_argument("--mode", choices=["raw", "engine"], nargs="+", default=["raw", "engine"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clips", type=int, default=40, help="Clips per measurement")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random seconds added to it")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share answered with a 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share answered with a 429")
+    parser.add_argument(
+        "--max-inflight", type=int, default=0, help="Requests at once before a 429, 0 for no limit"
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Seconds a 429 asks to wait")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help=f"Write the results to {BASELINE_FILE.name}"
+    )
+    args = parser.parse_args()
+
+    refuse_remote_connections()
+    results = {}
+    with tempfile.TemporaryDirectory() as data:
+        planner.RATES_FILE = f"{data}/tts_rates.json"  # keep the learned speaking rates untouched
+        for name in args.provider or PROVIDERS:
+            console.print(f"Measuring {name}...")
+            try:
+                results[name] = benchmark(name, args)
+            except ImportError as e:
+                console.print(f"Skipping {name}, {e.name} isn't installed", style="yellow")
+
+    baseline = {}
+    if BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+    print_results(results, baseline)
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(results, indent=4), encoding="utf-8")
+        console.print(f"Saved the baseline to {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,53 @@
 #!/usr/bin/env python
+import argparse
 import math
+import re
 import sys
 from os import name
 from pathlib import Path
 from subprocess import Popen
-from typing import NoReturn
+from typing import NoReturn, Optional, Tuple
 
 from prawcore import ResponseException
+from rich.table import Table
 
 from reddit.subreddit import get_subreddit_threads
-from utils import settings
+from utils import jobs, settings, videos
 from utils.cleanup import cleanup
-from utils.console import print_markdown, print_step, print_substep
+from utils.console import console, print_markdown, print_step, print_substep
 from utils.ffmpeg_install import ffmpeg_install
 from utils.id import id
+from utils.manifest import checkpointed, load_checkpoint, save_checkpoint
+from utils.pipeline import Stage, run_pipelined, run_stages
+from utils.tracing import span, start_trace
 from utils.version import checkversion
 from video_creation.background import (
     chop_background,
     download_background_audio,
     download_background_video,
+    get_background_choice,
     get_background_config,
 )
 from video_creation.final_video import make_final_video
 from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
-from video_creation.voices import save_text_to_mp3
+from video_creation.voices import plan_video, save_text_to_mp3
 
 __VERSION__ = "3.3.0"
 
+# the config values the manifests of the stages depend on, see utils/manifest.py
+STORYMODE_SETTINGS = ["settings.storymode", "settings.storymodemethod"]
+REDDIT_SETTINGS = [
+    "reddit.thread.max_comment_length",
+    "reddit.thread.min_comment_length",
+] + STORYMODE_SETTINGS
+BACKGROUND_SETTINGS = [
+    "settings.background.background_video",
+    "settings.background.background_audio",
+]
+
+# ids of the threads whose temp files are in use, a pipelined run prepares several at once
+in_flight = set()
+
 print(
     """
 ██████╗ ███████╗██████╗ ██████╗ ██╗████████╗    ██╗   ██╗██╗██████╗ ███████╗ ██████╗     ███╗   ███╗ █████╗ ██╗  ██╗███████╗██████╗
@@ -43,24 +64,195 @@ print_markdown(
 checkversion(__VERSION__)
 
 
-def main(POST_ID=None) -> None:
-    global redditid, reddit_object
-    reddit_object = get_subreddit_threads(POST_ID)
+def main(POST_ID=None, resume: bool = False) -> None:
+    render_video(prepare_video(POST_ID, resume))
+
+
+def prepare_video(POST_ID=None, resume: bool = False) -> dict:
+    """Runs every stage up to the final render.
+
+    Every stage writes a manifest to assets/temp/<thread id>/manifests.
+    When resuming, the stages whose manifest is still valid are skipped.
+
+    Args:
+        POST_ID (str): The post to make a video of, None picks one like a normal run
+        resume (bool): Whether to reuse the outputs of an interrupted run of POST_ID
+
+    Returns:
+        dict: The pipeline context with everything make_final_video needs
+    """
+    trace = start_trace()
+    valid = False
+    if resume:
+        valid, reddit_object = load_checkpoint(
+            re.sub(r"[^\w\s-]", "", POST_ID), "reddit", settings_paths=REDDIT_SETTINGS
+        )
+    if not valid:
+        with span("get_subreddit_threads", "reddit"):
+            reddit_object = get_subreddit_threads(POST_ID)
     redditid = id(reddit_object)
-    length, number_of_comments = save_text_to_mp3(reddit_object)
-    length = math.ceil(length)
-    get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
+    in_flight.add(redditid)
+    if not valid:
+        save_checkpoint(redditid, "reddit", reddit_object, settings_paths=REDDIT_SETTINGS)
+
+    valid, bg_choice = (
+        load_checkpoint(redditid, "background_choice", settings_paths=BACKGROUND_SETTINGS)
+        if resume
+        else (False, None)
+    )
+    if not valid:
+        bg_choice = {
+            "video": get_background_choice("video"),
+            "audio": get_background_choice("audio"),
+        }
+        save_checkpoint(redditid, "background_choice", bg_choice, settings_paths=BACKGROUND_SETTINGS)
     bg_config = {
-        "video": get_background_config("video"),
-        "audio": get_background_config("audio"),
+        "video": get_background_config("video", bg_choice["video"]),
+        "audio": get_background_config("audio", bg_choice["audio"]),
+    }
+    tts_settings = ["settings.tts", "reddit.thread.post_lang"] + STORYMODE_SETTINGS
+    if settings.config["settings"]["storymode"]:
+        # the number of clips is only known once the post is synthesized
+        text_stages = [
+            checkpointed(
+                Stage(
+                    "tts",
+                    synthesize_text,
+                    inputs=["video_object"],
+                    outputs=["length", "number_of_comments"],
+                ),
+                redditid,
+                files=["mp3/*.mp3"],
+                settings_paths=tts_settings,
+                resume=resume,
+            )
+        ]
+        screenshot_count = "number_of_comments"
+    else:
+        # the comments are picked up front, so the screenshots don't wait for the TTS
+        text_stages = [
+            checkpointed(
+                Stage(
+                    "plan",
+                    plan_video,
+                    inputs=["reddit_object"],
+                    outputs=["video_object", "planned_comments"],
+                ),
+                redditid,
+                settings_paths=tts_settings,
+                resume=resume,
+            ),
+            # stops at the max length when the estimates were too low, so it can use fewer comments
+            checkpointed(
+                Stage(
+                    "tts",
+                    synthesize_text,
+                    inputs=["video_object"],
+                    outputs=["length", "number_of_comments"],
+                ),
+                redditid,
+                files=["mp3/*.mp3"],
+                settings_paths=tts_settings,
+                resume=resume,
+            ),
+        ]
+        screenshot_count = "planned_comments"
+    stages = text_stages + [
+        checkpointed(
+            Stage(
+                "screenshots",
+                get_screenshots_of_reddit_posts,
+                inputs=["video_object", screenshot_count],
+                outputs=["screenshots"],
+            ),
+            redditid,
+            files=["png/*.png"],
+            settings_paths=[
+                "settings.theme",
+                "settings.resolution_w",
+                "settings.resolution_h",
+                "settings.zoom",
+                "reddit.thread.post_lang",
+            ]
+            + STORYMODE_SETTINGS,
+            key=lambda reddit_obj, number_of_comments: [
+                comment["comment_id"] for comment in reddit_obj["comments"][:number_of_comments]
+            ],
+            resume=resume,
+        ),
+        Stage(
+            "background_video",
+            download_background_video,
+            inputs=["background_video_config"],
+            outputs=["background_video"],
+        ),
+        Stage(
+            "background_audio",
+            download_background_audio,
+            inputs=["background_audio_config"],
+            outputs=["background_audio"],
+        ),
+        checkpointed(
+            Stage(
+                "chop_background",
+                chop_background,
+                inputs=["bg_config", "length", "reddit_object"],
+                outputs=["background_credit"],
+                after=["background_video", "background_audio"],
+            ),
+            redditid,
+            files=["background.mp4", "background.mp3"],
+            settings_paths=["settings.background.background_audio_volume"],
+            key=lambda bg_config, length, reddit_obj: [bg_config, length],
+            resume=resume,
+        ),
+    ]
+    context = {
+        "reddit_id": redditid,
+        "reddit_object": reddit_object,
+        "bg_config": bg_config,
+        "background_video_config": bg_config["video"],
+        "background_audio_config": bg_config["audio"],
     }
-    download_background_video(bg_config["video"])
-    download_background_audio(bg_config["audio"])
-    chop_background(bg_config, length, reddit_object)
-    make_final_video(number_of_comments, length, reddit_object, bg_config)
+    if settings.config["settings"]["storymode"]:
+        context["video_object"] = reddit_object  # the plan stage provides it otherwise
+    context = run_stages(
+        stages,
+        context=context,
+        max_workers=None if settings.config["settings"]["concurrent_stages"] else 1,
+    )
+    context["trace"] = trace
+    return context
+
+
+def render_video(context: dict) -> None:
+    trace = start_trace(context["trace"])
+    try:
+        with span("make_final_video", "stage"):
+            make_final_video(
+                context["number_of_comments"],
+                context["length"],
+                context["reddit_object"],
+                context["bg_config"],
+            )
+        in_flight.discard(context["reddit_id"])  # make_final_video removed its temp files
+    finally:
+        # also written when the render fails, that's when it's needed the most
+        trace_path = f"assets/traces/{context['reddit_id']}.json"
+        trace.save(trace_path)
+        trace.print_summary()
+        print_substep(f"Timings of every step were saved to {trace_path}")
+
+
+def synthesize_text(reddit_obj: dict) -> Tuple[int, int]:
+    """Runs the TTS and rounds the length up to the full second the background is chopped to."""
+    length, number_of_comments = save_text_to_mp3(reddit_obj)
+    return math.ceil(length), number_of_comments
 
 
 def run_many(times) -> None:
+    if settings.config["settings"]["pipeline_depth"]:
+        return run_batch([None] * times)
     for x in range(1, times + 1):
         print_step(
             f'on the {x}{("th", "st", "nd", "rd", "th", "th", "th", "th", "th", "th")[x % 10]} iteration of {times}'
@@ -69,10 +261,104 @@ def run_many(times) -> None:
         Popen("cls" if name == "nt" else "clear", shell=True).wait()
 
 
-def shutdown() -> NoReturn:
-    if "redditid" in globals():
+def run_batch(post_ids: list) -> None:
+    """Makes a video for every post id, preparing the next videos while the current one renders.
+
+    Args:
+        post_ids (list): The ids of the posts to make videos of, None picks a thread like a normal run
+    """
+
+    def prepare(item):
+        index, post_id = item
+        print_step(f"Preparing video {index} of {len(post_ids)}")
+        return prepare_video(post_id)
+
+    run_pipelined(
+        enumerate(post_ids, 1),
+        prepare,
+        render_video,
+        depth=settings.config["settings"]["pipeline_depth"],
+    )
+
+
+def run_worker() -> None:
+    """Makes videos of the jobs in the queue until it is empty."""
+    while (job := jobs.claim_job()) is not None:
+        print_step(f"Working on job {job['id']}, attempt {job['attempts']} of {job['max_attempts']}")
+        jobs.current_job, jobs.current_worker = job["id"], job["worker"]
+        heartbeat = jobs.start_heartbeat(job["id"], job["worker"])
+        try:
+            main(job["post_id"])
+        except KeyboardInterrupt:
+            jobs.release_job(job["id"], job["worker"])  # stopping the worker isn't the job's fault
+            raise
+        except SystemExit:
+            fail_job(job, "exited")
+            raise
+        except Exception as err:
+            status = fail_job(job, f"{type(err).__name__}: {err}")
+            if status is None:
+                print_substep(f"Job {job['id']} failed ({err}) after its lease expired.", "bold red")
+            else:
+                print_substep(f"Job {job['id']} failed ({err}), it is {status} now.", "bold red")
+        else:
+            if jobs.finish_job(job["id"], job["worker"]) is None:
+                print_substep(
+                    f"Job {job['id']} was given to another worker while this one was making it.",
+                    "bold red",
+                )
+        finally:
+            heartbeat.set()
+            jobs.current_job = jobs.current_worker = None
+    print_step("The job queue is empty.")
+
+
+def fail_job(job: dict, error: str) -> Optional[str]:
+    """Marks the job as failed, and frees its thread for the next videos of this worker."""
+    thread_id = jobs.get_job(job["id"])["thread_id"]
+    videos.in_progress.discard(thread_id)
+    return jobs.finish_job(job["id"], job["worker"], error)
+
+
+def run_workers(count: int) -> None:
+    """Starts worker processes that work through the job queue, and waits until they are done."""
+    workers = [Popen([sys.executable, __file__, "--worker"]) for _ in range(count)]
+    for worker in workers:
+        worker.wait()
+
+
+def print_jobs() -> None:
+    table = Table(title="Jobs")
+    for column in ["Id", "Post", "Priority", "Status", "Attempts", "Thread", "Error"]:
+        table.add_column(column)
+    for job in jobs.list_jobs():
+        table.add_row(
+            str(job["id"]),
+            job["post_id"] or "any",
+            str(job["priority"]),
+            job["status"],
+            f"{job['attempts']}/{job['max_attempts']}",
+            job["thread_id"] or "",
+            job["error"] or "",
+        )
+    console.print(table)
+
+
+def shutdown(interrupted: bool = False) -> NoReturn:
+    """Exits, removing the temp files of the unfinished videos unless they can still be resumed.
+
+    Args:
+        interrupted (bool): Whether the user stopped the run, its temp files are kept for --resume then
+    """
+    if in_flight and interrupted:
+        for redditid in sorted(in_flight):
+            print_substep(
+                f"Continue the video of {redditid} with: python main.py --resume {redditid}"
+            )
+    elif in_flight:
         print_markdown("## Clearing temp files")
-        cleanup(redditid)
+        for redditid in list(in_flight):  # the producer thread may still add one
+            cleanup(redditid)
 
     print("Exiting...")
     sys.exit()
@@ -84,6 +370,56 @@ if __name__ == "__main__":
             "Hey! Congratulations, you've made it so far (which is pretty rare with no Python 3.10). Unfortunately, this program only works on Python 3.10. Please install Python 3.10 and try again."
         )
         sys.exit()
+    parser = argparse.ArgumentParser(description="Makes a video out of a Reddit thread.")
+    parser.add_argument(
+        "--resume",
+        metavar="THREAD_ID",
+        help="Finish an interrupted run of the given thread, skipping every step whose files are still valid",
+    )
+    parser.add_argument(
+        "--enqueue",
+        nargs="*",
+        metavar="POST_ID",
+        help="Add videos of the given posts to the job queue, or of a new thread when no post is given",
+    )
+    parser.add_argument(
+        "--priority", type=int, default=0, help="Priority of the enqueued jobs, higher runs first"
+    )
+    parser.add_argument(
+        "--attempts", type=int, default=3, help="How often an enqueued job is tried before it fails"
+    )
+    parser.add_argument("--list-jobs", action="store_true", help="Show the job queue")
+    parser.add_argument(
+        "--cancel-job", type=int, metavar="JOB_ID", help="Remove a job from the queue"
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Make videos of the queued jobs until the queue is empty",
+    )
+    parser.add_argument(
+        "--workers", type=int, metavar="N", help="Start N worker processes working through the queue"
+    )
+    args = parser.parse_args()
+    if args.enqueue is not None:
+        for post_id in args.enqueue or [None]:
+            job_id = jobs.enqueue(post_id, args.priority, args.attempts)
+            print_substep(f"Enqueued job {job_id} for {post_id or 'a new thread'}")
+    if args.cancel_job is not None:
+        if jobs.cancel_job(args.cancel_job):
+            print_substep(f"Cancelled job {args.cancel_job}")
+        else:
+            print_substep(f"Job {args.cancel_job} isn't queued, it can't be cancelled.", "bold red")
+    if args.list_jobs:
+        print_jobs()
+    if args.enqueue is not None or args.cancel_job is not None or args.list_jobs:
+        sys.exit()
+    if args.workers:
+        try:
+            run_workers(args.workers)
+        except KeyboardInterrupt:
+            pass  # the workers got the interrupt too and put their jobs back in the queue
+        sys.exit()
     ffmpeg_install()
     directory = Path().absolute()
     config = settings.check_toml(
@@ -101,7 +437,13 @@ if __name__ == "__main__":
         )
         sys.exit()
     try:
-        if config["reddit"]["thread"]["post_id"]:
+        if args.worker:
+            run_worker()
+        elif args.resume:
+            main(args.resume, resume=True)
+        elif config["reddit"]["thread"]["post_id"] and config["settings"]["pipeline_depth"]:
+            run_batch(config["reddit"]["thread"]["post_id"].split("+"))
+        elif config["reddit"]["thread"]["post_id"]:
             for index, post_id in enumerate(config["reddit"]["thread"]["post_id"].split("+")):
                 index += 1
                 print_step(
@@ -114,7 +456,7 @@ if __name__ == "__main__":
         else:
             main()
     except KeyboardInterrupt:
-        shutdown()
+        shutdown(interrupted=True)
     except ResponseException:
         print_markdown("## Invalid credentials")
         print_markdown("Please check your credentials in the config.toml file")
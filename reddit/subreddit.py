@@ -5,11 +5,9 @@ from praw.models import MoreComments
 from prawcore.exceptions import ResponseException
 
 from utils import settings
-from utils.ai_methods import sort_by_similarity
 from utils.console import print_step, print_substep
-from utils.posttextparser import posttextparser
 from utils.subreddit import get_subreddit_undone
-from utils.videos import check_done
+from utils.videos import check_done, mark_in_progress
 from utils.voice import sanitize_text
 
 
@@ -78,6 +76,10 @@ def get_subreddit_threads(POST_ID: str):
     ):
         submission = reddit.submission(id=settings.config["reddit"]["thread"]["post_id"])
     elif settings.config["ai"]["ai_similarity_enabled"]:  # ai sorting based on comparison
+        from utils.ai_methods import (
+            sort_by_similarity,  # imports torch, only when it's needed
+        )
+
         threads = subreddit.hot(limit=50)
         keywords = settings.config["ai"]["ai_similarity_keywords"].split(",")
         keywords = [keyword.strip() for keyword in keywords]
@@ -99,7 +101,15 @@ def get_subreddit_threads(POST_ID: str):
         print_substep("No comments found. Skipping.")
         exit()
 
-    submission = check_done(submission)  # double-checking
+    if not POST_ID:  # posts asked for by id are made even if they were done before
+        submission = check_done(submission)  # double-checking
+        if submission is None:
+            return get_subreddit_threads(POST_ID)
+    if not mark_in_progress(submission.id):
+        if POST_ID:
+            raise RuntimeError(f"Another worker is already making a video of {POST_ID}")
+        print_step("Getting new post as another worker picked the current one")
+        return get_subreddit_threads(POST_ID)
 
     upvotes = submission.score
     ratio = submission.upvote_ratio * 100
@@ -124,6 +134,8 @@ def get_subreddit_threads(POST_ID: str):
     content["comments"] = []
     if settings.config["settings"]["storymode"]:
         if settings.config["settings"]["storymodemethod"] == 1:
+            from utils.posttextparser import posttextparser  # imports spacy
+
             content["thread_post"] = posttextparser(submission.selftext)
         else:
             content["thread_post"] = submission.selftext
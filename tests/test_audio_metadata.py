@@ -0,0 +1,169 @@
+import io
+import struct
+import wave
+
+import pytest
+
+from utils.audio_metadata import (
+    Mp3StreamDuration,
+    get_duration,
+    join_mp3,
+    mp3_duration,
+    parse_frame_header,
+    save_stream,
+    silent_mp3_frames,
+)
+
+# MPEG 1 Layer III, 128 kbit/s, 44.1 kHz, mono, without CRC
+HEADER = bytes([0xFF, 0xFB, 0x90, 0xC4])
+FRAME_SECONDS = 1152 / 44100
+
+
+def frames(count: int, header: bytes = HEADER) -> bytes:
+    """Returns `count` frames of the header, filled with zeros."""
+    return (header + bytes(parse_frame_header(header).length - 4)) * count
+
+
+def id3_tag(size: int) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + bytes(size)
+
+
+def test_parse_frame_header():
+    frame = parse_frame_header(HEADER)
+    assert (frame.version, frame.layer, frame.bitrate, frame.sample_rate) == (3, 3, 128000, 44100)
+    assert frame.mono
+    assert frame.length == 417
+    assert frame.samples == 1152
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b"\x00\xfb\x90\xc4",  # no sync
+        b"\xff\xfb\xf0\xc4",  # bitrate index 15
+        b"\xff\xfb\x9c\xc4",  # reserved sample rate
+        b"\xff\xfb",  # too short
+    ],
+)
+def test_invalid_frame_headers_are_rejected(header):
+    assert parse_frame_header(header) is None
+
+
+def test_duration_of_cbr_frames():
+    audio = frames(38)
+    assert len(audio) == 38 * 417
+    assert mp3_duration(audio) == pytest.approx(38 * FRAME_SECONDS)
+
+
+def test_id3_tag_and_truncated_last_frame_are_skipped():
+    audio = id3_tag(300) + frames(38)
+    assert mp3_duration(audio[:-100]) == pytest.approx(37 * FRAME_SECONDS)
+
+
+def test_xing_frame_count_is_used():
+    xing = bytearray(HEADER + bytes(413))
+    xing[4 + 17 : 4 + 17 + 12] = b"Xing" + struct.pack(">II", 1, 1000)
+    audio = bytes(xing) + frames(38)
+    assert mp3_duration(audio) == pytest.approx(1000 * FRAME_SECONDS)
+
+
+def test_not_an_mp3():
+    with pytest.raises(ValueError):
+        mp3_duration(b"<html>Too many requests</html>")
+
+
+def test_wav_duration(tmp_path):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(bytes(2 * 24000))
+    (tmp_path / "clip.wav").write_bytes(buffer.getvalue())
+    assert get_duration(tmp_path / "clip.wav") == pytest.approx(1.5)
+
+
+def test_other_containers_are_refused(tmp_path):
+    (tmp_path / "clip.aiff").write_bytes(b"FORM" + bytes(100))
+    with pytest.raises(ValueError):
+        get_duration(tmp_path / "clip.aiff")
+
+
+def test_join_adds_the_durations(tmp_path):
+    first, second = tmp_path / "0.mp3", tmp_path / "1.mp3"
+    first.write_bytes(id3_tag(20) + frames(38))
+    second.write_bytes(frames(77))
+    duration = join_mp3([first, second], tmp_path / "joined.mp3")
+    assert duration == pytest.approx((38 + 77) * FRAME_SECONDS)
+    assert get_duration(tmp_path / "joined.mp3") == pytest.approx(duration)
+
+
+def test_join_refuses_different_formats(tmp_path):
+    first, second = tmp_path / "0.mp3", tmp_path / "1.mp3"
+    first.write_bytes(frames(38))
+    second.write_bytes(frames(38, bytes([0xFF, 0xFB, 0x94, 0xC4])))  # 48 kHz
+    with pytest.raises(ValueError):
+        join_mp3([first, second], tmp_path / "joined.mp3")
+
+
+def test_join_adds_the_durations_and_the_silence(tmp_path):
+    first, second = tmp_path / "0.mp3", tmp_path / "1.mp3"
+    first.write_bytes(id3_tag(20) + frames(38))
+    second.write_bytes(frames(77))
+    duration = join_mp3([first, second], tmp_path / "joined.mp3", silence=0.5)
+    assert duration == pytest.approx((38 + 77 + 19) * FRAME_SECONDS)
+    assert get_duration(tmp_path / "joined.mp3") == pytest.approx(duration)
+
+
+def test_silence_is_rounded_to_whole_frames():
+    assert silent_mp3_frames(HEADER, 0.5) == frames(19)
+    assert silent_mp3_frames(HEADER, 0) == b""
+
+
+def test_silence_frames_have_no_padding_or_crc():
+    padded_with_crc = bytes([0xFF, 0xFA, 0x92, 0xC4])
+    assert silent_mp3_frames(padded_with_crc, 0.5) == frames(19)
+
+
+def test_silence_is_only_made_for_layer_iii():
+    with pytest.raises(ValueError):
+        silent_mp3_frames(bytes([0xFF, 0xFD, 0x90, 0xC4]), 0.5)  # Layer II
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 417, 4096])
+def test_stream_duration_matches_the_file(chunk_size):
+    audio = id3_tag(50) + frames(77)
+    duration = Mp3StreamDuration()
+    for offset in range(0, len(audio), chunk_size):
+        duration.feed(audio[offset : offset + chunk_size])
+    assert duration.duration == pytest.approx(mp3_duration(audio))
+
+
+def test_stream_duration_of_something_else_is_none():
+    duration = Mp3StreamDuration()
+    duration.feed(b"<html>" + bytes(1000))
+    assert duration.duration is None
+
+
+def test_stream_duration_of_xing_frame_count():
+    xing = bytearray(HEADER + bytes(413))
+    xing[4 + 17 : 4 + 17 + 12] = b"Xing" + struct.pack(">II", 1, 1000)
+    audio = bytes(xing) + frames(5)
+    duration = Mp3StreamDuration()
+    for offset in range(0, len(audio), 100):
+        duration.feed(audio[offset : offset + 100])
+    assert duration.duration == pytest.approx(1000 * FRAME_SECONDS)
+
+
+def test_save_stream_writes_the_chunks_and_times_them(tmp_path):
+    audio = id3_tag(30) + frames(40)
+    chunks = [audio[offset : offset + 500] for offset in range(0, len(audio), 500)] + [b""]
+    duration = save_stream(iter(chunks), tmp_path / "clip.mp3")
+    assert (tmp_path / "clip.mp3").read_bytes() == audio
+    assert duration == pytest.approx(40 * FRAME_SECONDS)
+
+
+def test_save_stream_of_something_else_is_untimed(tmp_path):
+    assert save_stream([b"RIFF", bytes(100)], tmp_path / "clip.wav") is None
+    assert (tmp_path / "clip.wav").read_bytes() == b"RIFF" + bytes(100)
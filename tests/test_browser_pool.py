@@ -0,0 +1,204 @@
+import json
+import threading
+from multiprocessing import Pipe
+from multiprocessing.connection import Listener
+
+import pytest
+
+from utils import browser_pool
+
+
+class Browser(browser_pool.PooledBrowser):
+    """A pooled browser without a Chromium process behind it."""
+
+    def __init__(self, name: str):
+        super().__init__("chromium")
+        self.name = name
+        self.starts = 0
+        self.alive = True
+
+    def start(self) -> None:
+        self.starts += 1
+        self.endpoint = f"http://{self.name}:{self.starts}"
+        self.pages = 0
+        self.retiring = False
+
+    def stop(self) -> None:
+        pass
+
+    def healthy(self) -> bool:
+        return self.alive
+
+
+class Process:
+    def poll(self):
+        return None
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(browser_pool, "START_TIMEOUT", 0.1)
+    browsers = [Browser("a"), Browser("b")]
+    for browser in browsers:
+        browser.process = Process()
+    return browser_pool.BrowserPool(browsers, recycle_after=10)
+
+
+def test_browser_with_the_fewest_leases_is_lent(pool):
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.name, second.name} == {"a", "b"}
+    pool.release(first, 1)
+    assert pool.acquire() is first
+
+
+def test_browser_is_restarted_once_it_opened_enough_pages(pool):
+    browser = pool.acquire()
+    pool.release(browser, 4)
+    browser = pool.acquire()
+    other = pool.acquire()
+    pool.release(browser, 6)
+    assert (browser.starts, browser.pages) == (2, 0)
+    assert other.starts == 1
+
+
+def test_used_up_browser_waits_for_its_leases_to_end(pool):
+    browser = pool.acquire()
+    pool.acquire()  # the other one
+    again = pool.acquire()
+    assert again is browser
+    pool.release(browser, 10)
+    assert browser.retiring and browser.starts == 1
+    assert pool.acquire() is not browser  # isn't lent out any more
+    pool.release(again, 0)
+    assert not browser.retiring and browser.starts == 2
+
+
+def test_acquire_gives_up_when_every_browser_is_retiring(pool):
+    for browser in pool.browsers:
+        browser.retiring = True
+    assert pool.acquire() is None
+
+
+def test_unhealthy_browser_is_restarted(pool):
+    broken, fine = pool.browsers
+    broken.alive = False
+    pool.check_health()
+    assert (broken.starts, fine.starts) == (2, 1)
+
+
+def test_leases_end_when_the_client_disconnects(pool):
+    client, server = Pipe()
+    handler = threading.Thread(target=pool.handle, args=(server,))
+    handler.start()
+    client.send("acquire")
+    client.send("acquire")
+    assert {client.recv(), client.recv()} == {"http://a:1", "http://b:1"}
+    client.send(("release", 3))
+    client.close()
+    handler.join(5)
+    assert [browser.leases for browser in pool.browsers] == [0, 0]
+    assert sum(browser.pages for browser in pool.browsers) == 3
+
+
+@pytest.fixture
+def pool_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(browser_pool, "POOL_FILE", str(tmp_path / "browser_pool.json"))
+    return tmp_path / "browser_pool.json"
+
+
+def test_connect_uses_the_port_and_key_of_the_pool_file(pool_file):
+    assert browser_pool.connect() is None
+    listener = Listener(("127.0.0.1", 0), authkey=b"key")
+    threading.Thread(target=lambda: listener.accept().send("hello"), daemon=True).start()
+    pool_file.write_text(
+        json.dumps({"pid": 1, "port": listener.address[1], "authkey": b"key".hex()}),
+        encoding="utf-8",
+    )
+    with browser_pool.connect() as conn:
+        assert conn.recv() == "hello"
+    listener.close()
+
+
+def test_connect_to_a_pool_that_stopped(pool_file):
+    listener = Listener(("127.0.0.1", 0))
+    port = listener.address[1]
+    listener.close()
+    pool_file.write_text(json.dumps({"pid": 1, "port": port, "authkey": "00"}), encoding="utf-8")
+    assert browser_pool.connect() is None
+
+
+class Context:
+    def __init__(self):
+        self.listeners = []
+
+    def on(self, event, listener):
+        assert event == "page"
+        self.listeners.append(listener)
+
+    def new_page(self):
+        for listener in self.listeners:
+            listener(object())
+
+
+class ConnectedBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def new_context(self, **kwargs):
+        return Context()
+
+    def close(self):
+        self.closed = True
+
+
+def test_leased_browser_counts_the_pages_opened_in_its_contexts():
+    browser = browser_pool.LeasedBrowser(ConnectedBrowser())
+    first, second = browser.new_context(locale="en-us"), browser.new_context()
+    first.new_page(), first.new_page(), second.new_page()
+    browser.close()
+    assert browser.opened_pages == 3
+    assert browser.browser.closed
+
+
+class Connection:
+    """The client end of a connection to the pool, lending out one endpoint."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        return "http://127.0.0.1:9222"
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def test_pooled_browser_reports_the_pages_it_opened(monkeypatch):
+    pytest.importorskip("playwright")
+    from utils import settings
+
+    monkeypatch.setattr(settings, "config", {"settings": {"browser_pool": 2}}, raising=False)
+    conn = Connection()
+    monkeypatch.setattr(browser_pool, "connect", lambda: conn)
+
+    class Chromium:
+        def connect_over_cdp(self, endpoint):
+            return ConnectedBrowser()
+
+    class Playwright:
+        chromium = Chromium()
+
+    with browser_pool.pooled_browser(Playwright()) as browser:
+        context = browser.new_context()
+        context.new_page(), context.new_page()
+    assert conn.sent == ["acquire", ("release", 2)]
+    assert browser.browser.closed
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from TTS.cache import TTSCache
+from utils import settings
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {
+            "settings": {"tts": {"voice_choice": "tiktok", "tiktok_voice": "en_us_001"}},
+            "reddit": {"thread": {"post_lang": ""}},
+        },
+        raising=False,
+    )
+
+
+def clip(tmp_path, name: str, size: int = 1000) -> str:
+    path = tmp_path / f"{name}.mp3"
+    path.write_bytes(name.encode() * (size // len(name)))
+    return str(path)
+
+
+def test_stored_clip_is_returned(tmp_path):
+    cache = TTSCache("TikTok", str(tmp_path / "cache"), 1)
+    cache.put("Hello  there", clip(tmp_path, "hello"), 1.5)
+    assert cache.get("Hello there", str(tmp_path / "copy.mp3")) == 1.5  # whitespace is normalized
+    assert (tmp_path / "copy.mp3").read_bytes() == (tmp_path / "hello.mp3").read_bytes()
+    assert not list((tmp_path / "cache").glob("*/*.tmp"))
+
+
+def test_unknown_text_is_a_miss(tmp_path):
+    cache = TTSCache("TikTok", str(tmp_path / "cache"), 1)
+    assert cache.get("never said", str(tmp_path / "copy.mp3")) is None
+    assert not (tmp_path / "copy.mp3").exists()
+
+
+def test_key_depends_on_provider_voice_and_language():
+    key = TTSCache("TikTok", "cache", 1).key("hello")
+    assert TTSCache("GTTS", "cache", 1).key("hello") != key
+    settings.config["settings"]["tts"]["tiktok_voice"] = "en_us_002"
+    assert TTSCache("TikTok", "cache", 1).key("hello") != key
+    settings.config["settings"]["tts"]["tiktok_voice"] = "en_us_001"
+    settings.config["reddit"]["thread"]["post_lang"] = "de"
+    assert TTSCache("TikTok", "cache", 1).key("hello") != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = TTSCache("TikTok", str(tmp_path / "cache"), 2500 / 1024 / 1024)
+    cache.put("first", clip(tmp_path, "first"), 1.0)
+    cache.put("second", clip(tmp_path, "second"), 1.0)
+    os.utime(f"{cache.entry(cache.key('first'))}.mp3", (100, 100))
+    os.utime(f"{cache.entry(cache.key('second'))}.mp3", (200, 200))
+    assert cache.get("first", str(tmp_path / "copy.mp3")) == 1.0  # now the most recently used
+
+    cache.put("third", clip(tmp_path, "third"), 1.0)
+    assert cache.get("second", str(tmp_path / "copy.mp3")) is None
+    assert cache.get("first", str(tmp_path / "copy.mp3")) == 1.0
+    assert cache.get("third", str(tmp_path / "copy.mp3")) == 1.0
+    assert not os.path.exists(f"{cache.entry(cache.key('second'))}.json")
+    assert cache.size <= cache.quota
+
+
+def test_disabled_without_a_quota():
+    settings.config["settings"]["tts"].update(cache_size_mb=0, cache_dir="cache")
+    assert TTSCache.from_config("TikTok") is None
+    settings.config["settings"]["tts"]["cache_size_mb"] = 10
+    assert TTSCache.from_config("TikTok").quota == 10 * 1024 * 1024
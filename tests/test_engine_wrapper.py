@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from TTS import planner
+from TTS.engine_wrapper import TTSEngine, chunk_text, punctuate
+from utils import settings
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, "RATES_FILE", str(tmp_path / "tts_rates.json"))
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {
+            "settings": {
+                "storymode": False,
+                "tts": {
+                    "tts_concurrency": 4,
+                    "random_voice": False,
+                    "silence_duration": 0.3,
+                    "no_emojis": False,
+                },
+            },
+            "reddit": {"thread": {"post_lang": ""}},
+        },
+        raising=False,
+    )
+
+
+def provider(seconds_per_comment: float):
+    """Returns a provider that says the title in 1 second and every comment in the given time."""
+
+    class Provider:
+        max_chars = 1000
+        max_concurrency = 4
+        calls = []
+        lock = threading.Lock()
+
+        def run(self, text, filepath, random_voice=False):
+            with self.lock:
+                self.calls.append(text)
+            time.sleep(0.02)
+            with open(filepath, "w", encoding="utf-8") as f:
+                f.write(text)
+            return 1.0 if text.startswith("Title") else seconds_per_comment
+
+    return Provider
+
+
+def thread(comments: int) -> dict:
+    return {
+        "thread_id": "abc",
+        "thread_title": "Title",
+        "comments": [
+            {"comment_body": f"Comment number {idx}", "comment_id": str(idx)}
+            for idx in range(comments)
+        ],
+    }
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_every_comment_is_used_when_they_fit(tmp_path, concurrency):
+    settings.config["settings"]["tts"]["tts_concurrency"] = concurrency
+    engine = TTSEngine(provider(5.0), thread(6), path=f"{tmp_path}/", max_length=50)
+    assert engine.run() == (31.0, 6)
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_comments_past_the_max_length_are_cut_off(tmp_path, concurrency):
+    settings.config["settings"]["tts"]["tts_concurrency"] = concurrency
+    Provider = provider(10.0)
+    engine = TTSEngine(Provider, thread(30), path=f"{tmp_path}/", max_length=50)
+    length, number_of_comments = engine.run()
+    assert length <= 50
+    assert number_of_comments == 4
+    # no comments are started once the finished ones are past the max length
+    assert len(Provider.calls) - 1 <= number_of_comments + 1 + concurrency
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_last_comment_past_the_max_length_is_cut_off(tmp_path, concurrency):
+    settings.config["settings"]["tts"]["tts_concurrency"] = concurrency
+    engine = TTSEngine(provider(10.0), thread(5), path=f"{tmp_path}/", max_length=50)
+    assert engine.run() == (41.0, 4)
+
+
+def test_links_are_removed_and_paragraphs_end_with_periods():
+    assert punctuate("See https://example.com/a?b=1\nAI is fun") == "See  . A.I is fun."
+    assert punctuate('He said "no."') == 'He said "no".'
+
+
+def test_short_text_is_one_part():
+    assert chunk_text("Hello there. How are you?", 100) == ["Hello there. How are you?"]
+
+
+def test_sentences_are_packed_into_as_few_parts_as_fit():
+    text = "One two. Three four. Five six. Seven eight."
+    assert chunk_text(text, 20) == ["One two. Three four.", "Five six.", "Seven eight."]
+
+
+def test_long_sentence_is_split_after_clauses():
+    text = "First clause here, second clause here; third clause here."
+    assert chunk_text(text, 20) == [
+        "First clause here,",
+        "second clause here;",
+        "third clause here.",
+    ]
+
+
+def test_words_longer_than_a_part_are_cut():
+    assert chunk_text("a" * 25, 10) == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_decimals_and_urls_stay_in_their_sentence():
+    assert chunk_text("It costs 3.50 at example.com today. Cheap!", 40) == [
+        "It costs 3.50 at example.com today.",
+        "Cheap!",
+    ]
+
+
+@pytest.mark.parametrize("max_chars", [5, 17, 60, 300])
+def test_parts_fit_and_keep_every_word(max_chars):
+    text = (
+        "Well, I think that's a great question! My grandmother, who lived in Ohio, "
+        "used to say: never trust a cat.\nAnyway... that's my story? Yes."
+    )
+    parts = chunk_text(text, max_chars)
+    assert all(0 < len(part) <= max_chars for part in parts)
+    assert "".join("".join(parts).split()) == "".join(text.split())
+
+
+def test_empty_text_has_no_parts():
+    assert chunk_text("   ", 10) == []
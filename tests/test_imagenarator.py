@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from utils import settings  # noqa: E402
+from utils.imagenarator import comment_card  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    monkeypatch.chdir(ROOT)  # the fonts are looked up from the root of the repository
+    monkeypatch.setattr(settings, "config", {"reddit": {"thread": {"post_lang": ""}}}, raising=False)
+
+
+@pytest.mark.parametrize("text", ["A comment that is read out loud.", "", "   "])
+def test_comment_card_is_saved(tmp_path, text):
+    comment_card(text, str(tmp_path / "comment_0.png"), (33, 33, 36, 255), (240, 240, 240))
+    assert (tmp_path / "comment_0.png").exists()
@@ -0,0 +1,168 @@
+import time
+from contextlib import closing
+
+import pytest
+
+from utils import jobs
+
+WORKER = "host:1"
+
+
+@pytest.fixture(autouse=True)
+def jobs_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "current_job", None)
+    monkeypatch.setattr(jobs, "current_worker", None)
+
+
+def expire_leases():
+    with closing(jobs.open_db()) as db:
+        db.execute("UPDATE jobs SET heartbeat = 0 WHERE status = 'running'")
+
+
+def work_on(job: dict) -> None:
+    jobs.current_job, jobs.current_worker = job["id"], job["worker"]
+
+
+def test_jobs_are_claimed_by_priority_then_age():
+    low = jobs.enqueue("low")
+    high = jobs.enqueue("high", priority=5)
+    second_low = jobs.enqueue("low2")
+    assert [jobs.claim_job(WORKER)["id"] for _ in range(3)] == [high, low, second_low]
+    assert jobs.claim_job(WORKER) is None
+
+
+def test_claim_marks_the_job_running():
+    job_id = jobs.enqueue()
+    job = jobs.claim_job("worker-1")
+    assert job["id"] == job_id
+    assert (job["status"], job["attempts"], job["worker"]) == ("running", 1, "worker-1")
+    assert jobs.get_job(job_id)["status"] == "running"
+    assert jobs.claim_job(WORKER) is None  # a running job isn't handed out twice
+
+
+def test_failed_job_is_requeued_until_max_attempts():
+    job_id = jobs.enqueue(max_attempts=2)
+    jobs.claim_job(WORKER)
+    assert jobs.finish_job(job_id, WORKER, "boom") == "queued"
+    jobs.claim_job(WORKER)
+    assert jobs.finish_job(job_id, WORKER, "boom again") == "failed"
+    assert jobs.get_job(job_id)["error"] == "boom again"
+    assert jobs.claim_job(WORKER) is None
+
+
+def test_done_job_is_not_claimed_again():
+    job_id = jobs.enqueue()
+    jobs.claim_job(WORKER)
+    assert jobs.finish_job(job_id, WORKER) == "done"
+    assert jobs.claim_job(WORKER) is None
+
+
+def test_expired_lease_is_requeued():
+    job_id = jobs.enqueue()
+    jobs.claim_job("dead worker")
+    expire_leases()
+    job = jobs.claim_job("new worker")
+    assert (job["id"], job["attempts"], job["worker"]) == (job_id, 2, "new worker")
+
+
+def test_expired_lease_counts_towards_max_attempts():
+    job_id = jobs.enqueue(max_attempts=1)
+    work_on(jobs.claim_job(WORKER))
+    assert jobs.reserve_thread("abc")
+    expire_leases()
+    assert jobs.claim_job(WORKER) is None
+    job = jobs.get_job(job_id)
+    assert (job["status"], job["error"], job["thread_id"]) == (
+        "failed",
+        "worker stopped responding",
+        None,
+    )
+
+
+def test_worker_that_lost_its_lease_cant_change_the_job():
+    job_id = jobs.enqueue()
+    work_on(jobs.claim_job("stale"))
+    expire_leases()
+    jobs.claim_job("new")
+
+    assert jobs.finish_job(job_id, "stale") is None
+    assert jobs.finish_job(job_id, "stale", "boom") is None
+    jobs.release_job(job_id, "stale")
+    with pytest.raises(jobs.LeaseLost):
+        jobs.reserve_thread("abc")
+    job = jobs.get_job(job_id)
+    assert (job["status"], job["worker"], job["attempts"]) == ("running", "new", 2)
+    assert jobs.finish_job(job_id, "new") == "done"
+
+
+def test_heartbeat_stops_once_the_lease_is_lost(monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.01)
+    job_id = jobs.enqueue()
+    jobs.claim_job("stale")
+    expire_leases()
+    jobs.claim_job("new")
+    with closing(jobs.open_db()) as db:
+        db.execute("UPDATE jobs SET heartbeat = 0")
+
+    stop = jobs.start_heartbeat(job_id, "stale")
+    assert stop.wait(5)
+    assert jobs.get_job(job_id)["heartbeat"] == 0  # the lease of "new" wasn't renewed
+
+
+def test_heartbeat_renews_the_lease(monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.01)
+    job_id = jobs.enqueue()
+    jobs.claim_job(WORKER)
+    expire_leases()
+    stop = jobs.start_heartbeat(job_id, WORKER)
+    deadline = time.monotonic() + 5
+    while not jobs.get_job(job_id)["heartbeat"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    assert jobs.get_job(job_id)["heartbeat"]
+    assert jobs.claim_job("other") is None
+
+
+def test_released_job_keeps_its_attempts():
+    job_id = jobs.enqueue(max_attempts=1)
+    jobs.claim_job(WORKER)
+    jobs.release_job(job_id, WORKER)
+    job = jobs.claim_job(WORKER)
+    assert (job["id"], job["attempts"]) == (job_id, 1)
+
+
+def test_only_queued_jobs_can_be_cancelled():
+    queued = jobs.enqueue()
+    running = jobs.enqueue(priority=1)
+    jobs.claim_job(WORKER)
+    assert not jobs.cancel_job(running)
+    assert jobs.cancel_job(queued)
+    assert jobs.get_job(queued)["status"] == "cancelled"
+    assert jobs.claim_job(WORKER) is None
+
+
+def test_two_running_jobs_cant_reserve_the_same_thread():
+    jobs.enqueue(), jobs.enqueue()
+    first, second = jobs.claim_job("first"), jobs.claim_job("second")
+    work_on(first)
+    assert jobs.reserve_thread("abc")
+    work_on(second)
+    assert "abc" in jobs.reserved_threads()
+    assert not jobs.reserve_thread("abc")
+    assert jobs.reserve_thread("def")
+
+
+def test_thread_is_free_again_once_its_job_failed_for_good():
+    jobs.enqueue(max_attempts=1), jobs.enqueue()
+    first = jobs.claim_job(WORKER)
+    work_on(first)
+    jobs.reserve_thread("abc")
+    jobs.finish_job(first["id"], WORKER, "boom")
+    work_on(jobs.claim_job(WORKER))
+    assert jobs.reserve_thread("abc")
+
+
+def test_reservations_are_skipped_outside_of_a_worker():
+    assert jobs.reserve_thread("abc")
+    assert jobs.reserved_threads() == set()
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from utils import settings
+from utils.manifest import checkpointed, load_checkpoint, save_checkpoint
+from utils.pipeline import Stage, run_stages
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "config", {"settings": {"zoom": 1}}, raising=False)
+    os.makedirs("assets/temp/abc/png")
+
+
+def write(path: str, content: str) -> None:
+    with open(f"assets/temp/abc/{path}", "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_checkpoint_is_valid_until_something_changes():
+    write("png/title.png", "title")
+    save_checkpoint("abc", "screenshots", [1, 2], "inputs", ["png/*.png"], ["settings.zoom"])
+    assert load_checkpoint("abc", "screenshots", "inputs", ["settings.zoom"]) == (True, [1, 2])
+
+    assert load_checkpoint("abc", "screenshots", "other inputs", ["settings.zoom"])[0] is False
+    settings.config["settings"]["zoom"] = 2
+    assert load_checkpoint("abc", "screenshots", "inputs", ["settings.zoom"])[0] is False
+
+
+def test_changed_or_missing_output_invalidates_the_checkpoint():
+    write("png/title.png", "title")
+    save_checkpoint("abc", "screenshots", None, files=["png/*.png"])
+    os.utime("assets/temp/abc/png/title.png", ns=(0, 0))
+    assert load_checkpoint("abc", "screenshots")[0] is False
+
+    save_checkpoint("abc", "screenshots", None, files=["png/*.png"])
+    os.remove("assets/temp/abc/png/title.png")
+    assert load_checkpoint("abc", "screenshots")[0] is False
+
+
+def test_missing_manifest_is_invalid():
+    assert load_checkpoint("abc", "tts") == (False, None)
+
+
+def test_checkpointed_stage_is_skipped_on_resume():
+    calls = []
+
+    def screenshots(count):
+        calls.append(count)
+        write("png/title.png", "title")
+        return [count, "done"]
+
+    def stages(resume):
+        stage = Stage("screenshots", screenshots, inputs=["count"], outputs=["n", "status"])
+        return [checkpointed(stage, "abc", files=["png/*.png"], resume=resume)]
+
+    assert run_stages(stages(resume=False), {"count": 3}) == {"count": 3, "n": 3, "status": "done"}
+    assert run_stages(stages(resume=True), {"count": 3}) == {"count": 3, "n": 3, "status": "done"}
+    assert calls == [3]
+    run_stages(stages(resume=True), {"count": 4})  # different inputs run the stage again
+    assert calls == [3, 4]
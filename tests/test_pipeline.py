@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from utils.pipeline import Stage, run_pipelined, run_stages
+
+
+def test_stages_run_in_dependency_order():
+    stages = [
+        Stage("double", lambda x: x * 2, inputs=["x"], outputs=["doubled"]),
+        Stage("add", lambda x, doubled: x + doubled, inputs=["x", "doubled"], outputs=["sum"]),
+        Stage("split", lambda total: (total // 2, total % 2), inputs=["sum"], outputs=["q", "r"]),
+    ]
+    context = run_stages(list(reversed(stages)), context={"x": 3})
+    assert context == {"x": 3, "doubled": 6, "sum": 9, "q": 4, "r": 1}
+
+
+def test_independent_stages_run_at_the_same_time():
+    both_started = threading.Barrier(2, timeout=5)
+
+    def wait_for_the_other():
+        both_started.wait()  # raises BrokenBarrierError if the stages ran one after another
+        return True
+
+    stages = [Stage(name, wait_for_the_other, outputs=[name]) for name in ("a", "b")]
+    assert run_stages(stages) == {"a": True, "b": True}
+
+
+def test_after_orders_stages_without_passing_values():
+    order = []
+    stages = [
+        Stage("second", lambda: order.append("second"), after=["first_done"]),
+        Stage("first", lambda: order.append("first") or True, outputs=["first_done"]),
+    ]
+    run_stages(stages, max_workers=1)
+    assert order == ["first", "second"]
+
+
+def test_error_of_a_stage_is_raised_and_dependents_dont_run():
+    ran = []
+
+    def fail():
+        raise RuntimeError("no thread found")
+
+    stages = [
+        Stage("reddit", fail, outputs=["reddit_object"]),
+        Stage("tts", lambda obj: ran.append(obj), inputs=["reddit_object"]),
+    ]
+    with pytest.raises(RuntimeError, match="no thread found"):
+        run_stages(stages)
+    assert ran == []
+
+
+def test_missing_input_is_rejected_before_anything_runs():
+    ran = []
+    stages = [
+        Stage("first", lambda: ran.append(1), outputs=["a"]),
+        Stage("second", lambda b: b, inputs=["b"]),
+    ]
+    with pytest.raises(ValueError, match="second"):
+        run_stages(stages)
+    assert ran == []
+
+
+def test_cycle_is_detected():
+    stages = [
+        Stage("a", lambda b: b, inputs=["b"], outputs=["a"]),
+        Stage("b", lambda a: a, inputs=["a"], outputs=["b"]),
+    ]
+    with pytest.raises(ValueError, match="cycle"):
+        run_stages(stages)
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_pipelined_items_are_consumed_in_order(depth):
+    consumed = []
+    run_pipelined(range(5), lambda item: item * 10, consumed.append, depth=depth)
+    assert consumed == [0, 10, 20, 30, 40]
+
+
+def test_pipelined_produce_error_is_raised_after_the_earlier_items():
+    consumed = []
+
+    def produce(item):
+        if item == 2:
+            raise ValueError("bad post")
+        return item
+
+    with pytest.raises(ValueError, match="bad post"):
+        run_pipelined(range(5), produce, consumed.append, depth=2)
+    assert consumed == [0, 1]
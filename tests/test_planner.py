@@ -0,0 +1,49 @@
+import pytest
+
+from TTS import planner
+from utils import settings
+
+
+@pytest.fixture(autouse=True)
+def rates_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, "RATES_FILE", str(tmp_path / "tts_rates.json"))
+    monkeypatch.setattr(settings, "config", {"reddit": {"thread": {"post_lang": ""}}}, raising=False)
+
+
+def comments(*lengths):
+    return [{"comment_body": "x" * length} for length in lengths]
+
+
+def test_comments_are_picked_in_order_until_the_budget_is_used():
+    assert planner.plan_comments(comments(10, 10, 10, 10), 30, len) == [0, 1, 2]
+
+
+def test_comment_that_doesnt_fit_is_skipped_for_a_shorter_one():
+    assert planner.plan_comments(comments(20, 50, 5, 5, 5), 30, len) == [0, 2, 3]
+
+
+def test_first_comment_is_always_picked():
+    assert planner.plan_comments(comments(100, 1), 30, len) == [0]
+    assert planner.plan_comments([], 30, len) == []
+
+
+def test_default_rate_until_something_was_recorded():
+    assert planner.chars_per_second("TikTok") == planner.DEFAULT_CHARS_PER_SECOND
+
+
+def test_rates_are_learned_per_provider_and_language():
+    planner.record_synthesis("TikTok", 300, 20.0)
+    planner.record_synthesis("TikTok", 100, 0.0)  # not timed, ignored
+    planner.record_synthesis("TikTok", 300, 10.0)
+    assert planner.chars_per_second("TikTok") == 20.0
+    assert planner.chars_per_second("GTTS") == planner.DEFAULT_CHARS_PER_SECOND
+    settings.config["reddit"]["thread"]["post_lang"] = "de"
+    assert planner.chars_per_second("TikTok") == planner.DEFAULT_CHARS_PER_SECOND
+
+
+def test_old_samples_count_for_less(monkeypatch):
+    monkeypatch.setattr(planner, "MAX_SAMPLE_CHARS", 1000)
+    planner.record_synthesis("TikTok", 1000, 100.0)  # 10 chars/s
+    planner.record_synthesis("TikTok", 1000, 50.0)  # 20 chars/s, halves the old total
+    rate = planner.load_rates()["TikTok/en"]
+    assert rate == {"chars": 1000, "seconds": 75.0}
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+import pytest
+
+from utils import playwright
+
+
+class Context:
+    """Stands in for a Playwright browser context, with the cookies it was given."""
+
+    def __init__(self, cookies=()):
+        self._cookies = list(cookies)
+
+    def cookies(self, urls=None):
+        return list(self._cookies)
+
+    def clear_cookies(self):
+        self._cookies = []
+
+    def add_cookies(self, cookies):
+        self._cookies.extend(cookies)
+
+    def storage_state(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"cookies": self._cookies, "origins": []}, f)
+
+
+def login_cookie(expires: float, value: str = "token") -> dict:
+    return {"name": playwright.SESSION_COOKIE, "value": value, "expires": expires}
+
+
+@pytest.fixture(autouse=True)
+def sessions_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(playwright, "SESSIONS_DIR", str(tmp_path / "sessions"))
+    return tmp_path / "sessions"
+
+
+def test_session_path_keeps_only_safe_characters(sessions_dir):
+    assert playwright.session_path("../some user!") == f"{sessions_dir}/someuser.json"
+
+
+def test_saved_session_is_loaded(sessions_dir):
+    playwright.save_session(Context([login_cookie(time.time() + 86400)]), "user")
+    assert playwright.load_session("user") == playwright.session_path("user")
+    assert os.listdir(sessions_dir) == ["user.json"]  # the temporary file was moved in place
+
+
+@pytest.mark.parametrize(
+    "cookies",
+    [
+        [],
+        [login_cookie(time.time() + 60)],  # expires within the margin
+        [login_cookie(-1)],  # only lasts as long as the browser
+        [login_cookie(time.time() + 86400, value="")],
+        [{"name": "other", "value": "x", "expires": time.time() + 86400}],
+    ],
+)
+def test_sessions_without_a_lasting_login_arent_loaded(cookies):
+    playwright.save_session(Context(cookies), "user")
+    assert playwright.load_session("user") is None
+
+
+def test_missing_or_broken_session_isnt_loaded(sessions_dir):
+    assert playwright.load_session("user") is None
+    sessions_dir.mkdir()
+    (sessions_dir / "user.json").write_text("{", encoding="utf-8")
+    assert playwright.load_session("user") is None
+
+
+def test_forgotten_session_is_removed():
+    playwright.save_session(Context([login_cookie(time.time() + 86400)]), "user")
+    playwright.forget_session("user")
+    playwright.forget_session("user")  # already gone
+    assert playwright.load_session("user") is None
+
+
+def test_is_logged_in():
+    assert playwright.is_logged_in(Context([login_cookie(time.time() + 86400)]))
+    assert not playwright.is_logged_in(Context([login_cookie(time.time() + 86400, value="")]))
+    assert not playwright.is_logged_in(Context())
+
+
+def test_clear_cookie_by_name():
+    context = Context([login_cookie(-1), {"name": "other", "value": "x"}])
+    playwright.clear_cookie_by_name(context, playwright.SESSION_COOKIE)
+    assert context.cookies() == [{"name": "other", "value": "x"}]
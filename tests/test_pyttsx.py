@@ -0,0 +1,98 @@
+import textwrap
+import threading
+
+import pytest
+
+from TTS import pyttsx
+
+# stands in for pyttsx3 in the worker process, an engine that never finishes the text "hang"
+FAKE_PYTTSX3 = """
+import time
+
+
+class Voice:
+    id = "voice"
+
+
+class Engine:
+    def __init__(self):
+        self.clips = []
+
+    def getProperty(self, name):
+        return [Voice(), Voice()]
+
+    def setProperty(self, name, value):
+        pass
+
+    def save_to_file(self, text, filepath):
+        self.clips.append((text, filepath))
+
+    def runAndWait(self):
+        for text, filepath in self.clips:
+            if text == "hang":
+                time.sleep(60)
+            with open(filepath, "w", encoding="utf-8") as f:
+                f.write(text)
+        self.clips = []
+
+
+def init():
+    return Engine()
+"""
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    (tmp_path / "pyttsx3.py").write_text(textwrap.dedent(FAKE_PYTTSX3), encoding="utf-8")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    monkeypatch.setattr(pyttsx, "CLIP_TIMEOUT", 2)
+    worker = pyttsx.SpeechWorker()
+    yield worker
+    if worker.process is not None:
+        worker.kill()
+
+
+def test_clips_are_saved(worker, tmp_path):
+    worker.synthesize("Hello", str(tmp_path / "0.mp3"), 0)
+    assert (tmp_path / "0.mp3").read_text(encoding="utf-8") == "Hello"
+
+
+def test_clips_of_several_threads_are_all_saved(worker, tmp_path):
+    threads = [
+        threading.Thread(
+            target=worker.synthesize, args=(f"Clip {idx}", str(tmp_path / f"{idx}.mp3"), 1)
+        )
+        for idx in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [(tmp_path / f"{idx}.mp3").read_text(encoding="utf-8") for idx in range(8)] == [
+        f"Clip {idx}" for idx in range(8)
+    ]
+
+
+def test_engine_errors_are_raised(worker, tmp_path):
+    with pytest.raises(RuntimeError, match="pyttsx3 failed"):
+        worker.synthesize("Hello", str(tmp_path / "0.mp3"), 5)  # there are only 2 voices
+    worker.synthesize("Hello", str(tmp_path / "0.mp3"), 0)  # the worker keeps running
+    assert (tmp_path / "0.mp3").exists()
+
+
+def test_hung_engine_is_restarted(worker, tmp_path):
+    with pytest.raises(RuntimeError, match="in time"):
+        worker.synthesize("hang", str(tmp_path / "0.mp3"), 0)
+    hung = worker.process
+    assert hung.poll() is not None
+    worker.synthesize("Hello", str(tmp_path / "1.mp3"), 0)
+    assert worker.process is not hung
+    assert (tmp_path / "1.mp3").read_text(encoding="utf-8") == "Hello"
+
+
+def test_worker_that_cant_start_the_engine_is_reported(worker, tmp_path, monkeypatch):
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "pyttsx3.py").write_text("raise OSError('no driver')\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path / "broken"))
+    with pytest.raises(RuntimeError, match="stopped"):
+        worker.synthesize("Hello", str(tmp_path / "0.mp3"), 0)
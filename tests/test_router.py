@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+import pytest
+
+from TTS import router
+
+
+def provider(name: str, fail: bool = False, delay: float = 0, max_chars: int = 1000):
+    """Returns a new provider class, so its stats aren't shared with other tests."""
+
+    class Provider:
+        calls = []
+
+        def __init__(self):
+            self.max_chars = max_chars
+
+        def run(self, text, filepath, random_voice=False):
+            self.calls.append(text)
+            time.sleep(delay)
+            if fail:
+                raise RuntimeError("provider is down")
+            with open(filepath, "w", encoding="utf-8") as f:
+                f.write(type(self).__name__)
+            return 1.0
+
+    Provider.__name__ = name  # names the partial files of hedged calls
+    return Provider
+
+
+def test_single_provider_is_called_directly(tmp_path):
+    main = provider("Main")()
+    duration, used = router.ProviderRouter([main]).run("hi", str(tmp_path / "0.mp3"))
+    assert (duration, used) == (1.0, main)
+    assert os.listdir(tmp_path) == ["0.mp3"]
+
+
+def test_failed_clip_is_retried_with_the_fallback(tmp_path):
+    main, fallback = provider("Main", fail=True)(), provider("Fallback")()
+    clip_router = router.ProviderRouter([main, fallback])
+    duration, used = clip_router.run("hi", str(tmp_path / "0.mp3"))
+    assert used is fallback
+    assert os.listdir(tmp_path) == ["0.mp3"]
+    assert clip_router.active == 0  # one failure isn't enough to move the video
+
+
+def test_video_moves_to_the_fallback_once_the_provider_keeps_failing(tmp_path):
+    main, fallback = provider("Main", fail=True)(), provider("Fallback")()
+    clip_router = router.ProviderRouter([main, fallback])
+    for idx in range(router.FAILURES_TO_FAIL_OVER):
+        clip_router.run("hi", str(tmp_path / f"{idx}.mp3"))
+    assert clip_router.active == 1
+    main.calls.clear()
+    clip_router.run("hi", str(tmp_path / "next.mp3"))
+    assert main.calls == []
+    # a new video starts with the fallback too, while the failures are recent
+    assert router.ProviderRouter([main, fallback]).active == 1
+
+
+def test_error_is_raised_when_every_provider_fails(tmp_path):
+    clip_router = router.ProviderRouter(
+        [provider("Main", fail=True)(), provider("Fallback", fail=True)()]
+    )
+    with pytest.raises(RuntimeError, match="provider is down"):
+        clip_router.run("hi", str(tmp_path / "0.mp3"))
+
+
+def test_text_too_long_for_a_fallback_only_goes_to_the_others():
+    main, short = provider("Main")(), provider("Short", max_chars=5)()
+    clip_router = router.ProviderRouter([main, short])
+    assert clip_router.candidates("a long text") == [main]
+    assert clip_router.candidates("hi") == [main, short]
+
+
+def test_slow_clip_is_hedged(tmp_path):
+    slow, fast = provider("Slow", delay=1)(), provider("Fast")()
+    for _ in range(router.MIN_LATENCY_SAMPLES):
+        router.provider_stats(slow).succeeded(0.01)
+    begin = time.monotonic()
+    duration, used = router.ProviderRouter([slow, fast], hedge_percentile=95).run(
+        "hi", str(tmp_path / "0.mp3")
+    )
+    assert used is fast
+    assert time.monotonic() - begin < 0.9
+    with open(tmp_path / "0.mp3", encoding="utf-8") as f:
+        assert f.read() == type(fast).__name__
+    time.sleep(1.2)  # the partial file of the slow call is removed once it's done
+    assert os.listdir(tmp_path) == ["0.mp3"]
+
+
+def test_latency_percentile_needs_enough_samples():
+    stats = router.ProviderStats()
+    for seconds in range(router.MIN_LATENCY_SAMPLES - 1):
+        stats.succeeded(seconds)
+    assert stats.latency_percentile(50) is None
+    stats.succeeded(100)
+    assert stats.latency_percentile(50) == 10
+    assert stats.latency_percentile(100) == 100
+
+
+def test_clip_waiting_for_a_slot_of_its_provider_isnt_hedged(tmp_path):
+    queued, fallback = provider("Queued")(), provider("Unused")()
+    for _ in range(router.MIN_LATENCY_SAMPLES):
+        router.provider_stats(queued).succeeded(0.2)
+    slots = router.provider_slots(queued)
+    slots.acquire()  # taken by another clip for longer than the calls usually take
+    threading.Timer(0.5, slots.release).start()
+    duration, used = router.ProviderRouter([queued, fallback], hedge_percentile=95).run(
+        "hi", str(tmp_path / "0.mp3")
+    )
+    assert used is queued
+    assert fallback.calls == []
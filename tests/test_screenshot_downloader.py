@@ -0,0 +1,231 @@
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("playwright")
+
+from playwright.sync_api import Error, TimeoutError  # noqa: E402
+
+from utils import settings  # noqa: E402
+from video_creation import screenshot_downloader  # noqa: E402
+
+
+class Locator:
+    def __init__(self, page, selector: str):
+        self.page = page
+        self.selector = selector
+
+    @property
+    def first(self):
+        return self
+
+    def is_visible(self) -> bool:
+        return self.selector in self.page.visible
+
+    def wait_for(self, state="visible", timeout=None) -> None:
+        if self.selector not in self.page.visible:
+            raise TimeoutError(f"waiting for {self.selector}")
+
+    def click(self) -> None:
+        self.page.clicked.append(self.selector)
+
+    def fill(self, value: str) -> None:
+        self.page.filled[self.selector] = value
+
+    def inner_text(self) -> str:
+        return self.page.texts.get(self.selector, "")
+
+    def screenshot(self, path: str) -> None:
+        if self.selector in self.page.broken:
+            raise Error(f"{self.selector} is detached")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.selector)
+
+
+class Page:
+    """Stands in for a Playwright page showing the elements of `visible`."""
+
+    def __init__(self, visible=(), broken=()):
+        self.visible = set(visible)
+        self.broken = set(broken)
+        self.clicked = []
+        self.closed = False
+        self.filled = {}
+        self.texts = {}
+        self.idle = True
+
+    def locator(self, selector: str) -> Locator:
+        return Locator(self, selector)
+
+    def close(self) -> None:
+        self.closed = True
+
+    def wait_for_load_state(self, state: str, timeout=None) -> None:
+        if not self.idle:
+            raise TimeoutError("waiting for the network to be idle")
+
+
+class Context:
+    """Opens pages that show the comment of the permalink they go to."""
+
+    def __init__(self, unreachable=(), loading=()):
+        self.unreachable = set(unreachable)
+        self.loading = set(loading)
+        self.pages = []
+        self.loaded_at_once = 0
+
+    def new_page(self) -> Page:
+        context = self
+
+        class PermalinkPage(Page):
+            def goto(self, url, wait_until=None, timeout=None):
+                comment_id = url.rstrip("/").split("/")[-1]
+                if comment_id in context.unreachable:
+                    raise Error(f"net::ERR_CONNECTION_RESET at {url}")
+                self.visible = set() if comment_id in context.loading else {f"#t1_{comment_id}"}
+                context.loaded_at_once = max(
+                    context.loaded_at_once, sum(bool(page.visible) for page in context.pages)
+                )
+
+        self.pages.append(PermalinkPage())
+        return self.pages[-1]
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "assets" / "temp" / "abc" / "png").mkdir(parents=True)
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {
+            "settings": {"zoom": 1},
+            "reddit": {
+                "thread": {"post_lang": ""},
+                "creds": {"username": "user", "password": "hunter2"},
+            },
+        },
+        raising=False,
+    )
+
+
+def comments(*ids) -> list:
+    return [
+        (idx, {"comment_id": comment_id, "comment_url": f"/r/test/comments/abc/_/{comment_id}/"})
+        for idx, comment_id in enumerate(ids)
+    ]
+
+
+def screenshots(tmp_path) -> list:
+    return sorted(path.name for path in (tmp_path / "assets" / "temp" / "abc" / "png").iterdir())
+
+
+def test_comments_on_the_page_are_captured_from_one_load(tmp_path):
+    page = Page(visible=["#t1_a", "#t1_b", "#t1_d"], broken=["#t1_d"])
+    missing = screenshot_downloader.screenshot_comments_on_page(
+        page, comments("a", "b", "c", "d"), "abc"
+    )
+    assert [idx for idx, _ in missing] == [2, 3]  # not on the page, and detached while captured
+    assert screenshots(tmp_path) == ["comment_0.png", "comment_1.png"]
+
+
+def test_content_gate_is_passed_before_the_comments(tmp_path):
+    page = Page(visible=['[data-testid="content-gate"]', "#t1_a"])
+    assert screenshot_downloader.screenshot_comments_on_page(page, comments("a"), "abc") == []
+    assert page.clicked == ['[data-testid="content-gate"] button']
+
+
+def test_comments_missing_from_the_page_are_all_returned():
+    page = Page()
+    missing = screenshot_downloader.screenshot_comments_on_page(page, comments("a", "b"), "abc")
+    assert missing == comments("a", "b")
+
+
+def test_comments_are_loaded_on_several_pages_at_once(tmp_path):
+    context = Context()
+    failed = screenshot_downloader.screenshot_comments_by_permalink(
+        context, comments("a", "b", "c", "d", "e"), "abc", pages=3
+    )
+    assert failed == []
+    assert screenshots(tmp_path) == [f"comment_{idx}.png" for idx in range(5)]
+    assert len(context.pages) == 3
+    assert context.loaded_at_once == 3
+    assert all(page.closed for page in context.pages)
+
+
+def test_failures_only_lose_their_own_comment(tmp_path):
+    context = Context(unreachable=["b"], loading=["d"])
+    failed = screenshot_downloader.screenshot_comments_by_permalink(
+        context, comments("a", "b", "c", "d", "e"), "abc", pages=2
+    )
+    assert [idx for idx, _ in failed] == [1, 3]
+    assert screenshots(tmp_path) == ["comment_0.png", "comment_2.png", "comment_4.png"]
+    assert all(page.closed for page in context.pages)
+
+
+def test_no_pages_are_opened_without_comments():
+    context = Context()
+    assert screenshot_downloader.screenshot_comments_by_permalink(context, [], "abc", 4) == []
+    assert context.pages == []
+
+
+def test_waiting_for_an_element_tells_whether_it_showed_up():
+    page = Page(visible=["#t1_a"])
+    assert screenshot_downloader.wait_until_ready(page, "#t1_a", "comment")
+    assert not screenshot_downloader.wait_until_ready(page, "#t1_b", "comment", timeout=10)
+
+
+def test_busy_network_doesnt_stop_the_screenshots():
+    page = Page()
+    page.idle = False
+    screenshot_downloader.wait_for_network_idle(page)
+
+
+class Cookies:
+    def __init__(self):
+        self.items = []
+
+    def cookies(self, urls=None):
+        return list(self.items)
+
+
+class LoginPage(Page):
+    """The login form of Reddit, which sets the session cookie after `delay` polls."""
+
+    def __init__(self, delay: int, error: str = ""):
+        super().__init__(visible=['input[name="username"]'])
+        self.context = Cookies()
+        self.delay = delay
+        self.polls = 0
+        if error:
+            self.visible.add(".AnimatedForm__errorMessage")
+            self.texts[".AnimatedForm__errorMessage"] = error
+            self.delay = None
+
+    def goto(self, url, wait_until=None, timeout=None):
+        pass
+
+    def set_viewport_size(self, size):
+        pass
+
+    def get_by_role(self, role, name):
+        return Locator(self, f"{role}:{name}")
+
+    def wait_for_timeout(self, milliseconds):
+        self.polls += 1
+        if self.polls == self.delay:
+            self.context.items.append({"name": "reddit_session", "value": "token"})
+
+
+def test_login_is_done_as_soon_as_the_session_cookie_is_set():
+    page = LoginPage(delay=3)
+    screenshot_downloader.log_in(page)
+    assert page.filled == {'input[name="username"]': "user", 'input[name="password"]': "hunter2"}
+    assert page.clicked == ["button:Log In"]
+    assert page.polls == 3
+
+
+def test_wrong_credentials_stop_the_run():
+    page = LoginPage(delay=3, error="Incorrect username or password")
+    with pytest.raises(SystemExit):
+        screenshot_downloader.log_in(page)
+    assert page.polls == 0
@@ -0,0 +1,169 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from TTS.streamlabs_polly import StreamlabsPolly
+from utils import settings, transport
+
+
+class Server(ThreadingHTTPServer):
+    """Answers the requests to every path with the responses queued for it, the last one repeats."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.responses = {}
+        self.requests = Counter()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def respond(self, path: str, *responses) -> str:
+        self.responses[path] = list(responses)
+        return self.url + path
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests[self.path] += 1
+        queued = self.server.responses[self.path]
+        status, headers, body = queued.pop(0) if len(queued) > 1 else queued[0]
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def transport_state(monkeypatch):
+    monkeypatch.setattr(transport, "_session", None)
+    monkeypatch.setattr(transport, "retry_counts", Counter())
+    waits = []
+    monkeypatch.setattr(transport.time, "sleep", waits.append)
+    return waits
+
+
+def test_server_errors_are_retried(server, transport_state):
+    url = server.respond("/speak", (503, {}, b""), (502, {}, b""), (200, {}, b"ok"))
+    response = transport.request("GET", url, backoff_base=1)
+    assert (response.status_code, response.content) == (200, b"ok")
+    assert server.requests["/speak"] == 3
+    assert transport.retry_counts["127.0.0.1"] == 2
+    # full jitter, up to the base doubled on every retry
+    assert 0 <= transport_state[0] <= 1 and 0 <= transport_state[1] <= 2
+
+
+def test_last_error_is_returned_once_the_retries_are_used(server, transport_state):
+    url = server.respond("/speak", (500, {}, b"down"))
+    response = transport.request("GET", url, retries=2)
+    assert (response.status_code, response.content) == (500, b"down")
+    assert server.requests["/speak"] == 3
+    assert len(transport_state) == 2
+
+
+def test_client_errors_arent_retried(server):
+    url = server.respond("/speak", (400, {}, b"bad"))
+    assert transport.request("GET", url).status_code == 400
+    assert server.requests["/speak"] == 1
+
+
+def test_rate_limit_is_waited_for_as_long_as_asked(server, transport_state):
+    url = server.respond("/speak", (429, {"Retry-After": "7"}, b""), (200, {}, b"ok"))
+    assert transport.request("GET", url).status_code == 200
+    assert transport_state == [7.0]
+
+
+def test_rate_limit_longer_than_max_wait_is_returned(server, transport_state):
+    url = server.respond("/speak", (429, {"Retry-After": "600"}, b""), (200, {}, b"ok"))
+    assert transport.request("GET", url, max_wait=120).status_code == 429
+    assert server.requests["/speak"] == 1
+    assert transport_state == []
+
+
+def test_connection_errors_are_retried_then_raised(transport_state):
+    with pytest.raises(requests.ConnectionError):
+        transport.request("GET", "http://127.0.0.1:9/speak", retries=2, timeout=1)
+    assert len(transport_state) == 2
+    assert transport.retry_counts["127.0.0.1"] == 2
+
+
+def test_streamed_response_is_closed_before_it_is_retried(server):
+    # with one connection, the retry waits forever for the first response to give it back
+    transport.get_session().mount(
+        "http://", HTTPAdapter(pool_connections=1, pool_maxsize=1, pool_block=True)
+    )
+    url = server.respond("/audio", (503, {}, b"x" * 100_000), (200, {}, b"audio"))
+    with transport.request("GET", url, stream=True) as response:
+        assert response.content == b"audio"
+
+
+def test_rate_limit_wait_headers():
+    response = requests.Response()
+    assert transport.rate_limit_wait(response) is None
+    response.headers["Retry-After"] = "2.5"
+    assert transport.rate_limit_wait(response) == 2.5
+    response.headers["X-RateLimit-Reset"] = "0"  # in the past
+    assert transport.rate_limit_wait(response) == 0.0
+
+
+@pytest.fixture
+def streamlabs(server, monkeypatch):
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {"settings": {"tts": {"streamlabs_polly_voice": "Brian"}}},
+        raising=False,
+    )
+    provider = StreamlabsPolly()
+    provider.url = server.url + "/polly/speak"
+    return provider
+
+
+def test_streamlabs_saves_the_audio(server, streamlabs, tmp_path):
+    audio_url = server.respond("/audio.mp3", (200, {}, b"audio"))
+    server.respond("/polly/speak", (200, {}, json.dumps({"speak_url": audio_url}).encode()))
+    streamlabs.run("Hello", str(tmp_path / "clip.mp3"))
+    assert (tmp_path / "clip.mp3").read_bytes() == b"audio"
+
+
+@pytest.mark.parametrize(
+    "response, error",
+    [
+        ((200, {}, json.dumps({"error": "Voice not found"}).encode()), RuntimeError),
+        ((200, {}, json.dumps({"error": "No text specified!"}).encode()), ValueError),
+        ((403, {}, b"<html>Forbidden</html>"), RuntimeError),
+    ],
+)
+def test_streamlabs_errors_are_raised(server, streamlabs, tmp_path, response, error):
+    server.respond("/polly/speak", response)
+    with pytest.raises(error):
+        streamlabs.run("Hello", str(tmp_path / "clip.mp3"))
+    assert not (tmp_path / "clip.mp3").exists()
+
+
+def test_streamlabs_raises_when_the_audio_cant_be_downloaded(server, streamlabs, tmp_path):
+    audio_url = server.respond("/audio.mp3", (404, {}, b""))
+    server.respond("/polly/speak", (200, {}, json.dumps({"speak_url": audio_url}).encode()))
+    with pytest.raises(RuntimeError):
+        streamlabs.run("Hello", str(tmp_path / "clip.mp3"))
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+
+import pytest
+
+from utils import jobs, settings, videos
+
+
+@pytest.fixture(autouse=True)
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(videos, "VIDEOS_DB", str(tmp_path / "videos.db"))
+    monkeypatch.setattr(videos, "VIDEOS_JSON", str(tmp_path / "videos.json"))
+    monkeypatch.setattr(videos, "_local", threading.local())  # no connection to an earlier db
+    monkeypatch.setattr(videos, "in_progress", set())
+    monkeypatch.setattr(jobs, "current_job", None)
+    monkeypatch.setattr(settings, "config", {"reddit": {"thread": {"post_id": ""}}}, raising=False)
+
+
+class Submission(str):
+    """Stands in for a praw Submission, which str() turns into its id."""
+
+
+def test_saved_videos_are_done():
+    assert not videos.is_done("abc")
+    videos.save_data("AskReddit", "video.mp4", "Title", "abc", "credit")
+    assert videos.is_done("abc")
+    assert videos.done_videos() == [
+        {
+            "id": "abc",
+            "subreddit": "AskReddit",
+            "time": videos.done_videos()[0]["time"],
+            "background_credit": "credit",
+            "reddit_title": "Title",
+            "filename": "video.mp4",
+        }
+    ]
+
+
+def test_saving_a_video_twice_keeps_the_first():
+    videos.save_data("AskReddit", "first.mp4", "Title", "abc", "credit")
+    videos.save_data("AskReddit", "second.mp4", "Title", "abc", "credit")
+    assert [video["filename"] for video in videos.done_videos()] == ["first.mp4"]
+
+
+def test_old_json_history_is_imported_once():
+    with open(videos.VIDEOS_JSON, "w", encoding="utf-8") as f:
+        json.dump([{"id": "old", "filename": "old.mp4"}, {"no id": True}], f)
+    assert videos.is_done("old")
+    assert not os.path.exists(videos.VIDEOS_JSON)
+    assert os.path.exists(f"{videos.VIDEOS_JSON}.migrated")
+    assert [(video["id"], video["subreddit"]) for video in videos.done_videos()] == [("old", "")]
+
+
+def test_concurrent_imports_dont_fail():
+    with open(videos.VIDEOS_JSON, "w", encoding="utf-8") as f:
+        json.dump([{"id": str(idx)} for idx in range(100)], f)
+    errors = []
+
+    def open_db():
+        try:
+            videos.open_db()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=open_db) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(videos.done_videos()) == 100
+
+
+def test_threads_in_progress_are_skipped_until_saved():
+    assert videos.check_done(Submission("abc")) == "abc"
+    assert videos.mark_in_progress("abc")
+    assert videos.check_done(Submission("abc")) is None
+    videos.save_data("AskReddit", "video.mp4", "Title", "abc", "credit")
+    assert "abc" not in videos.in_progress
+    assert videos.check_done(Submission("abc")) is None  # done now
+
+
+def test_post_asked_for_by_id_is_made_again():
+    videos.save_data("AskReddit", "video.mp4", "Title", "abc", "credit")
+    settings.config["reddit"]["thread"]["post_id"] = "abc"
+    assert videos.check_done(Submission("abc")) == "abc"
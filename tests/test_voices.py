@@ -0,0 +1,70 @@
+import pytest
+
+from TTS import planner
+from utils import settings
+from video_creation import voices
+
+
+class Provider:
+    max_chars = 100
+    max_concurrency = 1
+
+    def run(self, text, filepath, random_voice=False):
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(text)
+        return 1.0
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, "RATES_FILE", str(tmp_path / "tts_rates.json"))
+    monkeypatch.setitem(voices.TTSProviders, "Provider", Provider)
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {
+            "settings": {
+                "storymode": False,
+                "tts": {
+                    "voice_choice": "provider",
+                    "fallback_choice": "",
+                    "tts_concurrency": 1,
+                    "random_voice": False,
+                    "silence_duration": 5,
+                    "no_emojis": False,
+                },
+            },
+            "reddit": {"thread": {"post_lang": ""}},
+        },
+        raising=False,
+    )
+
+
+def thread(*bodies) -> dict:
+    return {
+        "thread_id": "abc",
+        "thread_title": "Title",
+        "comments": [
+            {"comment_body": body, "comment_id": str(idx)} for idx, body in enumerate(bodies)
+        ],
+    }
+
+
+def test_split_comments_are_planned_with_their_silence():
+    # 140 characters are 10 seconds, and 5 seconds of silence as they are split
+    reddit_obj, number_of_comments = voices.plan_video(thread(*["x" * 139] * 5))
+    assert number_of_comments == 3
+    assert reddit_obj["comments"] == thread(*["x" * 139] * 3)["comments"]
+
+
+def test_links_arent_planned_as_speech():
+    link = "https://example.com/" + "a" * 600
+    _, number_of_comments = voices.plan_video(thread(*[f"Look {link}"] * 10))
+    assert number_of_comments == 10
+
+
+def test_tts_doesnt_change_the_comments_it_was_given(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reddit_obj = thread("First\nsecond", "See https://example.com")
+    assert voices.save_text_to_mp3(reddit_obj) == (3.0, 2)
+    assert reddit_obj == thread("First\nsecond", "See https://example.com")
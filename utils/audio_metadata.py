@@ -0,0 +1,331 @@
+import functools
+import struct
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# bitrates in kbit/s by [MPEG 1][layer] and [MPEG 2/2.5][layer], indexed by the bitrate bits
+BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# sample rates by the version bits, 3 is MPEG 1, 2 is MPEG 2 and 0 is MPEG 2.5
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class Mp3Frame(NamedTuple):
+    """The fields of an MP3 frame header that matter to find and time the frames."""
+
+    version: int  # version bits, 3 is MPEG 1, 2 is MPEG 2 and 0 is MPEG 2.5
+    layer: int  # 1, 2 or 3
+    bitrate: int  # bit/s
+    sample_rate: int
+    padding: int
+    mono: bool
+    length: int  # bytes, including the header
+    samples: int  # samples per channel in the frame
+    header: bytes
+
+
+def parse_frame_header(header: bytes) -> Optional[Mp3Frame]:
+    """Parses the 4 byte header of an MP3 frame, None if the bytes aren't a valid header."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None  # reserved values, or free format which can't be timed from the header
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return Mp3Frame(
+        version,
+        layer,
+        bitrate,
+        sample_rate,
+        padding,
+        header[3] >> 6 == 3,
+        length,
+        samples,
+        bytes(header[:4]),
+    )
+
+
+def skip_id3v2(data: bytes) -> int:
+    """Returns the offset of the first byte after the ID3v2 tags at the start of the data."""
+    offset = 0
+    while data[offset : offset + 3] == b"ID3" and len(data) >= offset + 10:
+        size = 0
+        for byte in data[offset + 6 : offset + 10]:  # syncsafe integer, 7 bits per byte
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if data[offset + 5] & 0x10 else 0
+        offset += 10 + size + footer
+    return offset
+
+
+def find_first_frame(data: bytes, offset: int = 0) -> Optional[int]:
+    """Returns the offset of the first frame header that is followed by another frame, or by the end of the data."""
+    while (offset := data.find(b"\xff", offset)) != -1:
+        frame = parse_frame_header(data[offset : offset + 4])
+        if frame is not None:
+            following = offset + frame.length
+            if following >= len(data) - 128 or parse_frame_header(data[following : following + 4]):
+                return offset
+        offset += 1
+    return None
+
+
+def vbr_header(data: bytes, offset: int, frame: Mp3Frame) -> Tuple[bool, Optional[int]]:
+    """Checks if the frame at offset is a Xing/Info or VBRI header instead of audio.
+
+    Returns:
+        tuple[bool,Optional[int]]: (whether it's a header, the frame count it stores if it has one)
+    """
+    if frame.version == 3:
+        side_info = 17 if frame.mono else 32
+    else:
+        side_info = 9 if frame.mono else 17
+    xing = offset + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        (flags,) = struct.unpack(">I", data[xing + 4 : xing + 8])
+        if flags & 1:
+            return True, struct.unpack(">I", data[xing + 8 : xing + 12])[0]
+        return True, None
+    vbri = offset + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        return True, struct.unpack(">I", data[vbri + 14 : vbri + 18])[0]
+    return False, None
+
+
+def mp3_duration(data: bytes) -> float:
+    """Returns the duration of an MP3 in seconds.
+
+    Uses the frame count of the Xing/Info or VBRI header when there is one, otherwise the
+    frames are walked, which is exact for CBR files and files joined from different bitrates.
+    """
+    first = find_first_frame(data, skip_id3v2(data))
+    if first is None:
+        raise ValueError("No MP3 frames found")
+    frame = parse_frame_header(data[first : first + 4])
+    _, frames = vbr_header(data, first, frame)
+    if frames is not None:
+        return frames * frame.samples / frame.sample_rate
+
+    duration = 0.0
+    offset = first
+    while (frame := parse_frame_header(data[offset : offset + 4])) is not None:
+        if offset + frame.length > len(data):
+            break  # truncated last frame
+        duration += frame.samples / frame.sample_rate
+        offset += frame.length
+    return duration
+
+
+def mp3_audio_frames(data: bytes) -> Tuple[Mp3Frame, bytes]:
+    """Returns the header of the first audio frame and the bytes of all audio frames of an MP3.
+
+    ID3 tags and the Xing/Info or VBRI frame are left out, they describe the file they came from.
+    """
+    first = find_first_frame(data, skip_id3v2(data))
+    if first is None:
+        raise ValueError("No MP3 frames found")
+    frame = parse_frame_header(data[first : first + 4])
+    if vbr_header(data, first, frame)[0]:
+        first += frame.length
+    end = first
+    while (frame := parse_frame_header(data[end : end + 4])) is not None:
+        if end + frame.length > len(data):
+            break
+        end += frame.length
+    header = parse_frame_header(data[first : first + 4])
+    if header is None:
+        raise ValueError("No MP3 audio frames found")
+    return header, data[first:end]
+
+
+@functools.lru_cache(maxsize=32)
+def silent_mp3_frames(header: bytes, duration: float) -> bytes:
+    """Returns Layer III frames of silence in the format of the given frame header.
+
+    A frame whose side information and main data are all zeros decodes to silence,
+    so no encoder is needed. The frames are rounded to the closest whole number.
+
+    Args:
+        header (bytes): Header of a Layer III frame of the audio the silence goes with
+        duration (float): Length of the silence in seconds
+    """
+    # same version, bitrate, sample rate and channels, without padding and CRC
+    header = bytes([header[0], header[1] | 0x01, header[2] & 0xFD, header[3]])
+    frame = parse_frame_header(header)
+    if frame is None or frame.layer != 3:
+        raise ValueError("Silence can only be made for Layer III frames")
+    count = round(duration * frame.sample_rate / frame.samples)
+    return (header + bytes(frame.length - 4)) * count
+
+
+def join_mp3(paths: Iterable[str], output: str, silence: float = 0) -> float:
+    """Joins MP3 files by copying their audio frames into one file, without running ffmpeg.
+
+    Args:
+        paths (Iterable[str]): The files to join, in order
+        output (str): Path of the joined file
+        silence (float): Seconds of silence added after the last file
+
+    Returns:
+        float: The duration of the joined file in seconds
+
+    Raises:
+        ValueError: A file isn't an MP3, or the files differ in MPEG version, sample rate or channels
+    """
+    parts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            try:
+                parts.append(mp3_audio_frames(f.read()))
+            except struct.error as error:
+                raise ValueError(f"{path} is truncated") from error
+    formats = {(frame.version, frame.sample_rate, frame.mono) for frame, _ in parts}
+    if len(formats) != 1:
+        raise ValueError(f"Can't join MP3 files of different formats: {formats}")
+    audio = b"".join(frames for _, frames in parts)
+    if silence:
+        audio += silent_mp3_frames(parts[-1][0].header, silence)
+    with open(output, "wb") as f:
+        f.write(audio)
+    return mp3_duration(audio)
+
+
+class Mp3StreamDuration:
+    """Times an MP3 while it is being received, keeping at most one frame in memory.
+
+    Feed it the chunks in order, then read duration. It is None until the first frame is found,
+    and stays None if the stream isn't an MP3.
+    """
+
+    def __init__(self):
+        self.duration = None
+        self.pending = b""
+        self.skip = 0  # bytes of an ID3v2 tag that are still to come
+        self.done = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self.done:
+            return
+        data = self.pending + chunk
+        offset = min(self.skip, len(data))
+        self.skip -= offset
+        if self.duration is None:
+            offset = self.find_start(data, offset)
+            if offset is None:
+                return
+        while offset + 4 <= len(data):
+            frame = parse_frame_header(data[offset : offset + 4])
+            if frame is None:
+                self.done = True  # e.g. the ID3v1 tag at the end
+                break
+            if offset + frame.length > len(data):
+                break
+            self.duration += frame.samples / frame.sample_rate
+            offset += frame.length
+        self.pending = data[offset:]
+
+    def find_start(self, data: bytes, offset: int) -> Optional[int]:
+        """Skips ID3v2 tags and the Xing/VBRI frame, returns None while more data is needed."""
+        while data[offset : offset + 3] == b"ID3":
+            if len(data) < offset + 10:
+                self.pending = data[offset:]
+                return None
+            tag_end = skip_id3v2(data[offset : offset + 10]) + offset
+            if tag_end > len(data):
+                self.skip = tag_end - len(data)
+                self.pending = b""
+                return None
+            offset = tag_end
+        if len(data) - offset < 4:
+            self.pending = data[offset:]
+            return None
+        frame = parse_frame_header(data[offset : offset + 4])
+        if frame is None:
+            self.done = True
+            return None
+        if len(data) - offset < frame.length:
+            self.pending = data[offset:]
+            return None
+        is_header, frames = vbr_header(data, offset, frame)
+        if frames is not None:
+            self.duration = frames * frame.samples / frame.sample_rate
+            self.done = True
+            return None
+        self.duration = 0.0
+        return offset + frame.length if is_header else offset
+
+
+def save_stream(chunks: Iterable[bytes], filepath: str) -> Optional[float]:
+    """Writes a stream of audio to a file as it arrives, instead of keeping it in memory.
+
+    Returns:
+        Optional[float]: The duration of the audio if it's an MP3, None otherwise
+    """
+    duration = Mp3StreamDuration()
+    with open(filepath, "wb") as f:
+        for chunk in chunks:
+            if chunk:
+                f.write(chunk)
+                duration.feed(chunk)
+    return duration.duration
+
+
+def wav_duration(data: bytes) -> float:
+    """Returns the duration of a RIFF WAVE file in seconds."""
+    offset = 12
+    byte_rate = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset : offset + 4]
+        (size,) = struct.unpack("<I", data[offset + 4 : offset + 8])
+        if chunk_id == b"fmt ":
+            (byte_rate,) = struct.unpack("<I", data[offset + 16 : offset + 20])
+        elif chunk_id == b"data":
+            if byte_rate is None:
+                break
+            # streamed files don't know their size when the header is written
+            size = min(size, len(data) - offset - 8)
+            return size / byte_rate
+        offset += 8 + size + (size & 1)  # chunks are padded to an even size
+    raise ValueError("WAV file without fmt or data chunk")
+
+
+def get_duration(path: str) -> float:
+    """Returns the duration in seconds of an MP3 or WAV file, read from its headers without running ffmpeg.
+
+    Args:
+        path (str): Path of the audio file
+
+    Returns:
+        float: The duration in seconds
+
+    Raises:
+        ValueError: The file isn't an MP3 or WAV file
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] in (b"FORM", b"OggS", b"fLaC") or data[4:8] == b"ftyp":
+        raise ValueError(
+            "Only MP3 and WAV files can be read"
+        )  # their audio could pass as MP3 frames
+    try:
+        if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+            return wav_duration(data)
+        return mp3_duration(data)
+    except struct.error as error:
+        raise ValueError(f"{path} is truncated") from error
@@ -0,0 +1,373 @@
+"""Keeps Chromium running between videos, shared by every process making screenshots.
+
+The pool is a separate process, started by the first screenshot that needs it and stopped after
+IDLE_TIMEOUT seconds without any. It runs `browser_pool` Chromium instances with remote
+debugging enabled and lends them out over a local connection: a lease is the DevTools endpoint
+of the browser with the fewest leases, which the screenshot code connects to with Playwright.
+A browser is restarted after `browser_recycle_pages` pages, to cap its memory, and whenever it
+stops answering.
+
+    python -m utils.browser_pool --size 2   # run it in the foreground
+"""
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import List, Optional
+from urllib.request import urlopen
+
+from utils.tracing import span
+
+# the port and the key clients authenticate with, written by the pool when it starts
+POOL_FILE = "./video_creation/data/browser_pool.json"
+HEALTH_INTERVAL = 30
+IDLE_TIMEOUT = 600
+START_TIMEOUT = 30
+CHROMIUM_ARGS = [
+    "--headless=new",
+    "--no-sandbox",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-dev-shm-usage",
+    "--mute-audio",
+    "--remote-debugging-address=127.0.0.1",
+    "--remote-debugging-port=0",
+]
+
+
+class PooledBrowser:
+    """A Chromium process that Playwright connects to over the DevTools protocol."""
+
+    def __init__(self, executable: str):
+        self.executable = executable
+        self.process = None
+        self.directory = None
+        self.endpoint = None
+        self.leases = 0
+        self.pages = 0
+        self.retiring = False
+        self.restarting = threading.Lock()
+
+    def start(self) -> None:
+        self.directory = tempfile.mkdtemp(prefix="browser-pool-")
+        self.process = subprocess.Popen(
+            [self.executable, *CHROMIUM_ARGS, f"--user-data-dir={self.directory}", "about:blank"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        # Chromium writes the port it picked to this file once it listens
+        port_file = Path(self.directory, "DevToolsActivePort")
+        deadline = time.monotonic() + START_TIMEOUT
+        while not port_file.exists() or not port_file.read_text().strip():
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError("Chromium didn't start")
+            time.sleep(0.05)
+        self.endpoint = f"http://127.0.0.1:{port_file.read_text().split()[0]}"
+        self.pages = 0
+        self.retiring = False
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    def healthy(self) -> bool:
+        if self.process.poll() is not None:
+            return False
+        try:
+            with urlopen(f"{self.endpoint}/json/version", timeout=5):
+                return True
+        except OSError:
+            return False
+
+
+class BrowserPool:
+    """Lends out the browsers, restarting the ones that are used up or broken.
+
+    Args:
+        browsers (List[PooledBrowser]): The browsers to lend out, they are started here
+        recycle_after (int): Pages a browser opens before it's restarted, 0 to never restart it
+    """
+
+    def __init__(self, browsers: List[PooledBrowser], recycle_after: int):
+        self.browsers = browsers
+        for browser in self.browsers:
+            browser.start()
+        self.recycle_after = recycle_after
+        self.last_used = time.monotonic()
+        self.available = threading.Condition()
+
+    def acquire(self) -> Optional[PooledBrowser]:
+        """Returns the browser with the fewest leases, None if none could be restarted in time."""
+        deadline = time.monotonic() + START_TIMEOUT
+        with self.available:
+            while True:
+                ready = [browser for browser in self.browsers if not browser.retiring]
+                if ready:
+                    browser = min(ready, key=lambda browser: browser.leases)
+                    browser.leases += 1
+                    self.last_used = time.monotonic()
+                    return browser
+                if not self.available.wait(deadline - time.monotonic()):
+                    return None
+
+    def release(self, browser: PooledBrowser, pages: int) -> None:
+        with self.available:
+            browser.leases -= 1
+            browser.pages += pages
+            self.last_used = time.monotonic()
+            if self.recycle_after and browser.pages >= self.recycle_after:
+                browser.retiring = True
+            if not browser.retiring or browser.leases:
+                return
+        self.restart(browser)
+
+    def restart(self, browser: PooledBrowser) -> None:
+        """Restarts a retiring browser, the others keep serving leases meanwhile."""
+        if not browser.restarting.acquire(blocking=False):
+            return  # another thread is at it
+        try:
+            browser.restart()
+        except RuntimeError as e:
+            print(f"Restarting a browser failed: {e}", file=sys.stderr)
+        finally:
+            browser.restarting.release()
+        with self.available:
+            browser.retiring = browser.process.poll() is not None
+            self.available.notify_all()
+
+    def check_health(self) -> None:
+        for browser in self.browsers:
+            if browser.retiring:
+                if browser.leases:  # restarted once its leases end
+                    continue
+            elif browser.healthy():
+                continue
+            with self.available:
+                browser.retiring = True
+            self.restart(browser)  # also retries the restarts that failed
+
+    def idle(self) -> bool:
+        with self.available:
+            return (
+                not any(browser.leases for browser in self.browsers)
+                and time.monotonic() - self.last_used > IDLE_TIMEOUT
+            )
+
+    def handle(self, conn) -> None:
+        """Serves one client. Its leases end when it releases them or disconnects."""
+        leased = []
+        try:
+            while True:
+                message = conn.recv()
+                if message == "acquire":
+                    browser = self.acquire()
+                    if browser is not None:
+                        leased.append(browser)
+                    conn.send(browser and browser.endpoint)
+                elif message[0] == "release" and leased:
+                    self.release(leased.pop(), message[1])
+        except (EOFError, OSError):
+            pass
+        finally:
+            for browser in leased:
+                self.release(browser, 0)
+            conn.close()
+
+    def accept(self, listener: Listener) -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:  # e.g. a client that read the key of an earlier pool
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def serve(self, listener: Listener) -> None:
+        """Serves clients until the pool has been idle for IDLE_TIMEOUT seconds."""
+        threading.Thread(target=self.accept, args=(listener,), daemon=True).start()
+        while not self.idle():
+            time.sleep(HEALTH_INTERVAL)
+            self.check_health()
+
+    def close(self) -> None:
+        for browser in self.browsers:
+            browser.stop()
+
+
+class LeasedBrowser:
+    """A browser of the pool that counts the pages opened with it, so the pool can recycle it.
+
+    The pages are counted as they open, closing them doesn't lower the count.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.opened_pages = 0
+
+    def new_context(self, *args, **kwargs):
+        context = self.browser.new_context(*args, **kwargs)
+        context.on("page", self.page_opened)
+        return context
+
+    def page_opened(self, page) -> None:
+        self.opened_pages += 1
+
+    def __getattr__(self, name):
+        return getattr(self.browser, name)
+
+
+def read_pool_file() -> Optional[dict]:
+    try:
+        with open(POOL_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def connect():
+    """Returns a connection to the running pool, None if there's none."""
+    pool = read_pool_file()
+    try:
+        return Client(("127.0.0.1", pool["port"]), authkey=bytes.fromhex(pool["authkey"]))
+    except (TypeError, OSError, ValueError, KeyError, EOFError, AuthenticationError):
+        return None
+
+
+def start_pool(size: int, recycle_after: int):
+    """Starts the pool in the background and returns a connection to it, None if it didn't start."""
+    subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "utils.browser_pool",
+            f"--size={size}",
+            f"--recycle-after={recycle_after}",
+        ],
+        cwd=Path(__file__).resolve().parent.parent,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,  # outlives the process that started it
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        conn = connect()
+        if conn is not None:
+            return conn
+        time.sleep(0.2)
+    return None
+
+
+@contextmanager
+def pooled_browser(playwright):
+    """Yields a browser of the pool, or a newly launched one when the pool is disabled or fails.
+
+    Closing the yielded browser only disconnects from a pooled one, the contexts it made are closed.
+
+    Args:
+        playwright: The object sync_playwright() returned
+    """
+    from playwright.sync_api import Error
+
+    from utils import settings
+
+    size = settings.config["settings"].get("browser_pool", 0)
+    conn = None
+    browser = None
+    if size:
+        conn = connect() or start_pool(
+            size, settings.config["settings"].get("browser_recycle_pages", 0)
+        )
+    if conn is not None:
+        with span("connect to pool", "browser"):
+            try:
+                conn.send("acquire")
+                endpoint = conn.recv()
+                if endpoint is not None:
+                    browser = LeasedBrowser(playwright.chromium.connect_over_cdp(endpoint))
+            except (EOFError, OSError, Error) as e:
+                print(f"The browser pool failed, launching a browser instead: {e}")
+        if browser is None:
+            conn.close()
+
+    if browser is None:
+        with span("launch", "browser"):
+            browser = playwright.chromium.launch(
+                headless=True
+            )  # headless=False will show the browser for debugging purposes
+        try:
+            yield browser
+        finally:
+            browser.close()
+        return
+
+    with conn:
+        try:
+            yield browser
+        finally:
+            browser.close()
+            conn.send(("release", browser.opened_pages))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2, help="Number of browsers")
+    parser.add_argument(
+        "--recycle-after", type=int, default=200, help="Pages before a browser is restarted"
+    )
+    args = parser.parse_args()
+
+    from playwright.sync_api import sync_playwright
+
+    existing = connect()
+    if existing is not None:
+        existing.close()
+        sys.exit("A browser pool is already running")
+    # stopped with SIGTERM, the browsers are stopped with it
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    authkey = secrets.token_bytes(32)
+    # a port the system picks, so pools of several checkouts don't get in each other's way
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    Path(POOL_FILE).parent.mkdir(parents=True, exist_ok=True)
+    with sync_playwright() as p:
+        executable = p.chromium.executable_path
+    pool = BrowserPool([PooledBrowser(executable) for _ in range(args.size)], args.recycle_after)
+    try:
+        # clients can connect once the browsers run, written atomically as they may be reading it
+        with open(f"{POOL_FILE}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "port": listener.address[1], "authkey": authkey.hex()}, f)
+        os.chmod(f"{POOL_FILE}.{os.getpid()}.tmp", 0o600)
+        os.replace(f"{POOL_FILE}.{os.getpid()}.tmp", POOL_FILE)
+        pool.serve(listener)
+    finally:
+        pool.close()
+        listener.close()
+        # a pool that was started at the same time may have written it since
+        if (read_pool_file() or {}).get("pid") == os.getpid():
+            Path(POOL_FILE).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
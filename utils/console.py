@@ -1,14 +1,19 @@
 import re
+import threading
 
 from rich.columns import Columns
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.padding import Padding
 from rich.panel import Panel
+from rich.progress import track as rich_track
 from rich.text import Text
 
 console = Console()
 
+# rich can only show one progress bar at a time, stages running at once share it
+_progress_lock = threading.Lock()
+
 
 def print_markdown(text) -> None:
     """Prints a rich info message. Support Markdown syntax."""
@@ -30,6 +35,17 @@ def print_table(items) -> None:
     console.print(Columns([Panel(f"[yellow]{item}", expand=True) for item in items]))
 
 
+def track(sequence, description: str = "Working...", total=None):
+    """rich.progress.track, iterating without a progress bar while another one is shown."""
+    if not _progress_lock.acquire(blocking=False):
+        yield from sequence
+        return
+    try:
+        yield from rich_track(sequence, description, total=total)
+    finally:
+        _progress_lock.release()
+
+
 def print_substep(text, style="") -> None:
     """Prints a rich colored info message without the panelling."""
     console.print(text, style=style)
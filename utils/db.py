@@ -0,0 +1,24 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect(path: str, timeout: float = 30) -> sqlite3.Connection:
+    """Opens a SQLite database that several processes can use at the same time.
+
+    The database is put in WAL mode, so readers don't block the writer, and waits up to `timeout`
+    seconds for a lock instead of failing right away. Transactions have to be started explicitly.
+
+    Args:
+        path (str): Path of the database file, created with its directory if it doesn't exist
+        timeout (float): Seconds to wait for another process to release a lock
+
+    Returns:
+        sqlite3.Connection: The connection, rows can be accessed by column name
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
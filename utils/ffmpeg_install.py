@@ -1,4 +1,5 @@
 import os
+import shutil
 import subprocess
 import zipfile
 
@@ -102,6 +103,9 @@ def ffmpeg_install_mac():
 
 
 def ffmpeg_install():
+    # Finding ffmpeg on the PATH is enough, and doesn't cost a process launch on every start
+    if shutil.which("ffmpeg"):
+        return None
     try:
         # Try to run the FFmpeg command
         subprocess.run(
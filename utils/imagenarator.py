@@ -19,6 +19,8 @@ def draw_multiple_line_text(
     font_height = getheight(font, text)
     image_width, image_height = image.size
     lines = textwrap.wrap(text, width=wrap)
+    if not lines:  # nothing to draw, e.g. a comment that only had a link
+        return
     y = (image_height / 2) - (((font_height + (len(lines) * padding) / len(lines)) * len(lines)) / 2)
     for line in lines:
         line_width, line_height = getsize(font, line)
@@ -53,6 +55,19 @@ def draw_multiple_line_text(
         y += line_height + padding
 
 
+def comment_card(text: str, path: str, theme, txtclr, padding=5) -> None:
+    """
+    Render a comment as plain text, used when its screenshot couldn't be taken
+    """
+    font = ImageFont.truetype(os.path.join("fonts", "Roboto-Regular.ttf"), 40)
+    text = process_text(text, False)
+    lines = textwrap.wrap(text, width=45) or [""]
+    height = sum(getheight(font, line) + padding for line in lines) + 80
+    image = Image.new("RGBA", (1000, height), theme)
+    draw_multiple_line_text(image, text, font, txtclr, padding, wrap=45)
+    image.save(path)
+
+
 def imagemaker(theme, reddit_obj: dict, txtclr, padding=5, transparent=False) -> None:
     """
     Render Images for video
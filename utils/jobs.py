@@ -0,0 +1,241 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import List, Optional
+
+from utils.db import connect
+
+JOBS_DB = "./video_creation/data/jobs.db"
+LEASE_SECONDS = 300  # a running job without a heartbeat for this long is given to another worker
+HEARTBEAT_SECONDS = 30
+
+# the job this process is working on and the name it claimed it with, set by the worker loop in main.py
+current_job: Optional[int] = None
+current_worker: Optional[str] = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    thread_id TEXT,
+    worker TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id);
+-- two running jobs can never hold the same thread
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_running_thread ON jobs (thread_id) WHERE status = 'running';
+"""
+
+
+# matches a job only while the worker still holds its lease, an expired one can be claimed by another
+HELD = "id = ? AND worker = ? AND status = 'running'"
+
+
+class LeaseLost(RuntimeError):
+    """The lease of the job expired and it was put back in the queue or given to another worker."""
+
+
+# sets the status of a job that failed, the thread of a job that won't be tried again is released
+FAILED_OR_QUEUED = (
+    "status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+    "thread_id = CASE WHEN attempts < max_attempts THEN thread_id END"
+)
+
+
+def open_db() -> sqlite3.Connection:
+    connection = connect(JOBS_DB)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def enqueue(post_id: Optional[str] = None, priority: int = 0, max_attempts: int = 3) -> int:
+    """Adds a video to the queue.
+
+    Args:
+        post_id (Optional[str]): The post to make a video of, None picks a thread like a normal run
+        priority (int): Jobs with a higher priority are claimed first
+        max_attempts (int): How many times the job is tried before it's marked as failed
+
+    Returns:
+        int: The id of the job
+    """
+    with closing(open_db()) as db:
+        return db.execute(
+            "INSERT INTO jobs (post_id, priority, max_attempts, created) VALUES (?, ?, ?, ?)",
+            (post_id, priority, max_attempts, time.time()),
+        ).lastrowid
+
+
+def list_jobs(status: Optional[str] = None) -> List[dict]:
+    """Returns the jobs in the order they will be claimed, optionally only the ones with the given status."""
+    with closing(open_db()) as db:
+        rows = db.execute(
+            "SELECT * FROM jobs WHERE ? IS NULL OR status = ? ORDER BY priority DESC, id",
+            (status, status),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def cancel_job(job_id: int) -> bool:
+    """Cancels a job that hasn't been claimed yet.
+
+    Returns:
+        bool: Whether the job was queued and is now cancelled
+    """
+    with closing(open_db()) as db:
+        return (
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled' WHERE id = ? AND status = 'queued'", (job_id,)
+            ).rowcount
+            == 1
+        )
+
+
+def claim_job(worker: Optional[str] = None) -> Optional[dict]:
+    """Takes the next job off the queue. Only one worker can ever claim a job.
+
+    Jobs whose worker stopped sending heartbeats are put back in the queue first, or marked as
+    failed when they have been tried max_attempts times.
+
+    Args:
+        worker (Optional[str]): Name of the worker, defaults to <hostname>:<pid>
+
+    Returns:
+        Optional[dict]: The claimed job, None if the queue is empty
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    now = time.time()
+    with closing(open_db()) as db:
+        # BEGIN IMMEDIATE takes the write lock, so no other worker can claim in between
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "UPDATE jobs SET worker = NULL, error = 'worker stopped responding', "
+                f"{FAILED_OR_QUEUED} WHERE status = 'running' AND heartbeat < ?",
+                (now - LEASE_SECONDS,),
+            )
+            job = db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if job is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                    "heartbeat = ?, thread_id = NULL WHERE id = ?",
+                    (worker, now, job["id"]),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+    if job is None:
+        return None
+    return dict(job, status="running", attempts=job["attempts"] + 1, worker=worker)
+
+
+def get_job(job_id: int) -> Optional[dict]:
+    with closing(open_db()) as db:
+        job = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return job and dict(job)
+
+
+def finish_job(job_id: int, worker: str, error: Optional[str] = None) -> Optional[str]:
+    """Marks a claimed job as done, or as failed if an error is given.
+
+    A failed job goes back in the queue until it has been tried max_attempts times, after that it
+    gives up its thread.
+
+    Args:
+        job_id (int): The id of the job
+        worker (str): The worker that claimed it
+        error (Optional[str]): Why the job failed, None if it's done
+
+    Returns:
+        Optional[str]: The new status of the job, None if the worker lost its lease meanwhile
+    """
+    with closing(open_db()) as db:
+        if error is None:
+            updated = db.execute(
+                f"UPDATE jobs SET status = 'done', error = NULL WHERE {HELD}", (job_id, worker)
+            )
+            return "done" if updated.rowcount else None
+        updated = db.execute(
+            f"UPDATE jobs SET error = ?, {FAILED_OR_QUEUED} WHERE {HELD}", (error, job_id, worker)
+        )
+        if not updated.rowcount:
+            return None
+        return db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()["status"]
+
+
+def release_job(job_id: int, worker: str) -> None:
+    """Puts a claimed job back in the queue without counting the attempt, for a stopped worker."""
+    with closing(open_db()) as db:
+        db.execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, worker = NULL, "
+            f"error = 'interrupted' WHERE {HELD}",
+            (job_id, worker),
+        )
+
+
+def start_heartbeat(job_id: int, worker: str) -> threading.Event:
+    """Keeps the lease of a claimed job alive from a background thread until the returned event is set.
+
+    The heartbeat also stops once the lease is lost, it never renews the lease of another worker.
+    """
+    stop = threading.Event()
+
+    def beat():
+        with closing(open_db()) as db:
+            while not stop.wait(HEARTBEAT_SECONDS):
+                updated = db.execute(
+                    f"UPDATE jobs SET heartbeat = ? WHERE {HELD}", (time.time(), job_id, worker)
+                )
+                if not updated.rowcount:
+                    stop.set()
+
+    threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True).start()
+    return stop
+
+
+def reserve_thread(thread_id: str) -> bool:
+    """Records that the current job makes a video of the given thread.
+
+    Returns:
+        bool: False if another running job already has the thread. Always True outside of a worker.
+
+    Raises:
+        LeaseLost: The current job isn't held by this worker any more
+    """
+    if current_job is None:
+        return True
+    with closing(open_db()) as db:
+        try:
+            updated = db.execute(
+                f"UPDATE jobs SET thread_id = ? WHERE {HELD}",
+                (thread_id, current_job, current_worker),
+            )
+        except sqlite3.IntegrityError:
+            return False
+    if not updated.rowcount:
+        raise LeaseLost(f"Job {current_job} was given to another worker")
+    return True
+
+
+def reserved_threads() -> set:
+    """Returns the threads other workers are making videos of. Empty outside of a worker."""
+    if current_job is None:
+        return set()
+    with closing(open_db()) as db:
+        rows = db.execute(
+            "SELECT thread_id FROM jobs WHERE status = 'running' AND thread_id IS NOT NULL AND id != ?",
+            (current_job,),
+        ).fetchall()
+    return {row["thread_id"] for row in rows}
@@ -0,0 +1,151 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from utils import settings
+from utils.console import print_substep
+from utils.pipeline import Stage
+
+
+def manifest_path(reddit_id: str, name: str) -> str:
+    return f"assets/temp/{reddit_id}/manifests/{name}.json"
+
+
+def file_stamp(path: str) -> dict:
+    """Returns the size and modification time of a file.
+
+    Reading every file a stage wrote, like the chopped background, would slow down every run
+    for the sake of resuming; a file that was changed or replaced gets a new stamp anyway.
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def fingerprint(value: Any) -> str:
+    """Returns a stable hash of a JSON-like value. Callables are described by their name."""
+    dumped = json.dumps(
+        value, sort_keys=True, default=lambda obj: getattr(obj, "__qualname__", repr(obj))
+    )
+    return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+
+def settings_fingerprint(settings_paths: Iterable[str]) -> str:
+    """Hashes the config values at the given dotted paths, e.g. "settings.tts"."""
+    values = {}
+    for path in settings_paths:
+        value = settings.config
+        for key in path.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        values[path] = value
+    return fingerprint(values)
+
+
+def save_checkpoint(
+    reddit_id: str,
+    name: str,
+    result: Any,
+    inputs: Any = None,
+    files: Iterable[str] = (),
+    settings_paths: Iterable[str] = (),
+) -> None:
+    """Writes the manifest of a finished stage to assets/temp/<reddit_id>/manifests/<name>.json
+
+    Args:
+        reddit_id (str): The id of the thread
+        name (str): The name of the stage
+        result (Any): The JSON serializable return value of the stage
+        inputs (Any): The values the stage was called with
+        files (Iterable[str]): Glob patterns, relative to assets/temp/<reddit_id>, of the files the stage wrote
+        settings_paths (Iterable[str]): The config values the outputs depend on
+    """
+    temp_dir = f"assets/temp/{reddit_id}"
+    outputs = {}
+    for pattern in files:
+        for path in sorted(glob.glob(f"{temp_dir}/{pattern}")):
+            outputs[os.path.relpath(path, temp_dir)] = file_stamp(path)
+    manifest = {
+        "stage": name,
+        "time": int(time.time()),
+        "inputs": fingerprint(inputs),
+        "settings": settings_fingerprint(settings_paths),
+        "files": outputs,
+        "result": result,
+    }
+    path = manifest_path(reddit_id, name)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(f"{path}.tmp", path)  # never leave a half written manifest behind
+
+
+def load_checkpoint(
+    reddit_id: str,
+    name: str,
+    inputs: Any = None,
+    settings_paths: Iterable[str] = (),
+) -> Tuple[bool, Any]:
+    """Checks if the manifest of a stage is still valid.
+
+    A manifest is valid when the stage would be called with the same inputs and settings,
+    and every file it wrote still exists with the same size and modification time.
+
+    Returns:
+        tuple[bool,Any]: (whether the manifest is valid, the stored return value of the stage)
+    """
+    try:
+        with open(manifest_path(reddit_id, name), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    if manifest["inputs"] != fingerprint(inputs):
+        return False, None
+    if manifest["settings"] != settings_fingerprint(settings_paths):
+        return False, None
+    temp_dir = f"assets/temp/{reddit_id}"
+    for path, stamp in manifest["files"].items():
+        if not os.path.isfile(f"{temp_dir}/{path}") or file_stamp(f"{temp_dir}/{path}") != stamp:
+            return False, None
+    return True, manifest["result"]
+
+
+def checkpointed(
+    stage: Stage,
+    reddit_id: str,
+    files: Iterable[str] = (),
+    settings_paths: Iterable[str] = (),
+    key: Optional[Callable] = None,
+    resume: bool = False,
+) -> Stage:
+    """Wraps a stage so it writes a manifest when it finishes, and is skipped on resume if that manifest is still valid.
+
+    Args:
+        stage (Stage): The stage to wrap, its return value has to be JSON serializable
+        reddit_id (str): The id of the thread
+        files (Iterable[str]): Glob patterns, relative to assets/temp/<reddit_id>, of the files the stage writes
+        settings_paths (Iterable[str]): The config values the outputs depend on
+        key (Optional[Callable]): Called with the inputs of the stage, returns the part of them the outputs depend on. Defaults to all inputs.
+        resume (bool): Whether to skip the stage if its manifest is valid
+
+    Returns:
+        Stage: The wrapped stage
+    """
+    files = list(files)
+    settings_paths = list(settings_paths)
+
+    def run(*inputs):
+        # taken before running, stages like the TTS modify the reddit object they are given
+        inputs_hash = fingerprint(key(*inputs) if key else list(inputs))
+        if resume:
+            valid, result = load_checkpoint(reddit_id, stage.name, inputs_hash, settings_paths)
+            if valid:
+                print_substep(f"Skipping {stage.name}, the files from the last run are still valid.")
+                return tuple(result) if len(stage.outputs) > 1 else result
+        result = stage.func(*inputs)
+        save_checkpoint(reddit_id, stage.name, result, inputs_hash, files, settings_paths)
+        return result
+
+    return Stage(stage.name, run, stage.inputs, stage.outputs, stage.after)
@@ -0,0 +1,144 @@
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from queue import Queue
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.tracing import span
+
+
+class Stage:
+    """A single step of the video pipeline.
+
+    Args:
+        name               : Name of the stage, used in error messages.
+        func               : The callable doing the work. It is called with the values of `inputs` as positional arguments.
+        inputs (Optional)  : Keys of the pipeline context passed to `func`, in order.
+        outputs (Optional) : Keys the return value of `func` is stored under. With more than one key `func` must return a tuple.
+        after (Optional)   : Keys that have to be available before the stage starts, without being passed to `func`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = (),
+        after: Iterable[str] = (),
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+
+    def requires(self) -> List[str]:
+        return self.inputs + self.after
+
+    def is_ready(self, context: Dict[str, Any]) -> bool:
+        return all(key in context for key in self.requires())
+
+    def run(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        with span(self.name, "stage"):
+            result = self.func(*[context[key] for key in self.inputs])
+        if not self.outputs:
+            return {}
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        return dict(zip(self.outputs, result))
+
+
+def run_stages(
+    stages: List[Stage],
+    context: Optional[Dict[str, Any]] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Runs the stages of the pipeline, each one as soon as all of its inputs are available.
+
+    Stages that don't depend on each other run at the same time on a thread pool.
+    With max_workers set to 1 the stages run one after another in dependency order.
+
+    Args:
+        stages (List[Stage]): The stages to run
+        context (Dict[str, Any]): Values that are available before any stage runs
+        max_workers (int): Maximum number of stages running at once, defaults to one per stage
+
+    Returns:
+        Dict[str, Any]: The context, including the outputs of every stage
+    """
+    context = dict(context or {})
+    available = set(context)
+    for stage in stages:
+        available.update(stage.outputs)
+    for stage in stages:
+        missing = [key for key in stage.requires() if key not in available]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on {missing}, which no stage provides")
+
+    pending = list(stages)
+    running = {}
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers or max(len(stages), 1), thread_name_prefix="stage"
+    )
+    try:
+        while pending or running:
+            for stage in [stage for stage in pending if stage.is_ready(context)]:
+                pending.remove(stage)
+                # run in a copy of the current context, so the stage records to the active trace
+                future = executor.submit(contextvars.copy_context().run, stage.run, dict(context))
+                running[future] = stage
+            if not running:
+                names = ", ".join(stage.name for stage in pending)
+                raise ValueError(f"Stages {names} can never run, their inputs form a cycle")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                context.update(future.result())
+    finally:
+        executor.shutdown(wait=not running, cancel_futures=True)
+    return context
+
+
+def run_pipelined(items: Iterable, produce: Callable, consume: Callable, depth: int = 1) -> None:
+    """Runs `consume(produce(item))` for every item, producing the next items while the current one is consumed.
+
+    Items are produced one at a time on a background thread and consumed in order on the calling thread.
+
+    Args:
+        items (Iterable): The items to work through
+        produce (Callable): Prepares an item, runs on the background thread
+        consume (Callable): Finishes a prepared item, runs on the calling thread
+        depth (int): How many items may be produced ahead of the one being consumed. 0 disables pipelining.
+    """
+    if depth < 1:
+        for item in items:
+            consume(produce(item))
+        return
+
+    results = Queue()
+    slots = threading.BoundedSemaphore(depth)
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                results.put((produce(item), None))
+        except BaseException as error:
+            results.put((None, error))
+            return
+        results.put(None)
+
+    # daemon so an error while consuming doesn't wait for the item being produced
+    threading.Thread(target=producer, name="pipeline-producer", daemon=True).start()
+    try:
+        while (result := results.get()) is not None:
+            value, error = result
+            if error is not None:
+                raise error
+            slots.release()
+            consume(value)
+    finally:
+        stop.set()
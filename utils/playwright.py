@@ -1,5 +1,69 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional
+
+# logged in Reddit sessions, saved as Playwright storage state, one file per account
+SESSIONS_DIR = "./video_creation/data/sessions"
+SESSION_COOKIE = "reddit_session"
+# a session that expires sooner than this is logged in again instead of reused
+SESSION_MARGIN = 60 * 60
+
+
 def clear_cookie_by_name(context, cookie_cleared_name):
     cookies = context.cookies()
     filtered_cookies = [cookie for cookie in cookies if cookie["name"] != cookie_cleared_name]
     context.clear_cookies()
     context.add_cookies(filtered_cookies)
+
+
+def session_path(username: str) -> str:
+    return f"{SESSIONS_DIR}/{re.sub(r'[^-_0-9a-zA-Z]', '', username)}.json"
+
+
+def session_expiry(cookies: list) -> Optional[float]:
+    """Returns when the Reddit login in the cookies expires, None if they don't have one."""
+    for cookie in cookies:
+        if cookie["name"] == SESSION_COOKIE and cookie["value"]:
+            # -1 is a cookie that lasts as long as the browser, it's only kept for this run
+            return cookie["expires"] if cookie.get("expires", -1) > 0 else None
+    return None
+
+
+def load_session(username: str) -> Optional[str]:
+    """Returns the path of the saved session of the account, None if there's none that's still valid."""
+    path = session_path(username)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            expiry = session_expiry(json.load(f).get("cookies", []))
+    except (OSError, ValueError):
+        return None
+    if expiry is None or expiry < time.time() + SESSION_MARGIN:
+        return None
+    return path
+
+
+def save_session(context, username: str) -> None:
+    """Saves the cookies and local storage of the context, so the next runs don't log in again."""
+    path = session_path(username)
+    Path(SESSIONS_DIR).mkdir(parents=True, exist_ok=True)
+    # written to a temporary file first, other workers may be reading it
+    context.storage_state(path=f"{path}.{os.getpid()}.tmp")
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def forget_session(username: str) -> None:
+    try:
+        os.unlink(session_path(username))
+    except FileNotFoundError:
+        pass
+
+
+def is_logged_in(context) -> bool:
+    """Whether the context has the cookie of a logged in Reddit account."""
+    return any(
+        cookie["name"] == SESSION_COOKIE and cookie["value"]
+        for cookie in context.cookies("https://www.reddit.com")
+    )
@@ -3,14 +3,14 @@ import re
 import time
 from typing import List
 
-import spacy
-
 from utils.console import print_step
 from utils.voice import sanitize_text
 
 
 # working good
 def posttextparser(obj, *, tried: bool = False) -> List[str]:
+    import spacy  # slow to import, only needed in storymode
+
     text: str = re.sub("\n", " ", obj)
     try:
         nlp = spacy.load("en_core_web_sm")
@@ -1,9 +1,6 @@
-import json
-from os.path import exists
-
-from utils import settings
-from utils.ai_methods import sort_by_similarity
+from utils import jobs, settings
 from utils.console import print_substep
+from utils.videos import in_progress, is_done
 
 
 def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similarity_scores=None):
@@ -19,18 +16,17 @@ def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similari
     # Second try of getting a valid Submission
     if times_checked and settings.config["ai"]["ai_similarity_enabled"]:
         print("Sorting based on similarity for a different date filter and thread limit..")
+        from utils.ai_methods import sort_by_similarity  # imports torch
+
         submissions = sort_by_similarity(
             submissions, keywords=settings.config["ai"]["ai_similarity_enabled"]
         )
 
     # recursively checks if the top submission in the list was already done.
-    if not exists("./video_creation/data/videos.json"):
-        with open("./video_creation/data/videos.json", "w+") as f:
-            json.dump([], f)
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
+    # threads other job queue workers are making videos of count as done
+    reserved = jobs.reserved_threads()
     for i, submission in enumerate(submissions):
-        if already_done(done_videos, submission):
+        if already_done(submission, reserved):
             continue
         if submission.over_18:
             try:
@@ -93,18 +89,16 @@ def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similari
     )  # all the videos in hot have already been done
 
 
-def already_done(done_videos: list, submission) -> bool:
-    """Checks to see if the given submission is in the list of videos
+def already_done(submission, reserved=()) -> bool:
+    """Checks to see if the given submission is in the history of done videos
 
     Args:
-        done_videos (list): Finished videos
         submission (Any): The submission
+        reserved (Iterable[str]): Ids of threads other workers are making videos of
 
     Returns:
-        Boolean: Whether the video was found in the list
+        Boolean: Whether the video was done before or is being made right now
     """
 
-    for video in done_videos:
-        if video["id"] == str(submission):
-            return True
-    return False
+    reddit_id = str(submission)
+    return reddit_id in in_progress or reddit_id in reserved or is_done(reddit_id)
@@ -0,0 +1,127 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+from rich.table import Table
+
+from utils.console import console
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Collects the timings of one video and exports them in the Chrome trace format.
+
+    The exported file can be opened in chrome://tracing or https://ui.perfetto.dev
+    """
+
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, category: str, start: float, end: float, args: dict) -> None:
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    def save(self, path: str) -> None:
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self.threads.items()
+        ]
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": metadata + self.events, "displayTimeUnit": "ms"},
+                f,
+                default=str,
+            )
+
+    def print_summary(self) -> None:
+        """Prints the total time spent in every step, the slowest first."""
+        totals = {}
+        for event in self.events:
+            key = (event["cat"], event["name"])
+            calls, total, longest = totals.get(key, (0, 0.0, 0.0))
+            seconds = event["dur"] / 1e6
+            totals[key] = (calls + 1, total + seconds, max(longest, seconds))
+
+        table = Table(title="Time spent per step")
+        table.add_column("Category")
+        table.add_column("Step")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total (s)", justify="right")
+        table.add_column("Longest (s)", justify="right")
+        for (category, name), (calls, total, longest) in sorted(
+            totals.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            table.add_row(category, name, str(calls), f"{total:.2f}", f"{longest:.2f}")
+        console.print(table)
+
+
+def start_trace(trace: Optional[Trace] = None) -> Trace:
+    """Makes the given trace, or a new one, the trace that spans of the current thread are recorded to.
+
+    Stages started by utils.pipeline.run_stages inherit it.
+    """
+    trace = trace or Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name: str, category: str = "step", **args):
+    """Times the enclosed block and records it to the active trace. Does nothing without one.
+
+    Args:
+        name (str): Name of the step
+        category (str): Kind of step, e.g. stage, tts, browser or subprocess
+        **args: Extra values shown with the step in the trace viewer
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, category, start, time.perf_counter(), args)
+
+
+def traced(name: Optional[str] = None, category: str = "step") -> Callable:
+    """Decorator version of span, names the step after the function by default."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.tracing import span
+
+DEFAULT_TIMEOUT = (10, 60)  # seconds to connect, seconds to wait for the response
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_CONNECTIONS_PER_HOST = 8
+# hosts that only allow a few connections at once
+CONNECTIONS_PER_HOST = {"streamlabs.com": 2}
+
+# retries made per host, shown by benchmarks and useful when a provider starts failing
+retry_counts = Counter()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the session every provider shares, so connections are kept alive between clips.
+
+    Requests wait for a free connection when a host has all of its connections in use.
+    Don't set headers or cookies on it, pass them with each request instead.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.mount(
+                "https://",
+                HTTPAdapter(
+                    pool_connections=16,
+                    pool_maxsize=DEFAULT_CONNECTIONS_PER_HOST,
+                    pool_block=True,
+                ),
+            )
+            for host, connections in CONNECTIONS_PER_HOST.items():
+                session.mount(
+                    f"https://{host}/",
+                    HTTPAdapter(pool_connections=1, pool_maxsize=connections, pool_block=True),
+                )
+            _session = session
+        return _session
+
+
+def rate_limit_wait(response: requests.Response) -> Optional[float]:
+    """Returns the seconds a rate limited response asks to wait, None if it doesn't say.
+
+    Understands X-RateLimit-Reset, a unix timestamp (see utils.voice.check_ratelimit), and Retry-After.
+    """
+    try:
+        return max(0.0, int(response.headers["X-RateLimit-Reset"]) - time.time())
+    except (KeyError, ValueError):
+        pass
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def backoff(attempt: int, base: float) -> float:
+    """Exponential backoff with full jitter, so workers that failed together don't retry together."""
+    return random.uniform(0, base * 2**attempt)
+
+
+def request(
+    method: str,
+    url: str,
+    retries: int = 4,
+    backoff_base: float = 0.5,
+    max_wait: float = 120,
+    **kwargs,
+) -> requests.Response:
+    """Sends a request over the shared session, retrying connection errors, 429 and 5xx responses.
+
+    Rate limited responses are retried after the time they ask for, other failures after a
+    jittered exponential backoff.
+
+    Args:
+        method (str): HTTP method
+        url (str): The URL to request
+        retries (int): How many times a failed request is retried
+        backoff_base (float): Seconds of the first backoff, doubled on every retry
+        max_wait (float): The longest a rate limit is waited for before giving up
+        **kwargs: Passed to requests.Session.request, the timeout defaults to DEFAULT_TIMEOUT
+
+    Returns:
+        requests.Response: The last response, which can still have an error status
+
+    Raises:
+        requests.RequestException: The last attempt failed without a response
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    host = urlsplit(url).hostname
+    session = get_session()
+    for attempt in range(retries + 1):
+        try:
+            with span(f"{method} {host}", "http", attempt=attempt):
+                response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            wait = backoff(attempt, backoff_base)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            wait = rate_limit_wait(response) if response.status_code == 429 else None
+            if wait is None:
+                wait = backoff(attempt, backoff_base)
+            elif wait > max_wait:
+                return response
+            # a streamed response keeps its connection until closed, and the pool waits for it
+            response.close()
+        retry_counts[host] += 1
+        time.sleep(wait)
@@ -1,13 +1,59 @@
+import json
+import threading
+import time
+
 import requests
 
 from utils.console import print_step
 
+VERSION_CACHE_FILE = "./video_creation/data/version_check.json"
+VERSION_CACHE_TTL = 24 * 60 * 60  # seconds
+
 
 def checkversion(__VERSION__: str):
-    response = requests.get(
-        "https://api.github.com/repos/elebumm/RedditVideoMakerBot/releases/latest"
-    )
-    latestversion = response.json()["tag_name"]
+    """Tells the user whether a newer release of the bot is available.
+
+    The latest version is cached for a day. When the cache is stale, GitHub is asked on a
+    background thread so the request doesn't slow down the start of the bot.
+    """
+    latestversion = get_cached_version()
+    if latestversion is None:
+        threading.Thread(
+            target=fetch_latest_version, args=(__VERSION__,), name="checkversion", daemon=True
+        ).start()
+        return None
+    return print_version_status(__VERSION__, latestversion)
+
+
+def get_cached_version():
+    try:
+        with open(VERSION_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get("time", 0) > VERSION_CACHE_TTL:
+        return None
+    return cache.get("latest")
+
+
+def fetch_latest_version(__VERSION__: str) -> None:
+    try:
+        response = requests.get(
+            "https://api.github.com/repos/elebumm/RedditVideoMakerBot/releases/latest",
+            timeout=10,
+        )
+        latestversion = response.json()["tag_name"]
+    except (requests.RequestException, ValueError, KeyError):
+        return  # not being able to check the version shouldn't stop the bot
+    try:
+        with open(VERSION_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"time": int(time.time()), "latest": latestversion}, f)
+    except OSError:
+        pass
+    print_version_status(__VERSION__, latestversion)
+
+
+def print_version_status(__VERSION__: str, latestversion: str):
     if __VERSION__ == latestversion:
         print_step(f"You are using the newest version ({__VERSION__}) of the bot")
         return True
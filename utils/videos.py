@@ -1,15 +1,92 @@
 import json
+import os
+import threading
 import time
+from typing import TYPE_CHECKING, List
 
-from praw.models import Submission
-
-from utils import settings
+from utils import jobs, settings
 from utils.console import print_step
+from utils.db import connect
+
+if TYPE_CHECKING:
+    from praw.models import Submission
+
+VIDEOS_DB = "./video_creation/data/videos.db"
+VIDEOS_JSON = "./video_creation/data/videos.json"  # used before the history moved to VIDEOS_DB
+
+COLUMNS = ["id", "subreddit", "time", "background_credit", "reddit_title", "filename"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    subreddit TEXT,
+    time TEXT,
+    background_credit TEXT,
+    reddit_title TEXT,
+    filename TEXT
+);
+"""
+
+# ids of the threads that are being made into a video by this process but are not saved yet
+in_progress = set()
+
+# one connection per thread, sqlite connections can't be shared between threads
+_local = threading.local()
+
+
+def open_db():
+    """Returns the connection to the history of done videos, importing videos.json on first use."""
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = connect(VIDEOS_DB)
+        db.executescript(SCHEMA)
+        migrate_json(db)
+        _local.db = db
+    return db
+
+
+def migrate_json(db) -> None:
+    """Copies the videos of the old videos.json into the database, and renames it so it's only imported once."""
+    if not os.path.exists(VIDEOS_JSON):
+        return
+    # the write lock makes sure only one thread or process imports the file
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        try:
+            with open(VIDEOS_JSON, "r", encoding="utf-8") as done_vids_raw:
+                done_videos = json.load(done_vids_raw)
+        except FileNotFoundError:
+            db.execute("ROLLBACK")
+            return  # another process just did it
+        except ValueError:
+            done_videos = []
+        db.executemany(
+            "INSERT OR IGNORE INTO videos VALUES (:id, :subreddit, :time, :background_credit, :reddit_title, :filename)",
+            [dict.fromkeys(COLUMNS, "") | video for video in done_videos if "id" in video],
+        )
+        os.replace(VIDEOS_JSON, f"{VIDEOS_JSON}.migrated")
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    print_step(f"Moved the history of {len(done_videos)} done videos to {VIDEOS_DB}")
+
+
+def is_done(reddit_id: str) -> bool:
+    """Checks if a video of the thread has been made before."""
+    return (
+        open_db().execute("SELECT 1 FROM videos WHERE id = ?", (str(reddit_id),)).fetchone()
+        is not None
+    )
+
+
+def done_videos() -> List[dict]:
+    """Returns every video that has been made, oldest first, in the format of the old videos.json"""
+    return [dict(row) for row in open_db().execute("SELECT * FROM videos ORDER BY rowid")]
 
 
 def check_done(
-    redditobj: Submission,
-) -> Submission:
+    redditobj: "Submission",
+) -> "Submission":
     # don't set this to be run anyplace that isn't subreddit.py bc of inspect stack
     """Checks if the chosen post has already been generated
 
@@ -19,22 +96,35 @@ def check_done(
     Returns:
         Submission|None: Reddit object in args
     """
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
-    for video in done_videos:
-        if video["id"] == str(redditobj):
-            if settings.config["reddit"]["thread"]["post_id"]:
-                print_step(
-                    "You already have done this video but since it was declared specifically in the config file the program will continue"
-                )
-                return redditobj
-            print_step("Getting new post as the current one has already been done")
-            return None
+    reddit_id = str(redditobj)
+    if reddit_id in in_progress or is_done(reddit_id) or reddit_id in jobs.reserved_threads():
+        if settings.config["reddit"]["thread"]["post_id"]:
+            print_step(
+                "You already have done this video but since it was declared specifically in the config file the program will continue"
+            )
+            return redditobj
+        print_step("Getting new post as the current one has already been done")
+        return None
     return redditobj
 
 
+def mark_in_progress(reddit_id: str) -> bool:
+    """Reserves a thread so the next videos of a pipelined run, and other job queue workers, don't pick it again.
+
+    Args:
+        reddit_id (str): The id of the thread that is being made into a video
+
+    Returns:
+        bool: False if another worker reserved the thread first
+    """
+    if not jobs.reserve_thread(reddit_id):
+        return False
+    in_progress.add(reddit_id)
+    return True
+
+
 def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str, credit: str):
-    """Saves the videos that have already been generated to a JSON file in video_creation/data/videos.json
+    """Saves the videos that have already been generated to the history in video_creation/data/videos.db
 
     Args:
         filename (str): The finished video title name
@@ -43,18 +133,17 @@ def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str,
         @param reddit_id:
         @param reddit_title:
     """
-    with open("./video_creation/data/videos.json", "r+", encoding="utf-8") as raw_vids:
-        done_vids = json.load(raw_vids)
-        if reddit_id in [video["id"] for video in done_vids]:
-            return  # video already done but was specified to continue anyway in the config file
-        payload = {
-            "subreddit": subreddit,
-            "id": reddit_id,
-            "time": str(int(time.time())),
-            "background_credit": credit,
-            "reddit_title": reddit_title,
-            "filename": filename,
-        }
-        done_vids.append(payload)
-        raw_vids.seek(0)
-        json.dump(done_vids, raw_vids, ensure_ascii=False, indent=4)
+    in_progress.discard(reddit_id)
+    payload = {
+        "subreddit": subreddit,
+        "id": reddit_id,
+        "time": str(int(time.time())),
+        "background_credit": credit,
+        "reddit_title": reddit_title,
+        "filename": filename,
+    }
+    # a video that was already done but was specified to continue anyway in the config file is kept
+    open_db().execute(
+        "INSERT OR IGNORE INTO videos VALUES (:id, :subreddit, :time, :background_credit, :reddit_title, :filename)",
+        payload,
+    )
@@ -4,7 +4,6 @@ import time as pytime
 from datetime import datetime
 from time import sleep
 
-from cleantext import clean
 from requests import Response
 
 from utils import settings
@@ -90,6 +89,8 @@ def sanitize_text(text: str) -> str:
 
     # emoji removal if the setting is enabled
     if settings.config["settings"]["tts"]["no_emojis"]:
+        from cleantext import clean
+
         result = clean(result, no_emoji=True)
 
     # remove extra whitespace
@@ -5,12 +5,9 @@ from pathlib import Path
 from random import randrange
 from typing import Any, Dict, Tuple
 
-import yt_dlp
-from moviepy.editor import AudioFileClip, VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
-
 from utils import settings
 from utils.console import print_step, print_substep
+from utils.tracing import span
 
 
 def load_background_options():
@@ -57,8 +54,8 @@ def get_start_and_end_times(video_length: int, length_of_clip: int) -> Tuple[int
     return random_time, random_time + video_length
 
 
-def get_background_config(mode: str):
-    """Fetch the background/s configuration"""
+def get_background_choice(mode: str) -> str:
+    """Fetch the name of the background/s to use"""
     try:
         choice = str(settings.config["settings"]["background"][f"background_{mode}"]).casefold()
     except AttributeError:
@@ -70,7 +67,12 @@ def get_background_config(mode: str):
     if not choice or choice not in background_options[mode]:
         choice = random.choice(list(background_options[mode].keys()))
 
-    return background_options[mode][choice]
+    return choice
+
+
+def get_background_config(mode: str, choice: str = None):
+    """Fetch the background/s configuration"""
+    return background_options[mode][choice or get_background_choice(mode)]
 
 
 def download_background_video(background_config: Tuple[str, str, str, Any]):
@@ -85,6 +87,8 @@ def download_background_video(background_config: Tuple[str, str, str, Any]):
     )
     print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
     print_substep(f"Downloading {filename} from {uri}")
+    import yt_dlp
+
     ydl_opts = {
         "format": "bestvideo[height<=1080][ext=mp4]",
         "outtmpl": f"assets/backgrounds/video/{credit}-{filename}",
@@ -108,6 +112,8 @@ def download_background_audio(background_config: Tuple[str, str, str]):
     )
     print_substep("Downloading the backgrounds audio... please be patient 🙏 ")
     print_substep(f"Downloading {filename} from {uri}")
+    import yt_dlp
+
     ydl_opts = {
         "outtmpl": f"./assets/backgrounds/audio/{credit}-{filename}",
         "format": "bestaudio/best",
@@ -127,6 +133,9 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
         background_config (Dict[str,Tuple]]) : Current background configuration
         video_length (int): Length of the clip where the background footage is to be taken out of
     """
+    from moviepy.editor import AudioFileClip, VideoFileClip
+    from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
+
     id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
 
     if settings.config["settings"]["background"][f"background_audio_volume"] == 0:
@@ -134,32 +143,37 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
     else:
         print_step("Finding a spot in the backgrounds audio to chop...✂️")
         audio_choice = f"{background_config['audio'][2]}-{background_config['audio'][1]}"
-        background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
+        with span("AudioFileClip", "subprocess", file=audio_choice):
+            background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
         start_time_audio, end_time_audio = get_start_and_end_times(
             video_length, background_audio.duration
         )
         background_audio = background_audio.subclip(start_time_audio, end_time_audio)
-        background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
+        with span("write background.mp3", "subprocess"):
+            background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     video_choice = f"{background_config['video'][2]}-{background_config['video'][1]}"
-    background_video = VideoFileClip(f"assets/backgrounds/video/{video_choice}")
+    with span("VideoFileClip", "subprocess", file=video_choice):
+        background_video = VideoFileClip(f"assets/backgrounds/video/{video_choice}")
     start_time_video, end_time_video = get_start_and_end_times(
         video_length, background_video.duration
     )
     # Extract video subclip
     try:
-        ffmpeg_extract_subclip(
-            f"assets/backgrounds/video/{video_choice}",
-            start_time_video,
-            end_time_video,
-            targetname=f"assets/temp/{id}/background.mp4",
-        )
+        with span("ffmpeg_extract_subclip", "subprocess"):
+            ffmpeg_extract_subclip(
+                f"assets/backgrounds/video/{video_choice}",
+                start_time_video,
+                end_time_video,
+                targetname=f"assets/temp/{id}/background.mp4",
+            )
     except (OSError, IOError):  # ffmpeg issue see #348
         print_substep("FFMPEG issue. Trying again...")
-        with VideoFileClip(f"assets/backgrounds/video/{video_choice}") as video:
-            new = video.subclip(start_time_video, end_time_video)
-            new.write_videofile(f"assets/temp/{id}/background.mp4")
+        with span("write background.mp4", "subprocess"):
+            with VideoFileClip(f"assets/backgrounds/video/{video_choice}") as video:
+                new = video.subclip(start_time_video, end_time_video)
+                new.write_videofile(f"assets/temp/{id}/background.mp4")
     print_substep("Background video chopped successfully!", style="bold green")
     return background_config["video"][2]
 
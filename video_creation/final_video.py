@@ -10,16 +10,17 @@ from pathlib import Path
 from typing import Dict, Final, Tuple
 
 import ffmpeg
-import translators
 from PIL import Image, ImageDraw, ImageFont
 from rich.console import Console
 from rich.progress import track
 
 from utils import settings
+from utils.audio_metadata import get_duration
 from utils.cleanup import cleanup
 from utils.console import print_step, print_substep
 from utils.fonts import getheight
 from utils.thumbnail import create_thumbnail
+from utils.tracing import span, traced
 from utils.videos import save_data
 
 console = Console()
@@ -77,12 +78,15 @@ def name_normalize(name: str) -> str:
     lang = settings.config["reddit"]["thread"]["post_lang"]
     if lang:
         print_substep("Translating filename...")
+        import translators
+
         translated_name = translators.translate_text(name, translator="google", to_language=lang)
         return translated_name
     else:
         return name
 
 
+@traced(category="step")
 def prepare_background(reddit_id: str, W: int, H: int) -> str:
     output_path = f"assets/temp/{reddit_id}/background_noaudio.mp4"
     output = (
@@ -101,13 +105,27 @@ def prepare_background(reddit_id: str, W: int, H: int) -> str:
         .overwrite_output()
     )
     try:
-        output.run(quiet=True)
+        with span("ffmpeg crop background", "subprocess"):
+            output.run(quiet=True)
     except ffmpeg.Error as e:
         print(e.stderr.decode("utf8"))
         exit(1)
     return output_path
 
 
+def probe_duration(path: str) -> float:
+    """Returns the duration of a media file in seconds.
+
+    MP3 and WAV files are read from their headers, anything else is probed with ffprobe.
+    """
+    try:
+        return get_duration(path)
+    except ValueError:
+        pass
+    with span("ffprobe", "subprocess", file=path):
+        return float(ffmpeg.probe(path)["format"]["duration"])
+
+
 def create_fancy_thumbnail(image, text, text_color, padding, wrap=35):
     print_step(f"Creating fancy thumbnail for: {text}")
     font_title_size = 47
@@ -240,17 +258,17 @@ def make_final_video(
         audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
 
         audio_clips_durations = [
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/{i}.mp3")["format"]["duration"])
-            for i in range(number_of_clips)
+            probe_duration(f"assets/temp/{reddit_id}/mp3/{i}.mp3") for i in range(number_of_clips)
         ]
         audio_clips_durations.insert(
             0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
+            probe_duration(f"assets/temp/{reddit_id}/mp3/title.mp3"),
         )
     audio_concat = ffmpeg.concat(*audio_clips, a=1, v=0)
-    ffmpeg.output(
-        audio_concat, f"assets/temp/{reddit_id}/audio.mp3", **{"b:a": "192k"}
-    ).overwrite_output().run(quiet=True)
+    with span("ffmpeg audio concat", "subprocess", clips=len(audio_clips)):
+        ffmpeg.output(
+            audio_concat, f"assets/temp/{reddit_id}/audio.mp3", **{"b:a": "192k"}
+        ).overwrite_output().run(quiet=True)
 
     console.log(f"[bold green] Video Will Be: {length} Seconds Long")
 
@@ -287,14 +305,12 @@ def make_final_video(
     current_time = 0
     if settings.config["settings"]["storymode"]:
         audio_clips_durations = [
-            float(
-                ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")["format"]["duration"]
-            )
+            probe_duration(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")
             for i in range(number_of_clips)
         ]
         audio_clips_durations.insert(
             0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
+            probe_duration(f"assets/temp/{reddit_id}/mp3/title.mp3"),
         )
         if settings.config["settings"]["storymodemethod"] == 0:
             image_clips.insert(
@@ -421,39 +437,10 @@ def make_final_video(
             path[:251] + ".mp4"
         )  # Prevent a error by limiting the path length, do not change this.
         try:
-            ffmpeg.output(
-                background_clip,
-                final_audio,
-                path,
-                f="mp4",
-                **{
-                    "c:v": "h264",
-                    "b:v": "20M",
-                    "b:a": "192k",
-                    "threads": multiprocessing.cpu_count(),
-                },
-            ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                quiet=True,
-                overwrite_output=True,
-                capture_stdout=False,
-                capture_stderr=False,
-            )
-        except ffmpeg.Error as e:
-            print(e.stderr.decode("utf8"))
-            exit(1)
-    old_percentage = pbar.n
-    pbar.update(100 - old_percentage)
-    if allowOnlyTTSFolder:
-        path = defaultPath + f"/OnlyTTS/{filename}"
-        path = (
-            path[:251] + ".mp4"
-        )  # Prevent a error by limiting the path length, do not change this.
-        print_step("Rendering the Only TTS Video 🎥")
-        with ProgressFfmpeg(length, on_update_example) as progress:
-            try:
+            with span("ffmpeg render", "subprocess", file=path):
                 ffmpeg.output(
                     background_clip,
-                    audio,
+                    final_audio,
                     path,
                     f="mp4",
                     **{
@@ -468,6 +455,37 @@ def make_final_video(
                     capture_stdout=False,
                     capture_stderr=False,
                 )
+        except ffmpeg.Error as e:
+            print(e.stderr.decode("utf8"))
+            exit(1)
+    old_percentage = pbar.n
+    pbar.update(100 - old_percentage)
+    if allowOnlyTTSFolder:
+        path = defaultPath + f"/OnlyTTS/{filename}"
+        path = (
+            path[:251] + ".mp4"
+        )  # Prevent a error by limiting the path length, do not change this.
+        print_step("Rendering the Only TTS Video 🎥")
+        with ProgressFfmpeg(length, on_update_example) as progress:
+            try:
+                with span("ffmpeg render only TTS", "subprocess", file=path):
+                    ffmpeg.output(
+                        background_clip,
+                        audio,
+                        path,
+                        f="mp4",
+                        **{
+                            "c:v": "h264",
+                            "b:v": "20M",
+                            "b:a": "192k",
+                            "threads": multiprocessing.cpu_count(),
+                        },
+                    ).overwrite_output().global_args("-progress", progress.output_file.name).run(
+                        quiet=True,
+                        overwrite_output=True,
+                        capture_stdout=False,
+                        capture_stderr=False,
+                    )
             except ffmpeg.Error as e:
                 print(e.stderr.decode("utf8"))
                 exit(1)
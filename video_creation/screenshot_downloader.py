@@ -1,20 +1,241 @@
 import json
+import os
 import re
+import time
+from collections import deque
 from pathlib import Path
-from typing import Dict, Final
-
-import translators
-from playwright.sync_api import ViewportSize, sync_playwright
-from rich.progress import track
+from typing import Dict, Final, List, Tuple
 
 from utils import settings
-from utils.console import print_step, print_substep
-from utils.imagenarator import imagemaker
-from utils.playwright import clear_cookie_by_name
+from utils.browser_pool import pooled_browser
+from utils.console import print_step, print_substep, track
+from utils.imagenarator import comment_card, imagemaker
+from utils.playwright import (
+    clear_cookie_by_name,
+    forget_session,
+    is_logged_in,
+    load_session,
+    save_session,
+)
+from utils.tracing import span
 from utils.videos import save_data
 
 __all__ = ["get_screenshots_of_reddit_posts"]
 
+# seconds Reddit gets to accept the credentials
+LOGIN_TIMEOUT: Final[int] = 15
+# milliseconds a page gets to start loading
+PAGE_TIMEOUT: Final[int] = 30_000
+# milliseconds the elements that are screenshot get to show up once it does
+READY_TIMEOUT: Final[int] = 15_000
+# milliseconds the images of the post get to finish loading, the screenshot is taken anyway after
+NETWORK_IDLE_TIMEOUT: Final[int] = 5_000
+# milliseconds a comment gets to load on its own page
+COMMENT_TIMEOUT: Final[int] = 30_000
+# the post, or the gate in front of an NSFW one
+THREAD_READY: Final[str] = '[data-test-id="post-content"], [data-testid="content-gate"]'
+# shown to logged out visitors only
+LOGIN_LINK: Final[str] = 'header a[href*="/login"]'
+
+
+def wait_until_ready(page, selector: str, name: str, timeout: int = READY_TIMEOUT) -> bool:
+    """Waits for the first element matching the selector to be visible, recording how long it took.
+
+    Args:
+        page: The page to wait on
+        selector (str): The element the next step needs
+        name (str): What is waited for, in the trace
+        timeout (int): Milliseconds to wait at most
+
+    Returns:
+        bool: Whether it showed up in time
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    with span(f"wait for {name}", "browser", selector=selector):
+        try:
+            page.locator(selector).first.wait_for(state="visible", timeout=timeout)
+            return True
+        except PlaywrightTimeoutError:
+            return False
+
+
+def wait_for_network_idle(page) -> None:
+    """Waits up to NETWORK_IDLE_TIMEOUT ms for the page, e.g. the images of the post, to finish loading."""
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    with span("wait for network idle", "browser"):
+        try:
+            page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_TIMEOUT)
+        except PlaywrightTimeoutError:
+            pass  # ads and trackers can keep the page busy
+
+
+def log_in(page) -> None:
+    """Logs in to Reddit with the credentials in the config, exits when they are wrong."""
+    from playwright.sync_api import ViewportSize
+
+    print_substep("Logging in to Reddit...")
+    with span("goto", "browser", url="https://www.reddit.com/login"):
+        page.goto(
+            "https://www.reddit.com/login", wait_until="domcontentloaded", timeout=PAGE_TIMEOUT
+        )
+    page.set_viewport_size(ViewportSize(width=1920, height=1080))
+    wait_until_ready(page, 'input[name="username"]', "login form")
+
+    page.locator(f'input[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
+    page.locator(f'input[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
+    page.get_by_role("button", name="Log In").click()
+
+    # done as soon as Reddit sets the session cookie or shows an error
+    login_error_div = page.locator(".AnimatedForm__errorMessage").first
+    deadline = time.monotonic() + LOGIN_TIMEOUT
+    with span("wait for login", "browser"):
+        while not is_logged_in(page.context) and time.monotonic() < deadline:
+            if login_error_div.is_visible() and login_error_div.inner_text().strip():
+                break
+            page.wait_for_timeout(100)
+
+    if login_error_div.is_visible():
+        login_error_message = login_error_div.inner_text()
+        if login_error_message.strip() == "":
+            # The div element is empty, no error
+            pass
+        else:
+            # The div contains an error message
+            print_substep(
+                "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
+                style="red",
+            )
+            exit()
+    else:
+        pass
+
+
+def screenshot_comment(page, comment: dict, path: str) -> None:
+    """Screenshots a comment of the loaded page, translated and zoomed as set in the config."""
+    # translate code
+
+    if settings.config["reddit"]["thread"]["post_lang"]:
+        import translators
+
+        comment_tl = translators.translate_text(
+            comment["comment_body"],
+            translator="google",
+            to_language=settings.config["reddit"]["thread"]["post_lang"],
+        )
+        page.evaluate(
+            '([tl_content, tl_id]) => document.querySelector(`#t1_${tl_id} > div:nth-child(2) > div > div[data-testid="comment"] > div`).textContent = tl_content',
+            [comment_tl, comment["comment_id"]],
+        )
+    if settings.config["settings"]["zoom"] != 1:
+        # store zoom settings
+        zoom = settings.config["settings"]["zoom"]
+        # zoom the body of the page
+        page.evaluate("document.body.style.zoom=" + str(zoom))
+        # scroll comment into view
+        page.locator(f"#t1_{comment['comment_id']}").scroll_into_view_if_needed()
+        # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
+        location = page.locator(f"#t1_{comment['comment_id']}").bounding_box()
+        for i in location:
+            location[i] = float("{:.2f}".format(location[i] * zoom))
+        with span("screenshot", "browser", file=os.path.basename(path)):
+            page.screenshot(clip=location, path=path)
+    else:
+        with span("screenshot", "browser", file=os.path.basename(path)):
+            page.locator(f"#t1_{comment['comment_id']}").screenshot(path=path)
+
+
+def screenshot_comments_on_page(page, comments: List[Tuple[int, dict]], reddit_id: str) -> list:
+    """Screenshots the comments that are on the loaded thread page, without leaving it.
+
+    Args:
+        page: The page the thread is loaded in
+        comments (List[Tuple[int, dict]]): (index, comment) of every comment to screenshot
+        reddit_id (str): Id of the thread, for the path of the screenshots
+
+    Returns:
+        list: (index, comment) of the comments that aren't on the page or couldn't be captured
+    """
+    from playwright.sync_api import Error
+
+    if page.locator('[data-testid="content-gate"]').is_visible():
+        page.locator('[data-testid="content-gate"] button').click()
+
+    if comments:  # rendered after the post, the first one being there means the others are
+        wait_until_ready(page, f"#t1_{comments[0][1]['comment_id']}", "comments")
+
+    missing = []
+    for idx, comment in track(comments, "Downloading screenshots..."):
+        # not on the page, or collapsed
+        if not page.locator(f"#t1_{comment['comment_id']}").is_visible():
+            missing.append((idx, comment))
+            continue
+        try:
+            screenshot_comment(page, comment, f"assets/temp/{reddit_id}/png/comment_{idx}.png")
+        except Error:
+            missing.append((idx, comment))
+    return missing
+
+
+def screenshot_comments_by_permalink(
+    context, comments: List[Tuple[int, dict]], reddit_id: str, pages: int
+) -> list:
+    """Loads every comment on its own page and screenshots it, with up to `pages` loading at once.
+
+    The next comments start loading while the current one is captured, so the page loads, which
+    mostly wait for Reddit, overlap.
+
+    Args:
+        context: The logged in browser context
+        comments (List[Tuple[int, dict]]): (index, comment) of every comment to screenshot
+        reddit_id (str): Id of the thread, for the path of the screenshots
+        pages (int): How many comments load at the same time
+
+    Returns:
+        list: (index, comment) of the comments that couldn't be captured
+    """
+    from playwright.sync_api import Error
+
+    if not comments:
+        return []
+    free = [context.new_page() for _ in range(min(pages, len(comments)))]
+    waiting = deque(comments)
+    loading = deque()
+    failed = []
+    for _ in track(range(len(comments)), "Downloading screenshots..."):
+        while waiting and free:  # start loading as many comments as there are free pages
+            page = free.pop()
+            idx, comment = waiting.popleft()
+            try:
+                with span("goto", "browser", url=comment["comment_url"]):
+                    page.goto(
+                        f"https://new.reddit.com/{comment['comment_url']}",
+                        wait_until="commit",
+                        timeout=COMMENT_TIMEOUT,
+                    )
+                loading.append((page, idx, comment))
+            except Error as e:
+                print_substep(f"Loading comment {idx} failed: {str(e).splitlines()[0]}")
+                failed.append((idx, comment))
+                free.append(page)
+        if not loading:
+            continue
+        page, idx, comment = loading.popleft()
+        try:
+            with span("wait for comment", "browser", comment=idx):
+                page.locator(f"#t1_{comment['comment_id']}").wait_for(timeout=COMMENT_TIMEOUT)
+            if page.locator('[data-testid="content-gate"]').is_visible():
+                page.locator('[data-testid="content-gate"] button').click()
+            screenshot_comment(page, comment, f"assets/temp/{reddit_id}/png/comment_{idx}.png")
+        except Error as e:
+            print_substep(f"Taking the screenshot of comment {idx} failed: {str(e).splitlines()[0]}")
+            failed.append((idx, comment))
+        free.append(page)
+    for page in free:
+        page.close()
+    return sorted(failed, key=lambda failure: failure[0])
+
 
 def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
     """Downloads screenshots of reddit posts as seen on the web. Downloads to assets/temp/png
@@ -62,26 +283,30 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
     if storymode and settings.config["settings"]["storymodemethod"] == 1:
         # for idx,item in enumerate(reddit_object["thread_post"]):
         print_substep("Generating images...")
-        return imagemaker(
-            theme=bgcolor,
-            reddit_obj=reddit_object,
-            txtclr=txtcolor,
-            transparent=transparent,
-        )
+        with span("imagemaker", "step"):
+            return imagemaker(
+                theme=bgcolor,
+                reddit_obj=reddit_object,
+                txtclr=txtcolor,
+                transparent=transparent,
+            )
 
-    screenshot_num: int
-    with sync_playwright() as p:
-        print_substep("Launching Headless Browser...")
+    from playwright.sync_api import ViewportSize, sync_playwright
 
-        browser = p.chromium.launch(
-            headless=True
-        )  # headless=False will show the browser for debugging purposes
+    screenshot_num: int
+    print_substep("Launching Headless Browser...")
+    # a warm browser of the pool when it's enabled, otherwise a new one
+    with sync_playwright() as p, pooled_browser(p) as browser:
         # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
         # When the dsf is 1, the width of the screenshot is 600 pixels
         # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
         dsf = (W // 600) + 1
 
+        # the login of an earlier run is reused until it expires
+        username = settings.config["reddit"]["creds"]["username"]
+        session = load_session(username)
         context = browser.new_context(
+            storage_state=session,
             locale=lang or "en-us",
             color_scheme="dark",
             viewport=ViewportSize(width=W, height=H),
@@ -93,47 +318,45 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
 
         context.add_cookies(cookies)  # load preference cookies
 
-        # Login to Reddit
-        print_substep("Logging in to Reddit...")
         page = context.new_page()
-        page.goto("https://www.reddit.com/login", timeout=0)
-        page.set_viewport_size(ViewportSize(width=1920, height=1080))
-        page.wait_for_load_state()
-
-        page.locator(f'input[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
-        page.locator(f'input[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
-        page.get_by_role("button", name="Log In").click()
-        page.wait_for_timeout(5000)
-
-        login_error_div = page.locator(".AnimatedForm__errorMessage").first
-        if login_error_div.is_visible():
-            login_error_message = login_error_div.inner_text()
-            if login_error_message.strip() == "":
-                # The div element is empty, no error
-                pass
-            else:
-                # The div contains an error message
-                print_substep(
-                    "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
-                    style="red",
-                )
-                exit()
+        if session is None:
+            log_in(page)
+            save_session(context, username)
         else:
-            pass
+            print_substep("Reusing the saved Reddit login...")
+
+        # Get the thread screenshot
+        with span("goto", "browser", url=reddit_object["thread_url"]):
+            page.goto(
+                reddit_object["thread_url"], wait_until="domcontentloaded", timeout=PAGE_TIMEOUT
+            )
+        page.set_viewport_size(ViewportSize(width=W, height=H))
+        wait_until_ready(page, THREAD_READY, "thread")
+
+        if session is not None and (
+            not is_logged_in(context) or page.locator(LOGIN_LINK).first.is_visible()
+        ):  # the saved login expired or was revoked
+            forget_session(username)
+            log_in(page)
+            save_session(context, username)
+            with span("goto", "browser", url=reddit_object["thread_url"]):
+                page.goto(
+                    reddit_object["thread_url"],
+                    wait_until="domcontentloaded",
+                    timeout=PAGE_TIMEOUT,
+                )
+            page.set_viewport_size(ViewportSize(width=W, height=H))
+            wait_until_ready(page, THREAD_READY, "thread")
 
-        page.wait_for_load_state()
         # Handle the redesign
         # Check if the redesign optout cookie is set
         if page.locator("#redesign-beta-optin-btn").is_visible():
             # Clear the redesign optout cookie
             clear_cookie_by_name(context, "redesign_optout")
             # Reload the page for the redesign to take effect
-            page.reload()
-        # Get the thread screenshot
-        page.goto(reddit_object["thread_url"], timeout=0)
-        page.set_viewport_size(ViewportSize(width=W, height=H))
-        page.wait_for_load_state()
-        page.wait_for_timeout(5000)
+            with span("reload", "browser"):
+                page.reload(wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+            wait_until_ready(page, THREAD_READY, "thread")
 
         if page.locator(
             "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
@@ -144,7 +367,7 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
             page.locator(
                 "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
             ).click()
-            page.wait_for_load_state()  # Wait for page to fully load
+            wait_until_ready(page, '[data-test-id="post-content"]', "post")
 
             # translate code
         if page.locator(
@@ -156,6 +379,8 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
 
         if lang:
             print_substep("Translating post...")
+            import translators
+
             texts_in_tl = translators.translate_text(
                 reddit_object["thread_title"],
                 to_language=lang,
@@ -170,6 +395,7 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
             print_substep("Skipping translation...")
 
         postcontentpath = f"assets/temp/{reddit_id}/png/title.png"
+        wait_for_network_idle(page)
         try:
             if settings.config["settings"]["zoom"] != 1:
                 # store zoom settings
@@ -180,9 +406,11 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
                 location = page.locator('[data-test-id="post-content"]').bounding_box()
                 for i in location:
                     location[i] = float("{:.2f}".format(location[i] * zoom))
-                page.screenshot(clip=location, path=postcontentpath)
+                with span("screenshot", "browser", file="title.png"):
+                    page.screenshot(clip=location, path=postcontentpath)
             else:
-                page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
+                with span("screenshot", "browser", file="title.png"):
+                    page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
         except Exception as e:
             print_substep("Something went wrong!", style="red")
             resp = input(
@@ -203,64 +431,39 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
             raise e
 
         if storymode:
-            page.locator('[data-click-id="text"]').first.screenshot(
-                path=f"assets/temp/{reddit_id}/png/story_content.png"
-            )
+            with span("screenshot", "browser", file="story_content.png"):
+                page.locator('[data-click-id="text"]').first.screenshot(
+                    path=f"assets/temp/{reddit_id}/png/story_content.png"
+                )
         else:
-            for idx, comment in enumerate(
-                track(
-                    reddit_object["comments"][:screenshot_num],
-                    "Downloading screenshots...",
+            comments = list(enumerate(reddit_object["comments"][:screenshot_num]))
+            if settings.config["settings"].get("screenshot_from_thread", True):
+                # the comments are already on the thread page, only the missing ones are loaded
+                comments = screenshot_comments_on_page(page, comments, reddit_id)
+                if comments:
+                    print_substep(
+                        f"Loading {len(comments)} comments that aren't on the thread page..."
+                    )
+            failed = screenshot_comments_by_permalink(
+                context,
+                comments,
+                reddit_id,
+                settings.config["settings"].get("screenshot_pages", 4),
+            )
+            for idx, comment in failed:
+                # the video still gets an image for every comment that is read out
+                print_substep(
+                    f"Couldn't take a screenshot of comment {idx}, using its text instead."
+                )
+                comment_card(
+                    comment["comment_body"],
+                    f"assets/temp/{reddit_id}/png/comment_{idx}.png",
+                    bgcolor,
+                    txtcolor,
                 )
-            ):
-                # Stop if we have reached the screenshot_num
-                if idx >= screenshot_num:
-                    break
-
-                if page.locator('[data-testid="content-gate"]').is_visible():
-                    page.locator('[data-testid="content-gate"] button').click()
-
-                page.goto(f"https://new.reddit.com/{comment['comment_url']}")
-
-                # translate code
 
-                if settings.config["reddit"]["thread"]["post_lang"]:
-                    comment_tl = translators.translate_text(
-                        comment["comment_body"],
-                        translator="google",
-                        to_language=settings.config["reddit"]["thread"]["post_lang"],
-                    )
-                    page.evaluate(
-                        '([tl_content, tl_id]) => document.querySelector(`#t1_${tl_id} > div:nth-child(2) > div > div[data-testid="comment"] > div`).textContent = tl_content',
-                        [comment_tl, comment["comment_id"]],
-                    )
-                try:
-                    if settings.config["settings"]["zoom"] != 1:
-                        # store zoom settings
-                        zoom = settings.config["settings"]["zoom"]
-                        # zoom the body of the page
-                        page.evaluate("document.body.style.zoom=" + str(zoom))
-                        # scroll comment into view
-                        page.locator(f"#t1_{comment['comment_id']}").scroll_into_view_if_needed()
-                        # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
-                        location = page.locator(f"#t1_{comment['comment_id']}").bounding_box()
-                        for i in location:
-                            location[i] = float("{:.2f}".format(location[i] * zoom))
-                        page.screenshot(
-                            clip=location,
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png",
-                        )
-                    else:
-                        page.locator(f"#t1_{comment['comment_id']}").screenshot(
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png"
-                        )
-                except TimeoutError:
-                    del reddit_object["comments"]
-                    screenshot_num += 1
-                    print("TimeoutError: Skipping screenshot...")
-                    continue
-
-        # close browser instance when we are done using it
-        browser.close()
+        if is_logged_in(context):  # Reddit refreshes the session cookie now and then
+            save_session(context, username)
+        # the browser is closed, or given back to the pool, when the with block ends
 
     print_substep("Screenshots downloaded Successfully.", style="bold green")
@@ -1,16 +1,19 @@
-from typing import Tuple
+import copy
+from typing import List, Tuple
 
 from rich.console import Console
 
 from TTS.aws_polly import AWSPolly
 from TTS.elevenlabs import elevenlabs
-from TTS.engine_wrapper import TTSEngine
+from TTS.engine_wrapper import DEFAULT_MAX_LENGTH, TTSEngine, punctuate
 from TTS.GTTS import GTTS
+from TTS.planner import chars_per_second, plan_comments
 from TTS.pyttsx import pyttsx
 from TTS.streamlabs_polly import StreamlabsPolly
 from TTS.TikTok import TikTok
 from utils import settings
-from utils.console import print_step, print_table
+from utils.console import print_step, print_substep, print_table
+from utils.voice import sanitize_text
 
 console = Console()
 
@@ -24,29 +27,87 @@ TTSProviders = {
 }
 
 
-def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
+def save_text_to_mp3(reddit_obj, max_length: float = DEFAULT_MAX_LENGTH) -> Tuple[int, int]:
     """Saves text to MP3 files.
 
     Args:
         reddit_obj (): Reddit object received from reddit API in reddit/subreddit.py
+        max_length (float): Seconds after which no more comments are synthesized
 
     Returns:
         tuple[int,int]: (total length of the audio, the number of comments audio was generated for)
     """
+    # the TTS rewrites the comments it reads, while the screenshots are taken of the same comments
+    reddit_obj = dict(reddit_obj, comments=copy.deepcopy(reddit_obj["comments"]))
+    text_to_mp3 = TTSEngine(
+        get_tts_provider(), reddit_obj, max_length=max_length, fallbacks=get_fallback_providers()
+    )
+    return text_to_mp3.run()
+
+
+def plan_video(reddit_obj: dict) -> Tuple[dict, int]:
+    """Picks the comments that fill the video the best, before any text is synthesized.
+
+    The length of every comment is estimated from the speaking rate of the TTS provider,
+    learned from the earlier videos.
+
+    Args:
+        reddit_obj (dict): Reddit object received from reddit API in reddit/subreddit.py
+
+    Returns:
+        tuple[dict,int]: (the reddit object with only the picked comments, the number of picked comments)
+    """
+    provider = get_tts_provider()
+    rate = chars_per_second(provider.__name__)
+    max_chars = provider().max_chars
+    silence = float(settings.config["settings"]["tts"]["silence_duration"])
+
+    def estimate(text: str) -> float:
+        return len(sanitize_text(text)) / rate
+
+    def estimate_comment(text: str) -> float:
+        # read the way TTSEngine reads it, split comments are followed by a silence
+        text = punctuate(text)
+        return estimate(text) + (silence if len(text) > max_chars else 0)
+
+    budget = DEFAULT_MAX_LENGTH - estimate(reddit_obj["thread_title"])
+    picked = plan_comments(reddit_obj["comments"], budget, estimate_comment)
+    comments = [reddit_obj["comments"][idx] for idx in picked]
+    print_substep(
+        f"Picked {len(comments)} comments, about "
+        f"{sum(estimate_comment(comment['comment_body']) for comment in comments):.0f} seconds of speech."
+    )
+    return dict(reddit_obj, comments=comments), len(comments)
 
+
+def get_tts_provider():
+    """Returns the TTS provider class chosen in the config, asks for one if the choice isn't valid."""
     voice = settings.config["settings"]["tts"]["voice_choice"]
     if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, voice), reddit_obj)
-    else:
-        while True:
-            print_step("Please choose one of the following TTS providers: ")
-            print_table(TTSProviders)
-            choice = input("\n")
-            if choice.casefold() in map(lambda _: _.casefold(), TTSProviders):
-                break
-            print("Unknown Choice")
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, choice), reddit_obj)
-    return text_to_mp3.run()
+        return get_case_insensitive_key_value(TTSProviders, voice)
+    while True:
+        print_step("Please choose one of the following TTS providers: ")
+        print_table(TTSProviders)
+        choice = input("\n")
+        if choice.casefold() in map(lambda _: _.casefold(), TTSProviders):
+            break
+        print("Unknown Choice")
+    settings.config["settings"]["tts"]["voice_choice"] = choice  # so it's only asked once
+    return get_case_insensitive_key_value(TTSProviders, choice)
+
+
+def get_fallback_providers() -> List:
+    """Returns the TTS provider classes listed in fallback_choice, without the chosen one."""
+    fallbacks = []
+    for choice in str(settings.config["settings"]["tts"].get("fallback_choice") or "").split(","):
+        provider = get_case_insensitive_key_value(TTSProviders, choice.strip())
+        if provider is None:
+            if choice.strip():
+                print_substep(f"Unknown fallback TTS provider {choice.strip()}, skipping it.")
+            continue
+        if provider is not get_tts_provider() and provider not in fallbacks:
+            fallbacks.append(provider)
+    return fallbacks
 
 
 def get_case_insensitive_key_value(input_dict, key):